@@ -0,0 +1,375 @@
+"""Local stand-ins for the upstream services, so benchmarks run fully offline.
+
+* :class:`FakeSynthesizer` replaces DashScope's ``SpeechSynthesizer``.
+* :class:`FakePodcastServer` is a websocket server speaking the binary framing
+  of ``lib/podcast/protocols.py`` and emitting podcast rounds.
+* :class:`FakeTTSServer` does the same for Volcano's single-speaker TTS.
+* :class:`FakeRedis` is an in-memory stand-in for the redis-py commands used by
+  the server and ``lib/`` (task records, locks, heartbeats, the reaper's index,
+  the profile store), for running without a Redis instance.
+"""
+import asyncio
+import fnmatch
+import json
+import threading
+import time
+import uuid
+from typing import Optional
+
+import websockets
+from dashscope.common.error import InvalidTask
+
+from lib.podcast.protocols import EventType, Message, MsgType, MsgTypeFlagBits
+
+
+class FakeSynthesizer:
+    """Drop-in for ``SpeechSynthesizer`` with a configurable delay and output size."""
+
+    delay = 0.05
+    audio_size = 32 * 1024
+
+    def __init__(self, model, voice, **kwargs):
+        self.model = model
+        self.voice = voice
+        self._request_id = ""
+        self._first_package_delay = 0
+        self._cancelled = threading.Event()
+        self._started = False
+
+    def call(self, text, timeout_millis=None):
+        started = time.perf_counter()
+        self._started = True
+        try:
+            if timeout_millis is not None and timeout_millis < self.delay * 1000:
+                # Like dashscope: give up waiting after timeout_millis.
+                self._cancelled.wait(timeout_millis / 1000)
+                raise TimeoutError(f"TimeoutError: waiting for task complete timeout {timeout_millis}ms")
+            self._cancelled.wait(self.delay)
+        finally:
+            # dashscope tears the task down when call() returns or times out.
+            self._started = False
+        self._request_id = uuid.uuid4().hex
+        self._first_package_delay = int((time.perf_counter() - started) * 1000)
+        return b"\x00" * self.audio_size
+
+    def streaming_cancel(self):
+        if not self._started:
+            raise InvalidTask("speech synthesizer has not been started.")
+        self._cancelled.set()
+
+    def get_last_request_id(self):
+        return self._request_id
+
+    def get_first_package_delay(self):
+        return self._first_package_delay
+
+
+class FakePodcastServer:
+    """Podcast TTS websocket stand-in running on its own event loop thread.
+
+    Every script entry becomes one round: ``PodcastRoundStart``, ``chunks``
+    ``PodcastRoundResponse`` audio frames of ``chunk_size`` bytes spaced by
+    ``round_delay / chunks`` seconds, then ``PodcastRoundEnd``. Requested head
+    and tail music are emitted as extra rounds with ids -1 and 9999.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, round_delay: float = 0.05,
+                 chunks: int = 4, chunk_size: int = 8 * 1024):
+        self.host = host
+        self.port = port
+        self.round_delay = round_delay
+        self.chunks = chunks
+        self.chunk_size = chunk_size
+        self.sessions = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}"
+
+    def start(self) -> "FakePodcastServer":
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self) -> None:
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._server.close)
+            self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        self._loop.run_until_complete(self._serve())
+
+    async def _serve(self) -> None:
+        self._server = await websockets.serve(self._handle, self.host, self.port, max_size=None)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        await self._server.wait_closed()
+
+    @staticmethod
+    async def _send(websocket, msg_type: MsgType, event: EventType, payload: bytes = b"{}",
+                    session_id: str = "") -> None:
+        msg = Message(type=msg_type, flag=MsgTypeFlagBits.WithEvent, event=event,
+                      session_id=session_id, payload=payload)
+        await websocket.send(msg.marshal())
+
+    async def _handle(self, websocket) -> None:
+        params = {}
+        async for data in websocket:
+            msg = Message.from_bytes(data)
+            if msg.event == EventType.StartConnection:
+                await self._send(websocket, MsgType.FullServerResponse, EventType.ConnectionStarted)
+            elif msg.event == EventType.StartSession:
+                self.sessions += 1
+                params = json.loads(msg.payload)
+                await self._send(websocket, MsgType.FullServerResponse, EventType.SessionStarted,
+                                 session_id=msg.session_id)
+            elif msg.event == EventType.TaskRequest:
+                params.setdefault("tasks", []).append(json.loads(msg.payload))
+            elif msg.event == EventType.FinishSession:
+                await self._emit_rounds(websocket, msg.session_id, params)
+                await self._send(websocket, MsgType.FullServerResponse, EventType.SessionFinished,
+                                 session_id=msg.session_id)
+            elif msg.event == EventType.CancelSession:
+                await self._send(websocket, MsgType.FullServerResponse, EventType.SessionCanceled,
+                                 session_id=msg.session_id)
+            elif msg.event == EventType.FinishConnection:
+                await self._send(websocket, MsgType.FullServerResponse, EventType.ConnectionFinished)
+
+    async def _emit_rounds(self, websocket, session_id: str, params: dict) -> None:
+        pause = self.round_delay / max(self.chunks, 1)
+        rounds = list(enumerate(params.get("nlp_texts") or []))
+        if params.get("use_head_music"):
+            rounds.insert(0, (-1, {}))
+        if params.get("use_tail_music"):
+            rounds.append((9999, {}))
+        for round_id, script in rounds:
+            start = {"round_id": round_id, "speaker": script.get("speaker"), "text": script.get("text")}
+            await self._send(websocket, MsgType.FullServerResponse, EventType.PodcastRoundStart,
+                             json.dumps(start).encode("utf-8"), session_id)
+            for _ in range(self.chunks):
+                await asyncio.sleep(pause)
+                await self._send(websocket, MsgType.AudioOnlyServer, EventType.PodcastRoundResponse,
+                                 b"\x00" * self.chunk_size, session_id)
+            end = {"round_id": round_id, "is_error": False}
+            await self._send(websocket, MsgType.FullServerResponse, EventType.PodcastRoundEnd,
+                             json.dumps(end).encode("utf-8"), session_id)
+
+
+class FakeTTSServer(FakePodcastServer):
+    """Volcano bidirectional TTS stand-in: every TaskRequest becomes one sentence
+    of ``chunks`` ``TTSResponse`` audio frames."""
+
+    async def _emit_rounds(self, websocket, session_id: str, params: dict) -> None:
+        pause = self.round_delay / max(self.chunks, 1)
+        for task in params.get("tasks") or []:
+            sentence = json.dumps({"text": task["req_params"]["text"]}).encode("utf-8")
+            await self._send(websocket, MsgType.FullServerResponse, EventType.TTSSentenceStart, sentence, session_id)
+            for _ in range(self.chunks):
+                await asyncio.sleep(pause)
+                await self._send(websocket, MsgType.AudioOnlyServer, EventType.TTSResponse,
+                                 b"\x00" * self.chunk_size, session_id)
+            await self._send(websocket, MsgType.FullServerResponse, EventType.TTSSentenceEnd, sentence, session_id)
+
+
+class FakeRedis:
+    """Thread-safe in-memory subset of the redis-py client used by the server.
+
+    Expiry is tracked but only enforced lazily on read, which is enough for
+    benchmark runs lasting minutes.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._expires = {}
+        self._sorted = {}
+        self._lists = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _encode(value) -> bytes:
+        if isinstance(value, bytes):
+            return value
+        if isinstance(value, (bytearray, memoryview)):
+            return bytes(value)
+        return str(value).encode("utf-8")
+
+    def _alive(self, key) -> bool:
+        expires = self._expires.get(key)
+        if expires is not None and expires < time.time():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return key in self._data
+
+    def get(self, key):
+        with self._lock:
+            return self._data[key] if self._alive(key) else None
+
+    def mget(self, keys):
+        with self._lock:
+            return [self._data[key] if self._alive(key) else None for key in keys]
+
+    def set(self, key, value, nx=False, xx=False, ex=None):
+        with self._lock:
+            exists = self._alive(key)
+            if (nx and exists) or (xx and not exists):
+                return None
+            self._data[key] = self._encode(value)
+            if ex:
+                self._expires[key] = time.time() + ex
+            else:
+                self._expires.pop(key, None)
+            return True
+
+    def setex(self, key, ttl, value):
+        return self.set(key, value, ex=ttl)
+
+    def delete(self, *keys):
+        with self._lock:
+            removed = 0
+            for key in keys:
+                removed += self._alive(key) and self._data.pop(key, None) is not None
+                removed += self._sorted.pop(key, None) is not None
+                removed += self._lists.pop(key, None) is not None
+                self._expires.pop(key, None)
+            return removed
+
+    def exists(self, *keys):
+        with self._lock:
+            return sum(1 for key in keys if self._alive(key))
+
+    def expire(self, key, ttl):
+        with self._lock:
+            if not self._alive(key):
+                return False
+            self._expires[key] = time.time() + ttl
+            return True
+
+    def keys(self, pattern="*"):
+        with self._lock:
+            return [key.encode("utf-8") for key in list(self._data) if self._alive(key)
+                    and fnmatch.fnmatchcase(key, pattern)]
+
+    def strlen(self, key):
+        value = self.get(key)
+        return len(value) if value else 0
+
+    def getrange(self, key, start, end):
+        value = self.get(key) or b""
+        return value[start:end + 1]
+
+    def decr(self, key):
+        with self._lock:
+            value = int(self._data[key]) - 1 if self._alive(key) else -1
+            self._data[key] = self._encode(value)
+            return value
+
+    def lpush(self, key, *values):
+        with self._lock:
+            items = self._lists.setdefault(key, [])
+            items[:0] = [self._encode(value) for value in reversed(values)]
+            return len(items)
+
+    def ltrim(self, key, start, end):
+        with self._lock:
+            if key in self._lists:
+                self._lists[key] = self._lists[key][start:end + 1 if end != -1 else None]
+            return True
+
+    def lrange(self, key, start, end):
+        with self._lock:
+            return list(self._lists.get(key, [])[start:end + 1 if end != -1 else None])
+
+    def ping(self):
+        return True
+
+    def zadd(self, key, mapping):
+        with self._lock:
+            members = self._sorted.setdefault(key, {})
+            added = sum(1 for member in mapping if self._encode(member) not in members)
+            members.update({self._encode(member): float(score) for member, score in mapping.items()})
+            return added
+
+    def zrem(self, key, *members):
+        with self._lock:
+            scores = self._sorted.get(key, {})
+            return sum(scores.pop(self._encode(member), None) is not None for member in members)
+
+    def zrangebyscore(self, key, low, high, start=None, num=None):
+        low, high = float(low), float(high)
+        with self._lock:
+            ordered = sorted(self._sorted.get(key, {}).items(), key=lambda item: (item[1], item[0]))
+        members = [member for member, score in ordered if low <= score <= high]
+        if start is not None:
+            members = members[start:start + num if num is not None else None]
+        return members
+
+    def info(self, section=None):
+        return {"used_memory": sum(len(v) for v in self._data.values()), "maxmemory": 0}
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+    def register_script(self, script):
+        """Python stand-ins for the server's Lua scripts, looked up by their first line."""
+        scripts = {"-- compare-and-set": self._compare_and_set}
+        run = scripts.get(script.splitlines()[0])
+        if run is None:
+            raise NotImplementedError(f"FakeRedis cannot run script {script.splitlines()[0]!r}")
+        return lambda keys=(), args=(): run(*keys, *args)
+
+    def _compare_and_set(self, key, expected, value, ttl):
+        with self._lock:
+            if not self._alive(key) or self._data[key] != self._encode(expected):
+                return 0
+            self._data[key] = self._encode(value)
+            self._expires[key] = time.time() + int(ttl)
+            return 1
+
+
+class _FakePipeline:
+    def __init__(self, client: FakeRedis):
+        self._client = client
+        self._calls = []
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+
+        def queue(*args, **kwargs):
+            self._calls.append((method, args, kwargs))
+            return self
+
+        return queue
+
+    def execute(self):
+        calls, self._calls = self._calls, []
+        return [method(*args, **kwargs) for method, args, kwargs in calls]
+
+
+def main() -> None:
+    """Run the fake podcast websocket server standalone (for load testing a real gunicorn)."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--round-delay", type=float, default=0.05)
+    parser.add_argument("--chunks", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=8 * 1024)
+    args = parser.parse_args()
+
+    server = FakePodcastServer(args.host, args.port, args.round_delay, args.chunks, args.chunk_size).start()
+    print(f"fake podcast server listening on {server.url}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
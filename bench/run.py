@@ -0,0 +1,308 @@
+"""Offline load test for every HTTP endpoint.
+
+Starts the Flask app on a local port with the upstreams replaced by the
+stand-ins from ``bench.fake_upstreams`` and drives each endpoint at the given
+concurrency, reporting latency percentiles, throughput and the process' peak
+RSS / thread count.
+
+    python -m bench.run --requests 200 --concurrency 16
+    python -m bench.run --endpoints podcast --round-delay 0.2 --json
+"""
+import argparse
+import base64
+import io
+import json
+import logging
+import math
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from unittest.mock import patch
+
+import requests
+
+from bench.fake_upstreams import FakePodcastServer, FakeRedis, FakeSynthesizer
+
+ENDPOINTS = ("cosyvoice", "cosyvoice_async", "podcast", "stitch", "status")
+POLL_INTERVAL = 0.02
+
+
+class ResourceSampler:
+    """Tracks RSS and thread-count high-water marks of the current process."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak_rss_kb = 0
+        self.peak_threads = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def _rss_kb() -> int:
+        try:
+            with open("/proc/self/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1])
+        except OSError:
+            pass
+        # ru_maxrss is KiB on Linux and bytes on macOS; only used as a fallback.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+
+    def sample(self) -> None:
+        self.peak_rss_kb = max(self.peak_rss_kb, self._rss_kb())
+        self.peak_threads = max(self.peak_threads, threading.active_count())
+
+    def reset(self) -> None:
+        self.peak_rss_kb = 0
+        self.peak_threads = 0
+        self.sample()
+
+    def start(self) -> "ResourceSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    # Nearest-rank definition.
+    rank = math.ceil(pct / 100 * len(ordered))
+    return ordered[min(len(ordered), max(rank, 1)) - 1]
+
+
+def _png_b64(color: str, size: int) -> str:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (size, size), color).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+class Bench:
+    def __init__(self, base_url: str, args: argparse.Namespace):
+        self.base_url = base_url
+        self.args = args
+        self.task_ids: List[str] = []
+        self._local = threading.local()
+        self._images = [_png_b64("red", args.image_size), _png_b64("blue", args.image_size)]
+
+    @property
+    def session(self) -> requests.Session:
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _wait_for(self, path: str) -> None:
+        deadline = time.monotonic() + self.args.task_timeout
+        while time.monotonic() < deadline:
+            response = self.session.get(f"{self.base_url}{path}")
+            response.raise_for_status()
+            status = response.json().get("status")
+            if status not in ("processing", "queued", "running"):
+                if status != "success":
+                    raise RuntimeError(f"task ended with status {status}")
+                return
+            time.sleep(POLL_INTERVAL)
+        raise TimeoutError(f"{path} did not finish in {self.args.task_timeout}s")
+
+    def cosyvoice(self, i: int) -> None:
+        response = self.session.post(f"{self.base_url}/v1/voice/cosyvoice", json={"text": f"bench {i}"})
+        response.raise_for_status()
+
+    def cosyvoice_async(self, i: int) -> None:
+        response = self.session.post(f"{self.base_url}/v1/voice/cosyvoice/async",
+                                     json={"text": f"bench async {i} {uuid.uuid4().hex}"})
+        response.raise_for_status()
+        task_id = response.json()["task_id"]
+        self.task_ids.append(task_id)
+        self._wait_for(f"/v1/voice/cosyvoice/async/{task_id}")
+
+    def podcast(self, i: int) -> None:
+        scripts = [
+            {"speaker": "zh_male_dayixiansheng_v2_saturn_bigtts", "text": f"round {r} of {i} {uuid.uuid4().hex}"}
+            for r in range(self.args.rounds)
+        ]
+        response = self.session.post(f"{self.base_url}/v1/voice/podcast", json={"scripts": scripts})
+        response.raise_for_status()
+        task_id = response.json()["task_id"]
+        self.task_ids.append(task_id)
+        self._wait_for(f"/v1/voice/podcast/{task_id}")
+
+    def stitch(self, i: int) -> None:
+        response = self.session.post(f"{self.base_url}/v1/image/stitch",
+                                     json={"images": self._images, "direction": "horizontal"})
+        response.raise_for_status()
+
+    def status(self, i: int) -> None:
+        task_ids = self.task_ids[-self.args.status_batch:] or [str(uuid.uuid4())]
+        response = self.session.post(f"{self.base_url}/v1/tasks/status", json={"task_ids": task_ids})
+        response.raise_for_status()
+
+
+def run_endpoint(name: str, call: Callable[[int], None], requests_count: int, concurrency: int,
+                 sampler: ResourceSampler) -> Dict:
+    latencies: List[float] = []
+    errors: List[str] = []
+    lock = threading.Lock()
+
+    def one(i: int) -> None:
+        started = time.perf_counter()
+        try:
+            call(i)
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+            return
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+
+    sampler.reset()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests_count)))
+    wall = time.perf_counter() - started
+    sampler.sample()
+
+    return {
+        "endpoint": name,
+        "requests": requests_count,
+        "concurrency": concurrency,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "peak_rss_mb": round(sampler.peak_rss_kb / 1024, 1),
+        "peak_threads": sampler.peak_threads,
+    }
+
+
+def format_table(results: List[Dict]) -> str:
+    columns = ["endpoint", "requests", "concurrency", "errors", "rps", "p50_ms", "p95_ms", "p99_ms",
+               "peak_rss_mb", "peak_threads"]
+    rows = [columns] + [[str(result[c]) for c in columns] for result in results]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+    return "\n".join("  ".join(cell.rjust(width) for cell, width in zip(row, widths)) for row in rows)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS),
+                        help=f"comma separated subset of {', '.join(ENDPOINTS)}")
+    parser.add_argument("--requests", type=int, default=100, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--synth-delay", type=float, default=0.05, help="fake DashScope latency (s)")
+    parser.add_argument("--audio-size", type=int, default=32 * 1024, help="fake CosyVoice audio bytes")
+    parser.add_argument("--rounds", type=int, default=4, help="podcast rounds per request")
+    parser.add_argument("--round-delay", type=float, default=0.05, help="fake podcast seconds per round")
+    parser.add_argument("--round-chunks", type=int, default=4, help="audio frames per podcast round")
+    parser.add_argument("--chunk-size", type=int, default=8 * 1024, help="bytes per podcast audio frame")
+    parser.add_argument("--image-size", type=int, default=256, help="edge of the stitched test images (px)")
+    parser.add_argument("--status-batch", type=int, default=100, help="ids per bulk status request")
+    parser.add_argument("--task-timeout", type=float, default=120, help="max seconds to wait for a task")
+    parser.add_argument("--redis-url", help="use a real Redis instead of the in-memory stand-in")
+    parser.add_argument("--base-url", help="benchmark an already running server (e.g. gunicorn with bench.wsgi) "
+                                            "instead of starting one in-process")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+    args.endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+    return args
+
+
+def run_in_process(args: argparse.Namespace) -> List[Dict]:
+    FakeSynthesizer.delay = args.synth_delay
+    FakeSynthesizer.audio_size = args.audio_size
+    podcast_server = FakePodcastServer(round_delay=args.round_delay, chunks=args.round_chunks,
+                                       chunk_size=args.chunk_size).start()
+
+    storage_dir = tempfile.TemporaryDirectory(prefix="misc-api-bench-")
+    env = {
+        "DASHSCOPE_API_KEY": os.getenv("DASHSCOPE_API_KEY", "bench"),
+        "VOLC_APPID": "bench",
+        "VOLC_ACCESS_TOKEN": "bench",
+        "VOLC_PODCAST_ENDPOINT": podcast_server.url,
+        "RESULT_STORAGE": "filesystem",
+        "RESULT_STORAGE_DIR": storage_dir.name,
+    }
+    if args.redis_url:
+        env["REDIS_URL"] = args.redis_url
+
+    with patch.dict(os.environ, env):
+        import server
+
+        app = server.create_app()
+        if not args.redis_url:
+            server._clients["redis"] = FakeRedis()
+
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    sampler = ResourceSampler().start()
+    with patch("dashscope.audio.tts_v2.SpeechSynthesizer", FakeSynthesizer):
+        http_server = make_server("127.0.0.1", 0, app, threaded=True)
+        http_thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+        http_thread.start()
+        try:
+            return run_all(f"http://127.0.0.1:{http_server.server_port}", args, sampler)
+        finally:
+            http_server.shutdown()
+            sampler.stop()
+            podcast_server.stop()
+            storage_dir.cleanup()
+
+
+def run_all(base_url: str, args: argparse.Namespace, sampler: ResourceSampler) -> List[Dict]:
+    bench = Bench(base_url, args)
+    return [
+        run_endpoint(name, getattr(bench, name), args.requests, args.concurrency, sampler)
+        for name in args.endpoints
+    ]
+
+
+def main(argv: Optional[List[str]] = None) -> List[Dict]:
+    args = parse_args(argv)
+
+    if args.base_url:
+        # Resource numbers then describe the load generator, not the server.
+        sampler = ResourceSampler().start()
+        try:
+            results = run_all(args.base_url.rstrip("/"), args, sampler)
+        finally:
+            sampler.stop()
+    else:
+        results = run_in_process(args)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(format_table(results))
+        for result in results:
+            if result["first_error"]:
+                print(f"{result['endpoint']}: first error: {result['first_error']}", file=sys.stderr)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""WSGI entry point serving the app against the local upstream stand-ins.
+
+Used to benchmark a real gunicorn deployment offline:
+
+    python -m bench.fake_upstreams --port 9100 &
+    VOLC_PODCAST_ENDPOINT=ws://127.0.0.1:9100 DASHSCOPE_API_KEY=bench VOLC_APPID=bench VOLC_ACCESS_TOKEN=bench \\
+        gunicorn -c gunicorn.conf.py "bench.wsgi:create_app()"
+    python -m bench.run --base-url http://127.0.0.1:8000
+
+Without ``BENCH_REDIS_URL`` every worker keeps its own in-memory Redis, so
+async task polling only works with a single worker.
+"""
+import os
+
+import dashscope.audio.tts_v2
+
+import server
+from bench.fake_upstreams import FakeRedis, FakeSynthesizer
+
+FakeSynthesizer.delay = float(os.getenv("BENCH_SYNTH_DELAY", FakeSynthesizer.delay))
+FakeSynthesizer.audio_size = int(os.getenv("BENCH_AUDIO_SIZE", FakeSynthesizer.audio_size))
+dashscope.audio.tts_v2.SpeechSynthesizer = FakeSynthesizer
+
+if os.getenv("BENCH_REDIS_URL"):
+    server._redis_url = os.environ["BENCH_REDIS_URL"]
+else:
+    server._create_redis = FakeRedis
+
+
+def create_app():
+    return server.create_app()
@@ -0,0 +1,60 @@
+"""Production gunicorn profile.
+
+Requests spend nearly all their time waiting on TTS upstreams, so the default
+is a few processes each running many threads (``gthread``). The app is
+preloaded in the master: SDK modules are imported once and shared
+copy-on-write, while clients (Redis pools, sockets) are rebuilt after fork.
+
+Every setting can be overridden through the environment, see README.
+"""
+import gc
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+workers = int(os.getenv("GUNICORN_WORKERS", min(multiprocessing.cpu_count(), 4)))
+# gthread: concurrent requests per worker. gevent (the "gevent" extra): greenlets per worker.
+threads = int(os.getenv("GUNICORN_THREADS", 16))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 256))
+# Every worker starts its own stitch process pool; share the cores between them
+# instead of starting workers x CPU count processes.
+os.environ.setdefault("STITCH_PROCESSES", str(max(1, multiprocessing.cpu_count() // workers)))
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "1").lower() not in ("0", "false", "no", "off")
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 600))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+# Recycle workers now and then so fragmentation from large audio buffers does not accumulate.
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 200))
+
+# Worker heartbeat files on tmpfs; a disk-backed /tmp can stall heartbeats under I/O load.
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+
+accesslog = os.getenv("GUNICORN_ACCESSLOG", "-")
+
+
+def when_ready(arbiter):
+    if preload_app:
+        import server as app_module
+
+        app_module.preload_sdks()
+        # Keep everything loaded so far out of the collector so workers do not
+        # dirty (and thereby copy) those pages when a collection runs.
+        gc.freeze()
+
+
+def post_fork(arbiter, worker):
+    import server as app_module
+
+    app_module.reset_clients()
+
+
+def post_worker_init(worker):
+    import server as app_module
+
+    # Holds the worker back from accepting requests until it is warm (bounded by WARMUP_WAIT).
+    app_module.start_warmup()
+    app_module.start_reaper()
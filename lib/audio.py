@@ -0,0 +1,329 @@
+"""Audio output options and format conversion.
+
+Upstreams are asked for the requested format directly whenever they support
+it; :func:`transcode` is the fallback for the remaining combinations. WAV/PCM
+re-wrapping and resampling are done in-process, compressed codecs (MP3, Opus)
+are encoded by an ``ffmpeg`` subprocess fed and drained as a stream.
+"""
+import itertools
+import shutil
+import struct
+import subprocess
+import threading
+import warnings
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    try:
+        import audioop
+    except ImportError:  # removed in Python 3.13
+        audioop = None
+
+SUPPORTED_FORMATS = ("wav", "pcm", "mp3", "opus")
+SUPPORTED_SAMPLE_RATES = (8000, 16000, 22050, 24000, 32000, 44100, 48000)
+# Native rate of the CosyVoice and Volcano voices, used when a request names none.
+DEFAULT_SAMPLE_RATE = 24000
+CONTENT_TYPES = {
+    "wav": "audio/wav",
+    "pcm": "audio/L16",
+    "mp3": "audio/mpeg",
+    "opus": "audio/ogg",
+}
+
+# Volcano podcast audio_config accepts these formats natively.
+PODCAST_FORMATS = {"mp3": "mp3", "opus": "ogg_opus", "pcm": "pcm"}
+
+_CHUNK_SIZE = 64 * 1024
+_SAMPLE_WIDTH = 2  # every upstream emits 16-bit mono PCM
+WAV_HEADER_SIZE = 44
+# RIFF/data size of a WAV whose length is not known while it is written.
+_STREAMING_SIZE = 0xFFFFFFFF
+_FFMPEG_CODECS = {
+    "mp3": ["-c:a", "libmp3lame", "-f", "mp3"],
+    "opus": ["-c:a", "libopus", "-f", "ogg"],
+    "wav": ["-c:a", "pcm_s16le", "-f", "wav"],
+    "pcm": ["-c:a", "pcm_s16le", "-f", "s16le"],
+}
+_FFMPEG_INPUTS = {"mp3": "mp3", "opus": "ogg", "wav": "wav"}
+
+
+class AudioConversionError(RuntimeError):
+    """Raised when audio cannot be converted to the requested format."""
+
+
+@dataclass(frozen=True)
+class AudioOptions:
+    """Requested output encoding; unset fields keep the upstream default."""
+
+    format: Optional[str] = None
+    sample_rate: Optional[int] = None
+    bitrate: Optional[int] = None  # kbps, compressed formats only
+
+    @classmethod
+    def from_payload(cls, payload: dict) -> "AudioOptions":
+        """Parse ``format``/``sample_rate``/``bitrate`` request fields, raising ValueError."""
+        fmt = payload.get("format")
+        sample_rate = payload.get("sample_rate")
+        bitrate = payload.get("bitrate")
+
+        if fmt is not None:
+            fmt = str(fmt).lower()
+            if fmt == "ogg_opus":
+                fmt = "opus"
+            if fmt not in SUPPORTED_FORMATS:
+                raise ValueError(f"parameter 'format' must be one of {', '.join(SUPPORTED_FORMATS)}")
+        if sample_rate is not None:
+            if not isinstance(sample_rate, int) or sample_rate not in SUPPORTED_SAMPLE_RATES:
+                raise ValueError(
+                    f"parameter 'sample_rate' must be one of {', '.join(map(str, SUPPORTED_SAMPLE_RATES))}"
+                )
+        if bitrate is not None:
+            if not isinstance(bitrate, int) or not 8 <= bitrate <= 320:
+                raise ValueError("parameter 'bitrate' must be an integer between 8 and 320 (kbps)")
+            if fmt in ("wav", "pcm"):
+                raise ValueError("parameter 'bitrate' only applies to mp3 and opus")
+
+        return cls(format=fmt, sample_rate=sample_rate, bitrate=bitrate)
+
+    def is_default(self) -> bool:
+        return self.format is None and self.sample_rate is None and self.bitrate is None
+
+    def to_dict(self) -> dict:
+        return {"format": self.format, "sample_rate": self.sample_rate, "bitrate": self.bitrate}
+
+
+def dashscope_format(options: AudioOptions):
+    """Pick the DashScope ``AudioFormat`` satisfying ``options``, or None if none does.
+
+    Returns None as well when ``options`` is the default. A missing sample rate
+    means :data:`DEFAULT_SAMPLE_RATE` rather than the first (8 kHz) entry; a
+    missing bitrate takes the first matching format, a requested one must
+    match exactly.
+    """
+    if options.is_default():
+        return None
+
+    from dashscope.audio.tts_v2 import AudioFormat
+
+    fmt = options.format or "mp3"
+    sample_rate = options.sample_rate or DEFAULT_SAMPLE_RATE
+    for candidate in AudioFormat:
+        name, rate, _, bitrate = candidate.value
+        if name != fmt or rate != sample_rate:
+            continue
+        if options.bitrate and bitrate != options.bitrate:
+            continue
+        return candidate
+    return None
+
+
+def dashscope_source_format(options: AudioOptions):
+    """Lossless DashScope format to request when :func:`transcode` has to finish the job."""
+    from dashscope.audio.tts_v2 import AudioFormat
+
+    for candidate in AudioFormat:
+        name, rate, _, _ = candidate.value
+        if name == "wav" and rate == (options.sample_rate or DEFAULT_SAMPLE_RATE):
+            return candidate
+    return AudioFormat.WAV_24000HZ_MONO_16BIT
+
+
+def podcast_source_format(options: AudioOptions):
+    """``(format, sample_rate)`` to request from the Volcano podcast API for ``options``.
+
+    The format is one of our own names; WAV is produced by wrapping PCM output.
+    """
+    fmt = options.format or "mp3"
+    if fmt == "wav":
+        fmt = "pcm"
+    return fmt, options.sample_rate or DEFAULT_SAMPLE_RATE
+
+
+def sniff_format(data: bytes) -> Optional[str]:
+    """Best-effort container detection from the leading bytes."""
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        return "wav"
+    if data[:4] == b"OggS":
+        return "opus"
+    if data[:3] == b"ID3" or (len(data) > 1 and data[0] == 0xFF and data[1] & 0xE0 == 0xE0):
+        return "mp3"
+    return None
+
+
+def needs_transcode(src_format: str, src_rate: Optional[int], options: AudioOptions) -> bool:
+    if options.format and options.format != src_format:
+        return True
+    if options.sample_rate and src_rate and options.sample_rate != src_rate:
+        return True
+    return bool(options.bitrate)
+
+
+def transcode(data: bytes, options: AudioOptions, src_format: Optional[str] = None,
+              src_rate: Optional[int] = None) -> bytes:
+    """Convert a complete audio payload; see :func:`transcode_stream`."""
+    converted = b"".join(transcode_stream([data], options, src_format or sniff_format(data), src_rate))
+    if converted[:4] == b"RIFF":
+        converted = patch_wav_header(converted[:WAV_HEADER_SIZE], len(converted)) + converted[WAV_HEADER_SIZE:]
+    return converted
+
+
+def transcode_stream(chunks: Iterable[bytes], options: AudioOptions, src_format: Optional[str],
+                     src_rate: Optional[int] = None) -> Iterator[bytes]:
+    """Convert a stream of audio chunks into ``options``.
+
+    ``src_rate`` is required for raw PCM input. WAV/PCM to WAV/PCM conversions
+    run in-process one chunk at a time; WAV output then starts with a header
+    of unknown length, see :func:`patch_wav_header`. Anything involving MP3
+    or Opus needs ``ffmpeg`` on PATH.
+    """
+    if src_format is None:
+        raise AudioConversionError("cannot detect the source audio format")
+    target = options.format or src_format
+
+    if src_format in ("wav", "pcm") and target in ("wav", "pcm") and not options.bitrate:
+        yield from _pcm_stream(iter(chunks), src_format, src_rate, target, options.sample_rate)
+        return
+
+    yield from _ffmpeg_stream(chunks, src_format, src_rate, target, options)
+
+
+def wav_header(rate: int, data_size: Optional[int] = None) -> bytes:
+    """Header of a 16-bit mono WAV; without ``data_size`` the sizes mark a stream of unknown length."""
+    data_size = _STREAMING_SIZE if data_size is None else min(data_size, _STREAMING_SIZE - 36)
+    riff_size = _STREAMING_SIZE if data_size == _STREAMING_SIZE else 36 + data_size
+    return struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", riff_size, b"WAVE", b"fmt ", 16, 1, 1, rate,
+                       rate * _SAMPLE_WIDTH, _SAMPLE_WIDTH, _SAMPLE_WIDTH * 8, b"data", data_size)
+
+
+def patch_wav_header(header: bytes, total_size: int) -> bytes:
+    """``header`` written by :func:`transcode_stream` with the sizes of a ``total_size`` byte file.
+
+    Other headers (e.g. ffmpeg's, which may carry more chunks) are returned unchanged.
+    """
+    if len(header) < WAV_HEADER_SIZE or header[36:40] != b"data":
+        return header
+    rate = struct.unpack_from("<I", header, 24)[0]
+    return wav_header(rate, total_size - WAV_HEADER_SIZE)
+
+
+def _pcm_stream(chunks: Iterator[bytes], src_format: str, src_rate: Optional[int], target: str,
+                dst_rate: Optional[int]) -> Iterator[bytes]:
+    if src_format == "wav":
+        src_rate, pending, remaining = _read_wav_header(chunks)
+    else:
+        pending, remaining = b"", None
+    if dst_rate and src_rate == dst_rate:
+        dst_rate = None
+    if not src_rate and (dst_rate or target == "wav"):
+        raise AudioConversionError("raw pcm input needs a known sample rate")
+    if dst_rate and audioop is None:
+        raise AudioConversionError("resampling requires the audioop module (Python < 3.13)")
+
+    if target == "wav":
+        yield wav_header(dst_rate or src_rate)
+    state = None
+    carry = b""  # half a sample left over from the previous chunk
+    for chunk in itertools.chain([pending], chunks):
+        if remaining is not None:
+            chunk = chunk[:remaining]
+            remaining -= len(chunk)
+        if carry:
+            chunk = carry + chunk
+        cut = len(chunk) - len(chunk) % _SAMPLE_WIDTH
+        chunk, carry = chunk[:cut], chunk[cut:]
+        if dst_rate and chunk:
+            chunk, state = audioop.ratecv(chunk, _SAMPLE_WIDTH, 1, src_rate, dst_rate, state)
+        if chunk:
+            yield chunk
+        if remaining == 0:
+            break
+
+
+def _read_wav_header(chunks: Iterator[bytes]):
+    """Parse a WAV header off the front of ``chunks``.
+
+    Returns ``(sample_rate, pcm_already_read, data_size)``; ``data_size`` is
+    None for a WAV written as a stream of unknown length.
+    """
+    buffer = b""
+    rate = None
+    offset = 12
+    while True:
+        if len(buffer) >= 12 and (buffer[:4], buffer[8:12]) != (b"RIFF", b"WAVE"):
+            raise AudioConversionError("input is not a WAV file")
+        if len(buffer) >= offset + 8:
+            chunk_id, size = struct.unpack_from("<4sI", buffer, offset)
+            if chunk_id == b"data":
+                if rate is None:
+                    raise AudioConversionError("WAV data before its format chunk")
+                data_size = None if size in (0, _STREAMING_SIZE) else size
+                return rate, buffer[offset + 8:], data_size
+            if len(buffer) >= offset + 8 + size:
+                if chunk_id == b"fmt ":
+                    _, channels, rate, _, _, width = struct.unpack_from("<HHIIHH", buffer, offset + 8)
+                    if width != _SAMPLE_WIDTH * 8 or channels != 1:
+                        raise AudioConversionError("only 16-bit mono WAV can be converted in-process")
+                offset += 8 + size + size % 2
+                continue
+        block = next(chunks, None)
+        if block is None:
+            raise AudioConversionError("truncated WAV header")
+        buffer += block
+
+
+def _ffmpeg_stream(chunks: Iterable[bytes], src_format: str, src_rate: Optional[int], target: str,
+                   options: AudioOptions) -> Iterator[bytes]:
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise AudioConversionError(f"converting {src_format} to {target} requires ffmpeg on this server")
+
+    if src_format == "pcm":
+        if not src_rate:
+            raise AudioConversionError("raw pcm input needs a known sample rate")
+        input_args = ["-f", "s16le", "-ar", str(src_rate), "-ac", "1"]
+    else:
+        input_args = ["-f", _FFMPEG_INPUTS[src_format]]
+
+    output_args = ["-ac", "1"]
+    if options.sample_rate:
+        output_args += ["-ar", str(options.sample_rate)]
+    if options.bitrate:
+        output_args += ["-b:a", f"{options.bitrate}k"]
+    output_args += _FFMPEG_CODECS[target]
+
+    process = subprocess.Popen(
+        [ffmpeg, "-hide_banner", "-loglevel", "error", *input_args, "-i", "pipe:0", *output_args, "pipe:1"],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+
+    def feed():
+        try:
+            for chunk in chunks:
+                process.stdin.write(chunk)
+        except BrokenPipeError:
+            pass
+        finally:
+            process.stdin.close()
+
+    # Feeding from another thread keeps both pipes moving without deadlocking.
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    finished = False
+    try:
+        while True:
+            block = process.stdout.read(_CHUNK_SIZE)
+            if not block:
+                break
+            yield block
+        finished = True
+    finally:
+        if not finished:
+            # The consumer went away; don't leave ffmpeg blocked on a full pipe.
+            process.kill()
+        feeder.join()
+        stderr = process.stderr.read()
+        returncode = process.wait()
+        if finished and returncode != 0:
+            raise AudioConversionError(f"ffmpeg failed: {stderr.decode('utf-8', 'ignore').strip()}")
@@ -0,0 +1,101 @@
+"""Cooperative cancellation of running tasks, signalled through Redis.
+
+``DELETE`` endpoints set a ``<kind>_cancel:<task_id>`` key. Every worker
+process runs one watcher thread that checks the keys of the tasks it is
+running with a single MGET per interval and fires the callbacks registered by
+those tasks (cancel the asyncio task, stop the upstream stream, ...).
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+
+class TaskCancelled(Exception):
+    """Raised inside a worker whose task was cancelled."""
+
+
+class Cancellation:
+    """Cancellation state of one running task."""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.cancelled = False
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        """Run ``callback`` when the task is cancelled, right away if it already is."""
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:  # one failing hook must not keep the others from running
+                logger.warning(f"Cancel callback for {self.key} failed: {e}")
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise TaskCancelled(self.key)
+
+
+class CancellationRegistry:
+    """Watches the cancel keys of the tasks running in this process."""
+
+    def __init__(self, redis_getter: Callable, interval: float = 1.0):
+        self._redis_getter = redis_getter
+        self.interval = interval
+        self._running: Dict[str, Cancellation] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread = None
+
+    @contextmanager
+    def watch(self, key: str) -> Iterator[Cancellation]:
+        cancellation = Cancellation(key)
+        with self._lock:
+            self._running[key] = cancellation
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="cancel-watcher", daemon=True)
+                self._thread.start()
+            if len(self._running) == 1:
+                self._wakeup.notify()
+        try:
+            yield cancellation
+        finally:
+            with self._lock:
+                self._running.pop(key, None)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                while not self._running:
+                    self._wakeup.wait()
+                self._wakeup.wait(self.interval)
+                running = dict(self._running)
+            if running:
+                self.poll(running)
+
+    def poll(self, running: Dict[str, Cancellation]) -> None:
+        keys = list(running)
+        try:
+            values = self._redis_getter().mget(keys)
+        except Exception as e:  # redis errors; retried on the next tick
+            logger.warning(f"Could not check task cancellations: {e}")
+            return
+        for key, value in zip(keys, values):
+            if value:
+                logger.info(f"Cancelling {key}")
+                running[key].cancel()
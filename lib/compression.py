@@ -0,0 +1,33 @@
+"""Content-Encoding negotiation for JSON responses.
+
+``gzip`` always works; ``zstd`` is offered when the optional ``zstandard``
+package is installed. Small bodies are sent as they are.
+"""
+import gzip
+from typing import Optional
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+# Preferred first when the client accepts both with the same quality.
+ENCODINGS = ("zstd", "gzip") if zstandard is not None else ("gzip",)
+MIN_SIZE = 1024
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def negotiate(accept_encodings, size: int) -> Optional[str]:
+    """Encoding for a body of ``size`` bytes given werkzeug's ``request.accept_encodings``."""
+    if size < MIN_SIZE:
+        return None
+    return accept_encodings.best_match(ENCODINGS)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    raise ValueError(f"unsupported encoding {encoding!r}")
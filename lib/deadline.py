@@ -0,0 +1,56 @@
+"""Request deadlines carried through every blocking call.
+
+A :class:`Deadline` is an absolute wall-clock time, so it survives being
+handed to a background task or to another service (``X-Request-Deadline``).
+Blocking calls take their timeout from :meth:`Deadline.timeout`, which caps
+the call's own default at the time left and raises
+:class:`DeadlineExceeded` once none is.
+"""
+import time
+from typing import Optional
+
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed before its work finished."""
+
+    def __init__(self, message: str = "deadline exceeded"):
+        super().__init__(message)
+
+
+class Deadline:
+    def __init__(self, expires_at: Optional[float] = None):
+        self.expires_at = expires_at
+
+    @classmethod
+    def after(cls, seconds: Optional[float]) -> "Deadline":
+        return cls(time.time() + seconds if seconds else None)
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, or None without a deadline."""
+        if self.expires_at is None:
+            return None
+        return self.expires_at - time.time()
+
+    @property
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def check(self) -> None:
+        if self.expired:
+            raise DeadlineExceeded()
+
+    def timeout(self, default: Optional[float] = None) -> Optional[float]:
+        """Timeout for the next blocking call: ``default`` capped at the time left."""
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        if remaining <= 0:
+            raise DeadlineExceeded()
+        return remaining if default is None else min(default, remaining)
+
+    def __repr__(self) -> str:
+        return f"Deadline(expires_at={self.expires_at!r})"
+
+
+NO_DEADLINE = Deadline()
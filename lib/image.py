@@ -0,0 +1,278 @@
+"""Image loading and stitching with bounded memory.
+
+Inputs are untrusted URLs or base64 strings. Each one is capped in bytes while
+it is downloaded or before its base64 is decoded, and in pixels from its header
+before any pixel data is decoded. Images are then decoded one at a time straight
+into the output canvas, so a stitch holds the compressed inputs, the canvas and
+a single decoded image. JPEGs that are scaled down are decoded at reduced size
+with ``draft()``.
+
+The output PNG is written here rather than by Pillow so that horizontal strips
+of it can be compressed independently, e.g. by a process pool.
+"""
+import binascii
+import logging
+import struct
+import zlib
+from dataclasses import dataclass
+from io import BytesIO
+from typing import List, Optional, Tuple, Union
+
+from lib import tracing
+from lib.deadline import NO_DEADLINE, Deadline, DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+_CHUNK_SIZE = 64 * 1024
+# Output PNGs are encoded in strips of about this many raw bytes, which can be
+# compressed in parallel.
+PNG_STRIP_BYTES = 4 * 1024 * 1024
+PNG_LEVEL = 6
+
+
+class ImageRejected(ValueError):
+    """An image is larger than the configured limits allow."""
+
+
+@dataclass(frozen=True)
+class ImageLimits:
+    max_bytes: int = 20 * 1024 * 1024  # compressed size of one input
+    max_pixels: int = 40_000_000  # decoded size of one input
+    max_output_pixels: int = 100_000_000  # size of the stitched image
+
+
+def read_source(source: Union[str, bytes], limits: ImageLimits, deadline: Optional[Deadline] = None,
+                fetch_timeout: float = 10) -> bytes:
+    """Raw bytes of an uploaded, URL or (data URL) base64 input, at most ``limits.max_bytes``."""
+    deadline = deadline or NO_DEADLINE
+    if isinstance(source, (bytes, bytearray)):
+        if len(source) > limits.max_bytes:
+            raise ImageRejected(f"image is larger than {limits.max_bytes} bytes")
+        return source
+    if source.startswith("http://") or source.startswith("https://"):
+        return _download(source, limits.max_bytes, deadline, fetch_timeout)
+
+    start = source.find(",", 0, 256) + 1  # data URL prefix
+    if (len(source) - start) // 4 * 3 > limits.max_bytes:
+        raise ImageRejected(f"image is larger than {limits.max_bytes} bytes")
+    try:
+        return binascii.a2b_base64(source[start:] if start else source)
+    except binascii.Error as e:
+        raise ValueError(f"invalid base64 image: {e}")
+
+
+def _download(url: str, max_bytes: int, deadline: Deadline, fetch_timeout: float) -> bytes:
+    import requests
+
+    # requests' timeout bounds each socket read, not the download; the deadline
+    # is checked between chunks as well.
+    with requests.get(url, timeout=deadline.timeout(fetch_timeout), stream=True) as response:
+        response.raise_for_status()
+        declared = response.headers.get("Content-Length")
+        if declared and declared.isdigit() and int(declared) > max_bytes:
+            raise ImageRejected(f"image is larger than {max_bytes} bytes")
+        buffer = bytearray()
+        for chunk in response.iter_content(chunk_size=_CHUNK_SIZE):
+            deadline.check()
+            buffer += chunk
+            if len(buffer) > max_bytes:
+                raise ImageRejected(f"image is larger than {max_bytes} bytes")
+    return bytes(buffer)
+
+
+def open_image(data: bytes, limits: ImageLimits):
+    """Open ``data`` lazily, rejecting it from its header if it has too many pixels."""
+    from PIL import Image
+
+    image = Image.open(BytesIO(data))
+    if image.width * image.height > limits.max_pixels:
+        image.close()
+        raise ImageRejected(f"image of {image.width}x{image.height} exceeds {limits.max_pixels} pixels")
+    return image
+
+
+def decode_rgb(image, size: Tuple[int, int]):
+    """Decode ``image`` as RGB at ``size``, converting and resizing once."""
+    from PIL import Image
+
+    if size != image.size:
+        # JPEG only: decode at the smallest 1/2, 1/4 or 1/8 scale still >= size.
+        image.draft("RGB", size)
+    rgb = image if image.mode == "RGB" else image.convert("RGB")
+    if rgb.size != size:
+        rgb = rgb.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+    return rgb
+
+
+def fitted_size(size: Tuple[int, int], direction: str, max_size: Optional[int]) -> Tuple[int, int]:
+    """``size`` scaled down so the side across the stitch is at most ``max_size``."""
+    width, height = size
+    if not max_size:
+        return size
+    if direction == "vertical" and width > max_size:
+        return max_size, max(1, round(height * max_size / width))
+    if direction != "vertical" and height > max_size:
+        return max(1, round(width * max_size / height)), max_size
+    return size
+
+
+def layout(sizes: List[Tuple[int, int]], direction: str) -> Tuple[Tuple[int, int], List[Tuple[int, int, int, int]]]:
+    """Canvas size and ``(x, y, width, height)`` box of every image."""
+    boxes = []
+    offset = 0
+    for width, height in sizes:
+        if direction == "vertical":
+            boxes.append((0, offset, width, height))
+            offset += height
+        else:
+            boxes.append((offset, 0, width, height))
+            offset += width
+    if direction == "vertical":
+        canvas = (max(w for w, _ in sizes), offset)
+    else:
+        canvas = (offset, max(h for _, h in sizes))
+    return canvas, boxes
+
+
+def paste_into(canvas, canvas_width: int, data, box: Tuple[int, int, int, int], limits: ImageLimits) -> None:
+    """Decode ``data`` into its ``box`` of a raw RGB ``canvas`` buffer."""
+    x, y, width, height = box
+    with open_image(data, limits) as image:
+        rgb = decode_rgb(image, (width, height))
+        raw = rgb.tobytes()
+        rgb.close()
+
+    stride = canvas_width * 3
+    row = width * 3
+    if x == 0 and width == canvas_width:
+        canvas[y * stride:(y + height) * stride] = raw
+        return
+    for r in range(height):
+        start = (y + r) * stride + x * 3
+        canvas[start:start + row] = raw[r * row:(r + 1) * row]
+
+
+def strip_rows(width: int, height: int) -> List[Tuple[int, int]]:
+    """Row ranges of the strips a canvas is PNG-encoded in, about PNG_STRIP_BYTES each."""
+    rows = max(1, PNG_STRIP_BYTES // (width * 3))
+    return [(y, min(y + rows, height)) for y in range(0, height, rows)]
+
+
+def encode_strip(canvas, width: int, y0: int, y1: int, last: bool, level: int = PNG_LEVEL) -> Tuple[bytes, int, int]:
+    """Deflate rows ``y0:y1`` of a raw RGB canvas as a piece of the PNG image data.
+
+    Rows use the "Up" filter, computed with ``ImageChops.subtract_modulo``
+    against the rows shifted by one. Every strip is compressed on its own and
+    ends on a byte boundary, so the pieces concatenate into one deflate stream.
+    Returns ``(deflated, adler32, raw_length)`` of the filtered rows.
+    """
+    from PIL import Image, ImageChops
+
+    stride = width * 3
+    rows = y1 - y0
+    current = Image.frombuffer("RGB", (width, rows), bytes(canvas[y0 * stride:y1 * stride]), "raw", "RGB", 0, 1)
+    if y0:
+        above = bytes(canvas[(y0 - 1) * stride:(y1 - 1) * stride])
+    else:
+        above = bytes(stride) + bytes(canvas[:(y1 - 1) * stride])
+    previous = Image.frombuffer("RGB", (width, rows), above, "raw", "RGB", 0, 1)
+    filtered = ImageChops.subtract_modulo(current, previous).tobytes()
+
+    raw = bytearray((stride + 1) * rows)
+    for r in range(rows):
+        raw[r * (stride + 1)] = 2  # filter type Up
+        raw[r * (stride + 1) + 1:(r + 1) * (stride + 1)] = filtered[r * stride:(r + 1) * stride]
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    deflated = compressor.compress(raw) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+    return deflated, zlib.adler32(raw), len(raw)
+
+
+def _adler32_combine(adler1: int, adler2: int, length2: int) -> int:
+    # zlib's adler32_combine(), which the zlib module doesn't expose.
+    base = 65521
+    remainder = length2 % base
+    sum1 = adler1 & 0xFFFF
+    sum2 = (remainder * sum1) % base
+    sum1 = (sum1 + (adler2 & 0xFFFF) + base - 1) % base
+    sum2 = (sum2 + (adler1 >> 16) + (adler2 >> 16) + base - remainder) % base
+    return sum1 | (sum2 << 16)
+
+
+def _png_chunk(tag: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(data, zlib.crc32(tag)))
+
+
+def assemble_png(width: int, height: int, strips: List[Tuple[bytes, int, int]]) -> bytes:
+    """An 8-bit RGB PNG made of the :func:`encode_strip` pieces of every strip, in order."""
+    adler = 1
+    for _, strip_adler, length in strips:
+        adler = _adler32_combine(adler, strip_adler, length)
+
+    parts = [b"\x89PNG\r\n\x1a\n", _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))]
+    parts.append(_png_chunk(b"IDAT", b"\x78\x9c"))  # zlib header
+    parts.extend(_png_chunk(b"IDAT", deflated) for deflated, _, _ in strips)
+    parts.append(_png_chunk(b"IDAT", struct.pack(">I", adler)))
+    parts.append(_png_chunk(b"IEND", b""))
+    return b"".join(parts)
+
+
+def compose_png(inputs: List[bytes], canvas: Tuple[int, int], boxes: List[Tuple[int, int, int, int]],
+                limits: ImageLimits, deadline: Optional[Deadline] = None) -> bytes:
+    """Paste and encode in this process; see :class:`lib.stitch_pool.StitchPool` for the parallel version."""
+    deadline = deadline or NO_DEADLINE
+    width, height = canvas
+    buffer = bytearray(width * height * 3)
+    with tracing.span("stitch.decode", images=len(inputs)):
+        for data, box in zip(inputs, boxes):
+            deadline.check()
+            paste_into(buffer, width, data, box, limits)
+    with tracing.span("stitch.encode", width=width, height=height) as span:
+        strips = []
+        for y0, y1 in strip_rows(width, height):
+            deadline.check()
+            strips.append(encode_strip(buffer, width, y0, y1, y1 == height))
+        png = assemble_png(width, height, strips)
+        span.set("png_bytes", len(png))
+    return png
+
+
+def stitch_images(sources: List[Union[str, bytes]], direction: str = "horizontal", limits: ImageLimits = ImageLimits(),
+                  deadline: Optional[Deadline] = None, max_size: Optional[int] = None,
+                  fetch_timeout: float = 10, pool=None) -> bytes:
+    """Stitch ``sources`` side by side (or top to bottom) into one PNG.
+
+    Inputs that can't be fetched or are invalid are skipped; ImageRejected is
+    raised if an input exceeds the per-image limits or the stitched image
+    would be too large.
+    Decoding and encoding run on ``pool`` (a :class:`lib.stitch_pool.StitchPool`)
+    when one is given.
+    """
+    deadline = deadline or NO_DEADLINE
+    inputs = []
+    sizes = []
+    for source in sources:
+        try:
+            with tracing.span("stitch.fetch", remote=isinstance(source, str) and source.startswith("http")) as span:
+                data = read_source(source, limits, deadline, fetch_timeout)
+                span.set("bytes", len(data))
+                with open_image(data, limits) as image:
+                    size = image.size
+        except (DeadlineExceeded, ImageRejected):
+            raise
+        except Exception as e:
+            logger.warning(f"Skipping image: {e}")
+            continue
+        inputs.append(data)
+        sizes.append(fitted_size(size, direction, max_size))
+
+    if not inputs:
+        raise ValueError("No valid images to stitch")
+
+    canvas, boxes = layout(sizes, direction)
+    if canvas[0] * canvas[1] > limits.max_output_pixels:
+        raise ImageRejected(f"stitched image of {canvas[0]}x{canvas[1]} exceeds {limits.max_output_pixels} pixels")
+
+    if pool is not None:
+        return pool.compose_png(inputs, canvas, boxes, limits, deadline)
+    return compose_png(inputs, canvas, boxes, limits, deadline)
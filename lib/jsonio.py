@@ -0,0 +1,75 @@
+"""JSON encoding with an optional fast backend.
+
+Request and response bodies (megabytes of base64 images and ``voice_b64``)
+and large task records are parsed and serialized here. With ``orjson``
+installed both run in a fraction of the time of the stdlib ``json`` module;
+without it, or with ``JSON_BACKEND=json``, the stdlib is used.
+"""
+import json
+import os
+from typing import Any, Union
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+BACKEND = os.getenv("JSON_BACKEND", "orjson" if orjson is not None else "json").lower()
+if BACKEND == "orjson" and orjson is None:
+    raise RuntimeError("JSON_BACKEND=orjson requires the orjson package")
+if BACKEND not in ("json", "orjson"):
+    raise RuntimeError(f"unknown JSON_BACKEND {BACKEND!r}")
+
+
+def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+    if BACKEND == "orjson":
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """UTF-8 encoded JSON of ``obj``."""
+    if BACKEND == "orjson":
+        try:
+            return orjson.dumps(obj)
+        except TypeError:  # e.g. non-string keys or integers beyond 64 bits
+            pass
+    return json.dumps(obj).encode("utf-8")
+
+
+def dumps(obj: Any) -> str:
+    if BACKEND == "orjson":
+        return dumps_bytes(obj).decode("utf-8")
+    return json.dumps(obj)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by :func:`loads` / :func:`dumps_bytes`.
+
+    Keys are not sorted and non-ASCII text is sent as UTF-8; types orjson
+    doesn't know are handled by Flask's default encoder.
+    """
+
+    def loads(self, s, **kwargs):
+        if BACKEND == "orjson" and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def dumps(self, obj, **kwargs):
+        if BACKEND == "orjson" and not kwargs:
+            return self._orjson_dumps(obj).decode("utf-8")
+        return super().dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if BACKEND != "orjson":
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._orjson_dumps(obj) + b"\n", mimetype=self.mimetype)
+
+    def _orjson_dumps(self, obj) -> bytes:
+        try:
+            return orjson.dumps(obj, default=self.default)
+        except TypeError:
+            return json.dumps(obj, default=self.default).encode("utf-8")
@@ -0,0 +1,371 @@
+"""Lifecycle of async tasks: states, transition times, heartbeats and the reaper.
+
+A task record moves through ``queued -> running -> succeeded | failed |
+cancelled | expired``; every transition is stamped in ``timestamps``
+(``queued_at``, ``running_at``, ``succeeded_at``, ...) and ``durations``
+derives the time spent waiting in the queue, running, and in the stages the
+worker marked with :func:`stage`. ``status`` keeps its old values
+(``processing``, ``success``, ...) for existing clients.
+
+Tasks live in the scheduler queue and threads of one worker process, so they
+die with it (a restart, a crash, gunicorn recycling the worker). While a
+process holds a task, :class:`Heartbeats` refreshes a short-lived
+``<kind>_heartbeat:<task_id>`` key for it. The :class:`Reaper` walks the
+index of unfinished tasks (``tasks_active``) and takes over the ones whose
+heartbeat expired: it queues them again when their parameters were kept and
+attempts are left, and fails them otherwise.
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Iterator, Optional
+
+from lib import jsonio
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+EXPIRED = "expired"
+FINAL_STATES = (SUCCEEDED, FAILED, CANCELLED, EXPIRED)
+# ``status`` of a record in each state, as returned before the lifecycle existed.
+STATUSES = {QUEUED: "processing", RUNNING: "processing", SUCCEEDED: "success", FAILED: "failed",
+            CANCELLED: "cancelled", EXPIRED: "failed"}
+_STATES = {"success": SUCCEEDED, "failed": FAILED, "cancelled": CANCELLED}
+
+HEARTBEAT_INTERVAL = float(os.getenv("TASK_HEARTBEAT_INTERVAL", 10))
+# A task whose heartbeat is this old has lost its worker.
+HEARTBEAT_TTL = int(3 * HEARTBEAT_INTERVAL)
+REAPER_INTERVAL = float(os.getenv("TASK_REAPER_INTERVAL", 30))
+# Runs of a task, including those after its worker was lost.
+MAX_ATTEMPTS = int(os.getenv("TASK_MAX_ATTEMPTS", 2))
+ACTIVE_KEY = "tasks_active"
+REAPER_LOCK_KEY = "tasks_reaper"
+# Durations kept per task kind for the percentiles of /admin/tasks.
+WINDOW = 500
+
+_current: contextvars.ContextVar[Optional["TaskRun"]] = contextvars.ContextVar("current_task_run", default=None)
+
+
+def heartbeat_key(kind: str, task_id: str) -> str:
+    return f"{kind}_heartbeat:{task_id}"
+
+
+def params_key(kind: str, task_id: str) -> str:
+    return f"{kind}_params:{task_id}"
+
+
+def status_key(kind: str, task_id: str) -> str:
+    """Copy of a task record without its results, read by bulk status queries."""
+    return f"{kind}_status:{task_id}"
+
+
+def _ms(start: Optional[float], end: Optional[float]) -> Optional[float]:
+    if start is None or end is None:
+        return None
+    return round((end - start) * 1000, 3)
+
+
+class TaskRun:
+    """State, transition times and stage durations of one task."""
+
+    def __init__(self, kind: str, task_id: str, attempt: int = 1, created_at: Optional[float] = None,
+                 timestamps: Optional[Dict[str, float]] = None, state: str = QUEUED):
+        now = time.time()
+        self.kind = kind
+        self.task_id = task_id
+        self.attempt = attempt
+        self.state = state
+        self.timestamps = timestamps or {f"{state}_at": now}
+        self.created_at = created_at or self.timestamps.get("queued_at", now)
+        self.stages: Dict[str, float] = {}
+        self.token: Optional[contextvars.Token] = None
+        # Set by the worker when the task was cancelled while it was queued.
+        self.cancel_requested = False
+
+    @classmethod
+    def from_record(cls, kind: str, task_id: str, record: Dict) -> "TaskRun":
+        state = record.get("state") or _STATES.get(record.get("status"), RUNNING)
+        return cls(kind, task_id, record.get("attempt", 1), record.get("created_at"),
+                   dict(record.get("timestamps") or {}), state)
+
+    def transition(self, state: str) -> None:
+        self.state = state
+        self.timestamps[f"{state}_at"] = time.time()
+
+    def durations(self) -> Dict:
+        """``queue_ms`` (last queued to running), ``run_ms``, ``total_ms`` and ``stages`` so far."""
+        queued_at = self.timestamps.get("queued_at")
+        running_at = self.timestamps.get("running_at")
+        finished_at = self.timestamps.get(f"{self.state}_at") if self.state in FINAL_STATES else None
+        durations = {
+            "queue_ms": _ms(queued_at, running_at),
+            "run_ms": _ms(running_at, finished_at),
+            "total_ms": _ms(self.created_at, finished_at),
+        }
+        durations = {name: value for name, value in durations.items() if value is not None}
+        if self.stages:
+            durations["stages"] = dict(self.stages)
+        return durations
+
+    def record(self, fields: Optional[Dict] = None) -> Dict:
+        """Task record in the current state: ``fields`` plus the lifecycle fields."""
+        return {
+            **(fields or {}),
+            "status": STATUSES[self.state],
+            "state": self.state,
+            "created_at": self.created_at,
+            "task_id": self.task_id,
+            "attempt": self.attempt,
+            "timestamps": dict(self.timestamps),
+            "durations": self.durations(),
+        }
+
+    def finish(self, task_info: Dict) -> Dict:
+        """Final record for the ``task_info`` a worker produced (``status`` or ``state`` set)."""
+        fields = dict(task_info)
+        self.transition(fields.pop("state", None) or _STATES[fields["status"]])
+        return self.record(fields)
+
+
+def current() -> Optional[TaskRun]:
+    return _current.get()
+
+
+@contextmanager
+def submitting(run: TaskRun) -> Iterator[TaskRun]:
+    """Make ``run`` current while a job is queued, so the job's copied context carries it."""
+    token = _current.set(run)
+    try:
+        yield run
+    finally:
+        _current.reset(token)
+
+
+def activate(run: TaskRun) -> None:
+    """Make ``run`` current in the worker until :func:`deactivate`, for :func:`stage`."""
+    run.token = _current.set(run)
+
+
+def deactivate(run: TaskRun) -> None:
+    if run.token is not None:
+        _current.reset(run.token)
+        run.token = None
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Add the time spent in the block to stage ``name`` of the current task, if any."""
+    run = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if run is not None:
+            elapsed = (time.perf_counter() - started) * 1000
+            run.stages[name] = round(run.stages.get(name, 0.0) + elapsed, 3)
+
+
+class Heartbeats:
+    """Refreshes the heartbeat keys of the tasks this process holds, queued or running."""
+
+    def __init__(self, get_redis: Callable, interval: float = HEARTBEAT_INTERVAL, ttl: int = HEARTBEAT_TTL):
+        self._get_redis = get_redis
+        self.interval = interval
+        self.ttl = ttl
+        self._keys = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, key: str) -> None:
+        with self._lock:
+            self._keys.add(key)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="task-heartbeats", daemon=True)
+                self._thread.start()
+            self._wakeup.notify()
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            self._keys.discard(key)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                while not self._keys:
+                    self._wakeup.wait()
+                self._wakeup.wait(self.interval)
+                keys = list(self._keys)
+            if keys:
+                self.beat(keys)
+
+    def beat(self, keys) -> None:
+        try:
+            pipe = self._get_redis().pipeline(transaction=False)
+            for key in keys:
+                pipe.set(key, os.getpid(), ex=self.ttl)
+            pipe.execute()
+        except Exception as e:  # redis errors; retried on the next tick
+            logger.warning(f"Could not refresh task heartbeats: {e}")
+
+
+class TaskMetrics:
+    """Per-process counts and recent queue / run durations of finished tasks."""
+
+    def __init__(self, window: int = WINDOW):
+        self.window = window
+        self._states: Dict[str, Dict[str, int]] = {}
+        self._durations: Dict[str, Dict[str, Deque[float]]] = {}
+        self._reaped = {"requeued": 0, "failed": 0, "expired": 0}
+        self._lock = threading.Lock()
+
+    def observe(self, run: TaskRun) -> None:
+        durations = run.durations()
+        with self._lock:
+            states = self._states.setdefault(run.kind, {})
+            states[run.state] = states.get(run.state, 0) + 1
+            windows = self._durations.setdefault(run.kind, {})
+            for name in ("queue_ms", "run_ms"):
+                if name in durations:
+                    windows.setdefault(name, deque(maxlen=self.window)).append(durations[name])
+
+    def reaped(self, outcome: str) -> None:
+        with self._lock:
+            self._reaped[outcome] += 1
+
+    @staticmethod
+    def _summary(values) -> Dict:
+        ordered = sorted(values)
+        return {
+            "count": len(ordered),
+            "avg": round(sum(ordered) / len(ordered), 3),
+            "p50": ordered[len(ordered) // 2],
+            "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            "max": ordered[-1],
+        }
+
+    def stats(self) -> Dict:
+        with self._lock:
+            kinds = {}
+            for kind, states in self._states.items():
+                windows = self._durations.get(kind, {})
+                kinds[kind] = {"states": dict(states),
+                               **{name: self._summary(values) for name, values in windows.items()}}
+            return {"pid": os.getpid(), "kinds": kinds, "reaped": dict(self._reaped)}
+
+
+class Reaper:
+    """Takes over unfinished tasks whose worker stopped sending heartbeats.
+
+    ``requeue(run, params)`` queues a task again from the parameters kept at
+    submission and returns False if it can't. One pass runs per ``interval``
+    across all processes, guarded by a Redis lock.
+    """
+
+    def __init__(self, get_redis: Callable, requeue: Callable[[TaskRun, Dict], bool], record_ttl: int,
+                 interval: float = REAPER_INTERVAL, max_attempts: int = MAX_ATTEMPTS,
+                 metrics: Optional[TaskMetrics] = None, batch: int = 500):
+        self._get_redis = get_redis
+        self.requeue = requeue
+        self.record_ttl = record_ttl
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.metrics = metrics
+        self.batch = batch
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name="task-reaper", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.run_once()
+            except Exception as e:  # redis errors; retried on the next pass
+                logger.warning(f"Task reaper pass failed: {e}")
+
+    def run_once(self) -> Dict[str, int]:
+        outcomes = {"requeued": 0, "failed": 0, "expired": 0}
+        redis = self._get_redis()
+        if not redis.set(REAPER_LOCK_KEY, os.getpid(), nx=True, ex=max(1, int(self.interval))):
+            return outcomes  # another process ran this pass
+
+        # Tasks younger than a heartbeat TTL may not have sent one yet.
+        members = redis.zrangebyscore(ACTIVE_KEY, "-inf", time.time() - HEARTBEAT_TTL, start=0, num=self.batch)
+        tasks = []
+        for member in members:
+            kind, _, task_id = (member.decode() if isinstance(member, bytes) else member).partition(":")
+            tasks.append((kind, task_id, member))
+        if not tasks:
+            return outcomes
+        beats = redis.mget([heartbeat_key(kind, task_id) for kind, task_id, _ in tasks])
+        for (kind, task_id, member), beat in zip(tasks, beats):
+            # Claiming the heartbeat keeps other reapers (and a late owner's
+            # first beat) from racing this one.
+            if beat or not redis.set(heartbeat_key(kind, task_id), "reaper", nx=True, ex=HEARTBEAT_TTL):
+                continue
+            outcome = self._reap(redis, kind, task_id, member)
+            if outcome:
+                outcomes[outcome] += 1
+                if self.metrics is not None:
+                    self.metrics.reaped(outcome)
+        return outcomes
+
+    def _reap(self, redis, kind: str, task_id: str, member) -> Optional[str]:
+        data = redis.get(f"{kind}_task:{task_id}")
+        record = jsonio.loads(data) if data else None
+        if record is None or record.get("state") not in (QUEUED, RUNNING):
+            self._forget(redis, kind, task_id, member)
+            return None
+
+        run = TaskRun.from_record(kind, task_id, record)
+        lost_in = run.state
+        raw_params = redis.get(params_key(kind, task_id))
+        params = jsonio.loads(raw_params) if raw_params else None
+        deadline = (params or {}).get("deadline")
+
+        if deadline is not None and deadline <= time.time():
+            run.transition(EXPIRED)
+            outcome, error = "expired", "deadline exceeded"
+        elif params is not None and run.attempt < self.max_attempts:
+            run.attempt += 1
+            run.transition(QUEUED)
+            data = jsonio.dumps(run.record())
+            pipe = redis.pipeline(transaction=False)
+            pipe.setex(f"{kind}_task:{task_id}", self.record_ttl, data)
+            pipe.set(status_key(kind, task_id), data, ex=self.record_ttl)
+            pipe.zadd(ACTIVE_KEY, {member: time.time()})
+            pipe.execute()
+            if self.requeue(run, params):
+                logger.warning(f"Re-queued {kind} task {task_id} lost while {lost_in} (attempt {run.attempt})")
+                return "requeued"
+            run.transition(FAILED)
+            outcome, error = "failed", f"worker lost while the task was {lost_in}"
+        else:
+            run.transition(FAILED)
+            outcome, error = "failed", f"worker lost while the task was {lost_in}"
+
+        logger.warning(f"Reaped {kind} task {task_id} lost while {lost_in}: {run.state}")
+        data = jsonio.dumps(run.record({"error": error}))
+        redis.setex(f"{kind}_task:{task_id}", self.record_ttl, data)
+        redis.set(status_key(kind, task_id), data, ex=self.record_ttl)
+        self._forget(redis, kind, task_id, member)
+        return outcome
+
+    @staticmethod
+    def _forget(redis, kind: str, task_id: str, member) -> None:
+        pipe = redis.pipeline(transaction=False)
+        pipe.zrem(ACTIVE_KEY, member)
+        pipe.delete(params_key(kind, task_id), heartbeat_key(kind, task_id))
+        pipe.execute()
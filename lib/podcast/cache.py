@@ -0,0 +1,149 @@
+"""Per-round podcast audio cache.
+
+Editing a line or two of a script should not regenerate the whole episode.
+Each round's audio is stored under a hash of ``(speaker, text, audio_config)``;
+:func:`generate_with_cache` only opens sessions for the lines that are missing
+and splices the fresh rounds between the cached ones.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from lib.storage.base import ResultStorage
+
+from .client import HEAD_MUSIC_ROUND, TAIL_MUSIC_ROUND, PodcastRound
+from .segments import NO_LIMIT, SessionLimit, split_scripts
+
+logger = logging.getLogger("PodcastTTS")
+
+_HEAD = "head_music"
+_TAIL = "tail_music"
+
+
+class RoundCache:
+    """Round audio kept in a :class:`ResultStorage` under ``prefix``."""
+
+    def __init__(self, storage: ResultStorage, ttl: Optional[int] = None, prefix: str = "podcast_round/"):
+        self.storage = storage
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def key(self, speaker: Optional[str], text: Optional[str], audio_config: Dict) -> str:
+        canonical = json.dumps([speaker, text, audio_config], sort_keys=True, ensure_ascii=False,
+                               separators=(",", ":"))
+        return self.prefix + hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            return self.storage.get(key)
+        except Exception as e:  # a cache miss is never fatal
+            logger.warning(f"Round cache read failed for {key}: {e}")
+            return None
+
+    def put(self, key: str, audio: bytes) -> None:
+        try:
+            self.storage.put(key, audio, ttl=self.ttl)
+        except Exception as e:
+            logger.warning(f"Round cache write failed for {key}: {e}")
+
+
+def _missing_runs(missing: List[bool]) -> List[Tuple[int, int]]:
+    """``[start, end)`` index ranges of consecutive missing lines."""
+    runs = []
+    start = None
+    for index, is_missing in enumerate(missing + [False]):
+        if is_missing and start is None:
+            start = index
+        elif not is_missing and start is not None:
+            runs.append((start, index))
+            start = None
+    return runs
+
+
+def _offsets(segments: List[List[Dict[str, str]]]):
+    offset = 0
+    for segment in segments:
+        yield offset, segment
+        offset += len(segment)
+
+
+async def generate_with_cache(client, scripts: List[Dict[str, str]], cache: RoundCache, concurrency: int,
+                              use_head_music: bool = False, use_tail_music: bool = False,
+                              encoding: str = "mp3", sample_rate: int = 24000,
+                              max_lines: Optional[int] = None, deadline=None,
+                              limit: Optional[SessionLimit] = None) -> List[PodcastRound]:
+    """Assemble the rounds of ``scripts``, generating only those not in ``cache``.
+
+    Consecutive missing lines are generated together in one session so they
+    keep their conversational context, further split at speaker turns into
+    sessions of ``max_lines`` lines when given. Sessions run in parallel, at
+    most ``concurrency`` at a time and each holding a slot of ``limit`` when
+    given. Returns the rounds in playback order.
+    """
+    audio_config = {"format": encoding, "sample_rate": sample_rate}
+    line_keys = [cache.key(line.get("speaker"), line.get("text"), audio_config) for line in scripts]
+    cached = [cache.get(key) for key in line_keys]
+    head = cache.get(cache.key(_HEAD, None, audio_config)) if use_head_music else None
+    tail = cache.get(cache.key(_TAIL, None, audio_config)) if use_tail_music else None
+
+    missing = [audio is None for audio in cached]
+    # Music only comes with a session, so a missing jingle regenerates the line next to it.
+    if use_head_music and head is None and scripts:
+        missing[0] = True
+    if use_tail_music and tail is None and scripts:
+        missing[-1] = True
+    runs = _missing_runs(missing)
+    if max_lines:
+        runs = [
+            (start + offset, start + offset + len(segment))
+            for start, end in runs
+            for offset, segment in _offsets(split_scripts(scripts[start:end], max_lines))
+        ]
+    logger.info(f"Round cache: {len(scripts) - sum(missing)}/{len(scripts)} lines cached, {len(runs)} sessions")
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def generate(start: int, end: int) -> List[PodcastRound]:
+        async with semaphore, limit or NO_LIMIT:
+            return await client.generate_rounds(
+                scripts[start:end],
+                encoding=encoding,
+                sample_rate=sample_rate,
+                use_head_music=use_head_music and start == 0 and head is None,
+                use_tail_music=use_tail_music and end == len(scripts) and tail is None,
+                deadline=deadline,
+            )
+
+    results = await asyncio.gather(*(generate(start, end) for start, end in runs))
+
+    lines: List[Optional[PodcastRound]] = [
+        None if audio is None else PodcastRound(round_id=index, speaker=line.get("speaker"),
+                                                text=line.get("text"), audio=audio)
+        for index, (line, audio) in enumerate(zip(scripts, cached))
+    ]
+    for (start, end), rounds in zip(runs, results):
+        spoken = [r for r in rounds if not r.is_music]
+        music = [r for r in rounds if r.is_music]
+        if len(spoken) != end - start:
+            raise RuntimeError(f"expected {end - start} rounds for lines {start}-{end - 1}, got {len(spoken)}")
+        for offset, r in enumerate(spoken):
+            r.round_id = start + offset
+            lines[start + offset] = r
+            cache.put(line_keys[start + offset], r.audio)
+        for r in music:
+            if r.round_id == HEAD_MUSIC_ROUND:
+                head = r.audio
+                cache.put(cache.key(_HEAD, None, audio_config), head)
+            elif r.round_id == TAIL_MUSIC_ROUND:
+                tail = r.audio
+                cache.put(cache.key(_TAIL, None, audio_config), tail)
+
+    assembled: List[PodcastRound] = []
+    if head is not None:
+        assembled.append(PodcastRound(round_id=HEAD_MUSIC_ROUND, audio=head))
+    assembled.extend(lines)
+    if tail is not None:
+        assembled.append(PodcastRound(round_id=TAIL_MUSIC_ROUND, audio=tail))
+    return assembled
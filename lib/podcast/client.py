@@ -5,12 +5,16 @@ import logging
 import os
 import time
 import uuid
-import websockets
+from dataclasses import dataclass, field
 from typing import List, Dict, Optional, Any
 
+from lib import tracing
+from lib.deadline import NO_DEADLINE, Deadline, DeadlineExceeded
+
 from .protocols import (
     EventType,
     MsgType,
+    cancel_session,
     finish_connection,
     finish_session,
     receive_message,
@@ -21,44 +25,137 @@ from .protocols import (
 
 logger = logging.getLogger("PodcastTTS")
 
-ENDPOINT = "wss://openspeech.bytedance.com/api/v3/sami/podcasttts"
+ENDPOINT = os.getenv("VOLC_PODCAST_ENDPOINT", "wss://openspeech.bytedance.com/api/v3/sami/podcasttts")
 DEFAULT_RESOURCE_ID = "volc.service_type.10050"
+# Longest silence tolerated between two server messages, in seconds.
+RECEIVE_TIMEOUT = float(os.getenv("VOLC_PODCAST_RECEIVE_TIMEOUT", 120))
+# Round ids the service uses for the intro and outro music.
+HEAD_MUSIC_ROUND = -1
+TAIL_MUSIC_ROUND = 9999
+
+
+@dataclass
+class PodcastRound:
+    """One finished round of a podcast session: a script line or a music jingle."""
+
+    round_id: int
+    speaker: Optional[str] = None
+    text: Optional[str] = None
+    audio: bytes = b""
+    info: Dict[str, Any] = field(default_factory=dict)  # PodcastRoundEnd payload
+    # Set instead of ``audio`` when the session wrote into an AudioSpool.
+    spool: Optional[Any] = None
+    spool_offset: int = 0
+    spool_size: int = 0
+
+    @property
+    def is_music(self) -> bool:
+        return self.round_id in (HEAD_MUSIC_ROUND, TAIL_MUSIC_ROUND)
+
+    def read_audio(self) -> bytes:
+        """The audio of this round, wherever it was stored."""
+        if self.spool is not None:
+            return self.spool.read(self.spool_offset, self.spool_size)
+        return self.audio
 
 
 class PodcastTTSClient:
-    def __init__(self, appid: str, access_token: str, cluster: str = DEFAULT_RESOURCE_ID):
+    def __init__(self, appid: str, access_token: str, cluster: str = DEFAULT_RESOURCE_ID,
+                 endpoint: Optional[str] = None):
         self.appid = appid
         self.access_token = access_token
         self.cluster = cluster
+        self.endpoint = endpoint or ENDPOINT
+        # Connect-to-SessionStarted time of the last session, in milliseconds.
+        self.handshake_ms: Optional[float] = None
+
+    def _headers(self, connect_id: str) -> Dict[str, str]:
+        return {
+            "X-Api-App-Id": self.appid,
+            "X-Api-App-Key": "aGjiRDfUWi",
+            "X-Api-Access-Key": self.access_token,
+            "X-Api-Resource-Id": self.cluster,
+            "X-Api-Connect-Id": connect_id,
+        }
+
+    async def warm_up(self, timeout: float = 10) -> float:
+        """Connect and complete the connection handshake without starting a session.
+
+        Resolves DNS and sets up TLS and the route through the upstream gateway
+        before the first real request needs them. Returns the handshake time in
+        milliseconds.
+        """
+        import websockets
+
+        started = time.perf_counter()
+        async with websockets.connect(self.endpoint, additional_headers=self._headers(str(uuid.uuid4())),
+                                      open_timeout=timeout) as websocket:
+            await start_connection(websocket)
+            await asyncio.wait_for(wait_for_event(websocket, MsgType.FullServerResponse, EventType.ConnectionStarted),
+                                   timeout=timeout)
+            elapsed = (time.perf_counter() - started) * 1000
+            await finish_connection(websocket)
+        return elapsed
 
     async def generate_audio(self, scripts: List[Dict[str, str]], 
                              action: int = 3, 
                              encoding: str = "mp3",
+                             sample_rate: int = 24000,
                              request_id: Optional[str] = None,
                              use_head_music: bool = False,
-                             use_tail_music: bool = False) -> bytes:
+                             use_tail_music: bool = False,
+                             deadline: Optional[Deadline] = None) -> bytes:
         """
         Generate podcast audio from scripts.
         
         Args:
             scripts: List of dicts with 'speaker' and 'text' keys.
             action: 3 for NLP texts (default based on requirement).
-            encoding: Audio format (mp3 or wav).
+            encoding: Audio format (mp3, ogg_opus or pcm).
+            sample_rate: Output sample rate in Hz.
             request_id: Unique identifier for the request.
+            deadline: Raise DeadlineExceeded instead of waiting past it.
             
         Returns:
             bytes: The generated audio data.
         """
+        rounds = await self.generate_rounds(scripts, action=action, encoding=encoding,
+                                            sample_rate=sample_rate, request_id=request_id,
+                                            use_head_music=use_head_music, use_tail_music=use_tail_music,
+                                            deadline=deadline)
+        return b"".join(r.audio for r in rounds)
+
+    async def generate_rounds(self, scripts: List[Dict[str, str]],
+                              action: int = 3,
+                              encoding: str = "mp3",
+                              sample_rate: int = 24000,
+                              request_id: Optional[str] = None,
+                              use_head_music: bool = False,
+                              use_tail_music: bool = False,
+                              deadline: Optional[Deadline] = None,
+                              sink=None) -> List[PodcastRound]:
+        """Like :meth:`generate_audio`, but keep the audio of every round separate.
+
+        Returns the finished rounds in playback order, music rounds included.
+        Cancelling the awaiting task sends ``CancelSession`` upstream before the
+        connection is closed. Every wait on the server is bounded by
+        RECEIVE_TIMEOUT and by ``deadline``.
+
+        With a ``sink`` (:class:`lib.podcast.spool.AudioSpool`) audio frames are
+        appended to it as they arrive, so the rounds are contiguous in the sink
+        and carry their ``spool_offset``/``spool_size`` instead of ``audio``.
+        """
+        import websockets
+
+        deadline = deadline or NO_DEADLINE
+
+        async def bounded(awaitable):
+            return await asyncio.wait_for(awaitable, timeout=deadline.timeout(RECEIVE_TIMEOUT))
+
         if not request_id:
             request_id = str(uuid.uuid4())
             
-        headers = {
-            "X-Api-App-Id": self.appid,
-            "X-Api-App-Key": "aGjiRDfUWi",
-            "X-Api-Access-Key": self.access_token,
-            "X-Api-Resource-Id": self.cluster,
-            "X-Api-Connect-Id": request_id,
-        }
+        headers = self._headers(request_id)
 
         # Request parameters
         req_params = {
@@ -73,53 +170,74 @@ class PodcastTTSClient:
             },
             "audio_config": {
                 "format": encoding,
-                "sample_rate": 24000,
+                "sample_rate": sample_rate,
                 "speech_rate": 0
             }
         }
 
-        podcast_audio = bytearray()
+        rounds: List[PodcastRound] = []
+        current: Optional[PodcastRound] = None
         audio = bytearray()
+        round_start = sink.size if sink is not None else 0  # sink offset of the current round
+        round_bytes = 0
         
         is_podcast_round_end = True
-        audio_received = False
         last_round_id = -1
         task_id = ""
         retry_num = 3
         
         while retry_num > 0:
             websocket = None
+            session_id = None
+            attempt_span = tracing.start_span("podcast.attempt", attempt=4 - retry_num,
+                                              resume_after_round=None if is_podcast_round_end else last_round_id)
+            span_token = tracing.attach(attempt_span)
+            round_span = tracing.NOOP_SPAN
             try:
-                websocket = await websockets.connect(ENDPOINT, additional_headers=headers)
+                started = time.perf_counter()
+                with tracing.span("podcast.connect"):
+                    websocket = await websockets.connect(self.endpoint, additional_headers=headers,
+                                                        open_timeout=deadline.timeout(10))
                 
+                # An unfinished round is generated again from its start.
+                audio.clear()
+                round_bytes = 0
+                if sink is not None:
+                    sink.truncate(round_start)
                 if not is_podcast_round_end:
                      req_params["retry_info"] = {
                         "retry_task_id": task_id,
                         "last_finished_round_id": last_round_id
                     }
 
-                # Start connection
-                await start_connection(websocket)
-                await wait_for_event(websocket, MsgType.FullServerResponse, EventType.ConnectionStarted)
+                with tracing.span("podcast.handshake"):
+                    # Start connection
+                    await start_connection(websocket)
+                    await bounded(wait_for_event(websocket, MsgType.FullServerResponse, EventType.ConnectionStarted))
 
-                session_id = str(uuid.uuid4())
-                if not task_id:
-                    task_id = session_id
-                
-                # Start session
-                await start_session(websocket, json.dumps(req_params).encode(), session_id)
-                await wait_for_event(websocket, MsgType.FullServerResponse, EventType.SessionStarted)
+                    session_id = str(uuid.uuid4())
+                    if not task_id:
+                        task_id = session_id
+
+                    # Start session
+                    await start_session(websocket, json.dumps(req_params).encode(), session_id)
+                    await bounded(wait_for_event(websocket, MsgType.FullServerResponse, EventType.SessionStarted))
+                self.handshake_ms = (time.perf_counter() - started) * 1000
                 
                 # Finish session (trigger processing)
                 await finish_session(websocket, session_id)
 
                 while True:
-                    msg = await receive_message(websocket)
+                    msg = await bounded(receive_message(websocket))
 
                     if msg.type == MsgType.AudioOnlyServer and msg.event == EventType.PodcastRoundResponse:
-                        if not audio_received and audio:
-                            audio_received = True
-                        audio.extend(msg.payload)
+                        if not round_bytes:
+                            round_span.event("first_audio")
+                        round_bytes += len(msg.payload)
+                        if sink is not None:
+                            sink.write(msg.payload)
+                        else:
+                            audio.extend(msg.payload)
                     
                     elif msg.type == MsgType.Error:
                         raise RuntimeError(f"Server error: {msg.payload.decode()}")
@@ -128,6 +246,10 @@ class PodcastTTSClient:
                         if msg.event == EventType.PodcastRoundStart:
                             data = json.loads(msg.payload.decode("utf-8"))
                             current_round = data.get("round_id")
+                            current = PodcastRound(round_id=current_round, speaker=data.get("speaker"),
+                                                   text=data.get("text"))
+                            round_span = tracing.start_span("podcast.round", round_id=current_round,
+                                                            speaker=data.get("speaker"))
                             is_podcast_round_end = False
                             logger.info(f"New round started: {data}")
                         
@@ -138,37 +260,63 @@ class PodcastTTSClient:
                             is_podcast_round_end = True
                             last_round_id = current_round if 'current_round' in locals() else -1
                             
-                            podcast_audio.extend(audio)
+                            if current is None:
+                                current = PodcastRound(round_id=last_round_id)
+                            if sink is not None:
+                                current.spool, current.spool_offset, current.spool_size = sink, round_start, round_bytes
+                                round_start = sink.size
+                            else:
+                                current.audio = bytes(audio)
+                            current.info = data
+                            round_span.set("audio_bytes", round_bytes)
+                            round_span.end()
+                            rounds.append(current)
+                            current = None
                             audio.clear()
+                            round_bytes = 0
                             
                     if msg.event == EventType.SessionFinished:
                         break
                 
-                if not audio_received and not podcast_audio:
-                     # If we finished but got no audio, check if we have accumulated podcast_audio
-                     # Logic check: audio_received flag seems to track if we got *any* chunk in current loop?
-                     # The original code logic for audio_received seems a bit weird: "if not audio_received and audio: audio_received = True" inside the loop. 
-                     # But basically if we have podcast_audio, we are good.
-                     pass
-
                 # Clean close
                 await finish_connection(websocket)
-                await wait_for_event(websocket, MsgType.FullServerResponse, EventType.ConnectionFinished)
+                await bounded(wait_for_event(websocket, MsgType.FullServerResponse, EventType.ConnectionFinished))
                 
                 if is_podcast_round_end:
-                    return bytes(podcast_audio)
+                    return rounds
                 else:
                     logger.warning(f"Podcast not finished, retrying. Last round: {last_round_id}")
+                    attempt_span.set("unfinished", True)
                     retry_num -= 1
-                    await asyncio.sleep(1)
+                    await asyncio.sleep(deadline.timeout(1))
 
+            except asyncio.CancelledError as e:
+                round_span.end(e)
+                attempt_span.end(e)
+                if websocket and session_id:
+                    try:
+                        # Frees the upstream session (and its quota) right away.
+                        await asyncio.wait_for(cancel_session(websocket, session_id), timeout=2)
+                    except Exception as e:
+                        logger.warning(f"Could not cancel podcast session {session_id}: {e}")
+                raise
+            except DeadlineExceeded as e:
+                round_span.end(e)
+                attempt_span.end(e)
+                raise
             except Exception as e:
+                round_span.end(e)
+                attempt_span.end(e)
+                if deadline.expired:
+                    raise DeadlineExceeded() from e
                 logger.error(f"Error in podcast generation: {e}")
                 retry_num -= 1
                 if retry_num <= 0:
                     raise
-                await asyncio.sleep(1)
+                await asyncio.sleep(deadline.timeout(1))
             finally:
+                tracing.detach(span_token)
+                attempt_span.end()
                 if websocket:
                     await websocket.close()
         
@@ -1,11 +1,14 @@
+from __future__ import annotations
+
 import io
 import logging
 import struct
 from dataclasses import dataclass
 from enum import IntEnum
-from typing import Callable, List
+from typing import TYPE_CHECKING, Callable, List
 
-import websockets
+if TYPE_CHECKING:  # websockets is only needed once a connection is opened
+    import websockets
 
 logger = logging.getLogger(__name__)
 
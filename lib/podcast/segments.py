@@ -0,0 +1,278 @@
+"""Split long podcast scripts into segments generated in parallel, and join the audio.
+
+A Volcano podcast session produces its rounds one after another, so a long
+script takes the sum of all rounds. :func:`split_scripts` cuts the script at
+speaker-turn boundaries, :func:`generate_segments` runs one session per segment
+under a concurrency limit, and :func:`join_audio` concatenates the results on
+frame boundaries. A :class:`SessionLimit` caps the sessions of all tasks of a
+process together.
+"""
+import asyncio
+import threading
+from collections import deque
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from .client import PodcastRound
+
+# Podcast formats that can be joined without re-encoding.
+JOINABLE_FORMATS = ("mp3", "pcm")
+
+_SAMPLE_WIDTH = 2  # 16-bit mono PCM
+
+# MPEG audio header tables, indexed by version id / layer id bits.
+_MP3_BITRATES = {
+    # MPEG-1 layer III
+    (3, 1): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    # MPEG-2 / 2.5 layer III
+    (2, 1): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (0, 1): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+class SessionLimit:
+    """Semaphore shared by the event loops of every podcast task in the process.
+
+    Each task runs its own loop on a scheduler thread, so an
+    :class:`asyncio.Semaphore` can't be shared between them. Waiters are
+    served first come, first served; a released slot is handed straight to
+    the next waiter.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self._active = 0
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._active < self.limit and not self._waiters:
+                self._active += 1
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = waiter not in self._waiters
+                if not granted:
+                    self._waiters.remove(waiter)
+            if granted:  # the slot arrived as the wait was cancelled
+                self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                loop, future = self._waiters.popleft()
+                try:
+                    loop.call_soon_threadsafe(_wake, future)
+                    return
+                except RuntimeError:  # that task's loop is gone
+                    continue
+            self._active -= 1
+
+    async def __aenter__(self) -> "SessionLimit":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.release()
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class _NoLimit:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return None
+
+
+NO_LIMIT = _NoLimit()
+
+
+def _turns(scripts: List[Dict[str, str]]) -> List[List[Dict[str, str]]]:
+    """Group consecutive lines of the same speaker into turns."""
+    turns: List[List[Dict[str, str]]] = []
+    for line in scripts:
+        if turns and turns[-1][-1].get("speaker") == line.get("speaker"):
+            turns[-1].append(line)
+        else:
+            turns.append([line])
+    return turns
+
+
+def split_scripts(scripts: List[Dict[str, str]], max_lines: int) -> List[List[Dict[str, str]]]:
+    """Split ``scripts`` into segments of at most ``max_lines`` lines each.
+
+    Cuts only happen where the speaker changes, so a single turn longer than
+    ``max_lines`` stays in one (larger) segment.
+    """
+    if max_lines < 1:
+        raise ValueError("max_lines must be at least 1")
+
+    segments: List[List[Dict[str, str]]] = []
+    current: List[Dict[str, str]] = []
+    for turn in _turns(scripts):
+        if current and len(current) + len(turn) > max_lines:
+            segments.append(current)
+            current = []
+        current.extend(turn)
+    if current:
+        segments.append(current)
+    return segments
+
+
+async def generate_segments(client, segments: List[List[Dict[str, str]]], concurrency: int,
+                            use_head_music: bool = False, use_tail_music: bool = False,
+                            spool_factory=None, limit: Optional[SessionLimit] = None,
+                            **kwargs) -> List[PodcastRound]:
+    """Generate every segment with ``client.generate_rounds``, at most ``concurrency`` at a time.
+
+    Each session also holds a slot of ``limit``, when given, for its duration.
+
+    Head music is only requested for the first segment and tail music only for
+    the last. Returns the rounds of all segments in playback order, with spoken
+    rounds renumbered by their line in the whole script. With ``spool_factory``
+    every segment writes its audio into a spool of its own (see the ``sink``
+    of ``generate_rounds``); the caller closes them.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    last = len(segments) - 1
+
+    async def generate(index: int, segment: List[Dict[str, str]]) -> List[PodcastRound]:
+        async with semaphore, limit or NO_LIMIT:
+            sink = {"sink": spool_factory()} if spool_factory is not None else {}
+            return await client.generate_rounds(
+                segment,
+                use_head_music=use_head_music and index == 0,
+                use_tail_music=use_tail_music and index == last,
+                **kwargs,
+                **sink,
+            )
+
+    results = await asyncio.gather(*(generate(i, s) for i, s in enumerate(segments)))
+    rounds: List[PodcastRound] = []
+    line = 0
+    for segment_rounds in results:
+        for r in segment_rounds:
+            if not r.is_music:
+                r.round_id = line
+                line += 1
+            rounds.append(r)
+    return rounds
+
+
+def audio_parts(parts: List[bytes], fmt: str) -> List[bytes]:
+    """Trim audio of separate sessions so the parts can be concatenated as one stream."""
+    if fmt == "pcm":
+        # Never split a sample across parts.
+        return [part[:len(part) - len(part) % _SAMPLE_WIDTH] for part in parts]
+    if fmt == "mp3":
+        return [_mp3_frames(part) for part in parts]
+    raise ValueError(f"cannot join {fmt} audio; request one of {', '.join(JOINABLE_FORMATS)}")
+
+
+def join_audio(parts: List[bytes], fmt: str) -> bytes:
+    """Concatenate segment audio of one format so it plays as a single stream."""
+    return b"".join(audio_parts(parts, fmt))
+
+
+def audio_positions(data: bytes, fmt: str, sample_rate: int, offsets: List[int]) -> Optional[List[float]]:
+    """Playback time in seconds at each byte offset of ``data`` (ascending offsets).
+
+    Works for raw PCM and MP3 streams; returns None for other formats. An MP3
+    frame counts towards the offset it starts before.
+    """
+    if fmt == "pcm":
+        return [offset / (_SAMPLE_WIDTH * sample_rate) for offset in offsets]
+    if fmt != "mp3":
+        return None
+
+    positions = []
+    frames = _mp3_frame_spans(data)
+    pending = next(frames, None)
+    seconds = 0.0
+    for offset in offsets:
+        while pending is not None and pending[0] < offset:
+            _, _, samples, rate = pending
+            seconds += samples / rate
+            pending = next(frames, None)
+        positions.append(seconds)
+    return positions
+
+
+def audio_duration(data: bytes, fmt: str, sample_rate: int) -> Optional[float]:
+    """Playback length in seconds of raw PCM or an MP3 stream, None for other formats."""
+    positions = audio_positions(data, fmt, sample_rate, [len(data)])
+    return positions[0] if positions else None
+
+
+def _mp3_frame_info(header: bytes) -> Optional[Tuple[int, int, int]]:
+    """``(frame bytes, samples, sample rate)`` of an MPEG layer III frame header."""
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = (header[1] >> 3) & 0x03
+    layer = (header[1] >> 1) & 0x03
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 0x03
+    padding = (header[2] >> 1) & 0x01
+    if version == 1 or (version, layer) not in _MP3_BITRATES or rate_index == 3 or bitrate_index in (0, 15):
+        return None
+    bitrate = _MP3_BITRATES[(version, layer)][bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+    samples = 1152 if version == 3 else 576
+    return samples // 8 * bitrate // sample_rate + padding, samples, sample_rate
+
+
+def _is_info_frame(frame: bytes) -> bool:
+    # The Xing/Info (or VBRI) frame carries no audio, only stream totals that
+    # would be wrong for the joined stream.
+    head = frame[:64]
+    return b"Xing" in head or b"Info" in head or b"VBRI" in head
+
+
+def _mp3_frame_spans(data: bytes) -> Iterator[Tuple[int, int, int, int]]:
+    """``(start, length, samples, sample rate)`` of each audio frame in ``data``.
+
+    ID3/APE tags, junk between frames and a leading Xing/Info frame are skipped.
+    """
+    pos = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        pos = 10 + size + (10 if data[5] & 0x10 else 0)
+
+    first = True
+    while pos + 4 <= len(data):
+        info = _mp3_frame_info(data[pos:pos + 4])
+        if info is None:
+            # Resynchronise on the next frame header (skips trailing tags and junk).
+            pos = data.find(b"\xff", pos + 1)
+            if pos < 0:
+                break
+            continue
+        length, samples, rate = info
+        if pos + length > len(data):
+            break  # truncated last frame
+        if not (first and _is_info_frame(data[pos:pos + length])):
+            yield pos, length, samples, rate
+        first = False
+        pos += length
+
+
+def _mp3_frames(data: bytes) -> bytes:
+    """The MPEG audio frames of ``data``, without ID3/APE tags and Xing/Info frames."""
+    view = memoryview(data)
+    return b"".join(view[start:start + length] for start, length, _, _ in _mp3_frame_spans(data))
@@ -0,0 +1,117 @@
+"""Append-only audio buffer that moves to a temporary file when it grows large.
+
+Podcast audio arrives as a stream of small frames. Writing them into one
+:class:`AudioSpool` keeps a single copy of the episode, in memory while it is
+short and in an anonymous temp file past ``max_memory`` bytes, instead of
+a bytearray per round, a bytes copy per round and a joined copy of them all.
+Finished audio is handed to result storage as a file object, read by the
+timeline code through :meth:`AudioSpool.buffer` without copying, and streamed
+into the transcoder with :meth:`AudioSpool.chunks`.
+"""
+import io
+import mmap
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, Optional, Union
+
+MAX_MEMORY = int(os.getenv("PODCAST_SPOOL_MAX_MEMORY", 8 * 1024 * 1024))
+# Where spilled audio goes; None is the platform temp directory.
+SPOOL_DIR = os.getenv("PODCAST_SPOOL_DIR") or None
+CHUNK_SIZE = 64 * 1024
+
+
+class AudioSpool:
+    def __init__(self, max_memory: Optional[int] = None):
+        self.max_memory = MAX_MEMORY if max_memory is None else max_memory
+        self._memory: Optional[bytearray] = bytearray()
+        self._file: Optional[BinaryIO] = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def spilled(self) -> bool:
+        return self._file is not None
+
+    def write(self, data: Union[bytes, bytearray, memoryview]) -> int:
+        if self._file is None and self._size + len(data) > self.max_memory:
+            self._file = tempfile.TemporaryFile(dir=SPOOL_DIR)
+            self._file.write(self._memory)
+            self._memory = None
+        if self._file is not None:
+            self._file.seek(self._size)
+            self._file.write(data)
+        else:
+            self._memory.extend(data)
+        self._size += len(data)
+        return len(data)
+
+    def truncate(self, size: int) -> None:
+        """Drop everything past ``size`` bytes, e.g. a round that is generated again."""
+        if size >= self._size:
+            return
+        if self._file is not None:
+            self._file.truncate(size)
+        else:
+            del self._memory[size:]
+        self._size = size
+
+    def overwrite(self, offset: int, data: Union[bytes, bytearray, memoryview]) -> None:
+        """Replace bytes already written, e.g. a header whose sizes are only known at the end."""
+        if offset + len(data) > self._size:
+            raise ValueError("overwrite past the end of the spool")
+        if self._file is not None:
+            self._file.seek(offset)
+            self._file.write(data)
+        else:
+            self._memory[offset:offset + len(data)] = data
+
+    def read(self, offset: int = 0, size: Optional[int] = None) -> bytes:
+        end = self._size if size is None else min(self._size, offset + size)
+        if self._file is None:
+            return bytes(self._memory[offset:end])
+        self._file.seek(offset)
+        return self._file.read(max(0, end - offset))
+
+    def chunks(self, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        for offset in range(0, self._size, chunk_size):
+            yield self.read(offset, chunk_size)
+
+    @contextmanager
+    def buffer(self) -> Iterator[Union[bytearray, mmap.mmap, bytes]]:
+        """The whole audio as a read-only bytes-like object (supports ``find``), without a copy."""
+        if self._file is None:
+            yield self._memory
+        elif self._size == 0:
+            yield b""
+        else:
+            self._file.flush()
+            with mmap.mmap(self._file.fileno(), self._size, access=mmap.ACCESS_READ) as view:
+                yield view
+
+    def reader(self) -> BinaryIO:
+        """File object reading the audio from the start, for :meth:`ResultStorage.put`."""
+        if self._file is None:
+            return io.BytesIO(self._memory)  # small by definition; a copy is cheap
+        self._file.flush()
+        self._file.seek(0)
+        return self._file
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._memory = bytearray()
+        self._size = 0
+
+    def __enter__(self) -> "AudioSpool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
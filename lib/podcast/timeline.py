@@ -0,0 +1,73 @@
+"""Round timeline and subtitles of a generated podcast.
+
+Every round's position in the final audio is known while the rounds are being
+joined, so players can seek by round and show captions without aligning the
+audio afterwards.
+"""
+from typing import Dict, List, Union
+
+from .client import PodcastRound
+from .segments import audio_positions
+
+SUBTITLE_FORMATS = ("srt", "vtt")
+
+
+def build_timeline(rounds: List[PodcastRound], parts: List[Union[bytes, int]], fmt: str, sample_rate: int,
+                   byte_offsets: bool = True, data=None) -> List[Dict]:
+    """Compact per-round entries: id, speaker, text and start/end seconds.
+
+    ``parts`` is the audio of each round exactly as it was joined, or just its
+    length when the joined audio is passed as ``data`` (any bytes-like object
+    with ``find``, e.g. an :class:`AudioSpool` buffer); rounds of one session may
+    split the stream anywhere. ``offset`` and ``size`` (bytes) are added when
+    ``byte_offsets`` is set, i.e. when the joined audio is returned without
+    transcoding. Times are left out for formats whose duration can't be derived
+    from the bytes.
+    """
+    boundaries = [0]
+    for part in parts:
+        boundaries.append(boundaries[-1] + (part if isinstance(part, int) else len(part)))
+    if data is None:
+        data = b"".join(parts)
+    times = audio_positions(data, fmt, sample_rate, boundaries)
+
+    timeline = []
+    for index, r in enumerate(rounds):
+        entry: Dict = {"round_id": r.round_id}
+        if r.speaker:
+            entry["speaker"] = r.speaker
+        if r.text:
+            entry["text"] = r.text
+        if times is not None:
+            entry["start"] = round(times[index], 3)
+            entry["end"] = round(times[index + 1], 3)
+        if byte_offsets:
+            entry["offset"] = boundaries[index]
+            entry["size"] = boundaries[index + 1] - boundaries[index]
+        timeline.append(entry)
+    return timeline
+
+
+def _timestamp(seconds: float, separator: str) -> str:
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600_000)
+    minutes, millis = divmod(millis, 60_000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millis:03d}"
+
+
+def render_subtitles(timeline: List[Dict], fmt: str) -> str:
+    """SRT or WebVTT captions for the spoken rounds of ``timeline``."""
+    if fmt not in SUBTITLE_FORMATS:
+        raise ValueError(f"subtitle format must be one of {', '.join(SUBTITLE_FORMATS)}")
+
+    separator = "," if fmt == "srt" else "."
+    blocks = ["WEBVTT"] if fmt == "vtt" else []
+    cues = [entry for entry in timeline if entry.get("text") and "start" in entry]
+    for index, entry in enumerate(cues, start=1):
+        text = entry["text"]
+        if fmt == "vtt" and entry.get("speaker"):
+            text = f"<v {entry['speaker']}>{text}"
+        timing = f"{_timestamp(entry['start'], separator)} --> {_timestamp(entry['end'], separator)}"
+        blocks.append(f"{index}\n{timing}\n{text}")
+    return "\n\n".join(blocks) + "\n"
@@ -0,0 +1,352 @@
+"""Opt-in CPU and memory profiling of live requests and tasks.
+
+A :class:`Capture` records where one thread spends its time: a single
+sampler thread reads the stack of every thread being profiled from
+``sys._current_frames()`` each ``PROFILE_INTERVAL_MS`` and counts the folded
+stacks (``outer;inner;leaf``), the input format of flamegraph.pl and
+speedscope. The profiled code is not slowed down beyond the sampling itself.
+
+Captures marked ``memory`` also measure the stages wrapped in :func:`memory`
+with :mod:`tracemalloc`: the traced peak during the stage and the lines that
+allocated what was still held at its end. tracemalloc only runs while such a
+stage does.
+
+The current capture lives in a :mod:`contextvars` variable, so background
+tasks queued by a profiled request are profiled too (see :func:`child`).
+Finished profiles are kept in Redis by :class:`ProfileStore`, shared by all
+workers.
+"""
+import contextvars
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+from lib import jsonio
+
+logger = logging.getLogger(__name__)
+
+INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", 5)) / 1000
+# Share of requests and tasks profiled without being asked to; their profiles
+# are kept only when they took at least SLOW_MS.
+SAMPLE_RATIO = float(os.getenv("PROFILE_SAMPLE_RATIO", 0))
+SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", 1000))
+MAX_DEPTH = 128
+MAX_STACKS = 500
+TOP_ALLOCATIONS = 15
+
+_current: contextvars.ContextVar[Optional["Capture"]] = contextvars.ContextVar("current_capture", default=None)
+_THIS_FILE = os.path.abspath(__file__)
+
+
+def _where(code) -> str:
+    path = code.co_filename.replace(os.sep, "/").rsplit("/", 2)
+    return f"{code.co_name} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+
+
+class Capture:
+    """Samples and memory measurements of one request or task."""
+
+    def __init__(self, name: str, explicit: bool = False, memory: bool = False, parent_id: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        # Asked for by a header or an armed capture; kept however fast it was.
+        self.explicit = explicit
+        self.memory = memory
+        self.parent_id = parent_id
+        self.started_at = time.time()
+        self.duration_ms: Optional[float] = None
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self.memory_stages: List[Dict] = []
+        self.attributes: Dict = {}
+        self.token: Optional[contextvars.Token] = None
+        self._start = time.perf_counter()
+
+    def sample(self, frame) -> None:
+        names = []
+        while frame is not None and len(names) < MAX_DEPTH:
+            names.append(_where(frame.f_code))
+            frame = frame.f_back
+        self.samples += 1
+        self.stacks[";".join(reversed(names))] += 1
+
+    def stop(self) -> None:
+        if self.duration_ms is None:
+            self.duration_ms = (time.perf_counter() - self._start) * 1000
+
+    @property
+    def slow(self) -> bool:
+        return self.duration_ms is not None and self.duration_ms >= SLOW_MS
+
+    def summary(self) -> Dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "parent_id": self.parent_id,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms or 0, 3),
+            "samples": self.samples,
+            "interval_ms": INTERVAL * 1000,
+            **self.attributes,
+        }
+
+    def to_dict(self) -> Dict:
+        return {
+            **self.summary(),
+            "stacks": dict(self.stacks.most_common(MAX_STACKS)),
+            "memory": self.memory_stages,
+        }
+
+
+class Sampler:
+    """One daemon thread sampling the stacks of every thread being profiled."""
+
+    def __init__(self, interval: float = INTERVAL):
+        self.interval = interval
+        self.pid = os.getpid()
+        self._active: Dict[int, Capture] = {}
+        self._lock = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def add(self, thread_id: int, capture: Capture) -> bool:
+        """Sample ``thread_id`` into ``capture``; False if the thread is already being profiled."""
+        with self._lock:
+            if thread_id in self._active:
+                return False
+            self._active[thread_id] = capture
+            self._lock.notify()
+            return True
+
+    def remove(self, thread_id: int) -> None:
+        with self._lock:
+            self._active.pop(thread_id, None)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                while not self._active:
+                    self._lock.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, capture in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        capture.sample(frame)
+            del frames
+
+
+_sampler_instance: Optional[Sampler] = None
+_sampler_lock = threading.Lock()
+
+
+def _sampler() -> Sampler:
+    global _sampler_instance
+    instance = _sampler_instance
+    if instance is None or instance.pid != os.getpid():  # threads don't survive a fork
+        with _sampler_lock:
+            if _sampler_instance is None or _sampler_instance.pid != os.getpid():
+                _sampler_instance = Sampler()
+            instance = _sampler_instance
+    return instance
+
+
+def current() -> Optional[Capture]:
+    return _current.get()
+
+
+def start(name: str, explicit: bool = False, memory: bool = False,
+          parent_id: Optional[str] = None) -> Optional[Capture]:
+    """Start profiling the calling thread and make the capture current.
+
+    Returns None when the thread is already being profiled. Pass the capture
+    to :func:`finish` on the same thread.
+    """
+    capture = Capture(name, explicit, memory, parent_id)
+    if not _sampler().add(threading.get_ident(), capture):
+        return None
+    capture.token = _current.set(capture)
+    return capture
+
+
+def finish(capture: Capture) -> Capture:
+    _sampler().remove(threading.get_ident())
+    capture.stop()
+    _current.reset(capture.token)
+    return capture
+
+
+def child(name: str) -> Optional[Capture]:
+    """Start a capture for a task: always when the request that queued it was
+    profiled (in the copied context), else with probability SAMPLE_RATIO."""
+    parent = _current.get()
+    if parent is not None:
+        return start(name, parent.explicit, parent.memory, parent.id)
+    if SAMPLE_RATIO and random.random() < SAMPLE_RATIO:
+        return start(name)
+    return None
+
+
+_tracemalloc_users = 0
+_tracemalloc_owned = False
+_tracemalloc_lock = threading.Lock()
+
+
+def _start_tracemalloc() -> None:
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(16)
+            _tracemalloc_owned = True
+        _tracemalloc_users += 1
+
+
+def _stop_tracemalloc() -> None:
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and _tracemalloc_owned:  # leave PYTHONTRACEMALLOC tracing alone
+            tracemalloc.stop()
+            _tracemalloc_owned = False
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, _THIS_FILE),
+    ))
+
+
+@contextmanager
+def memory(stage: str) -> Iterator[None]:
+    """Measure allocations of the block if the current capture asked for memory.
+
+    The peak is process-wide: stages running at the same time in other
+    threads add to it.
+    """
+    capture = _current.get()
+    if capture is None or not capture.memory:
+        yield
+        return
+    _start_tracemalloc()
+    try:
+        tracemalloc.reset_peak()
+        before = _snapshot()
+        started = time.perf_counter()
+        yield
+    finally:
+        try:
+            _, peak = tracemalloc.get_traced_memory()
+            after = _snapshot()
+            top = after.compare_to(before, "lineno")[:TOP_ALLOCATIONS]
+            capture.memory_stages.append({
+                "stage": stage,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+                "peak_bytes": peak,
+                "retained_bytes": sum(stat.size_diff for stat in after.compare_to(before, "filename")),
+                "top": [{"where": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                         "size_diff": stat.size_diff, "count_diff": stat.count_diff} for stat in top],
+            })
+        finally:
+            _stop_tracemalloc()
+
+
+def folded(profile: Dict) -> str:
+    """``stack count`` lines of a stored profile, for flamegraph.pl or speedscope."""
+    return "".join(f"{stack} {count}\n" for stack, count in profile.get("stacks", {}).items())
+
+
+class ProfileStore:
+    """Finished profiles and armed captures, shared by all workers through Redis.
+
+    ``arm`` asks every worker to profile its next requests; each worker looks
+    at the armed count at most every ``poll_interval`` seconds while nothing is
+    armed, so an idle store costs one GET per second per process.
+    """
+
+    INDEX_KEY = "profiles"
+    ARM_KEY = "profile_arm"
+    ARM_MEMORY_KEY = "profile_arm:memory"
+
+    def __init__(self, get_redis: Callable, keep: int = 100, ttl: int = 24 * 3600, poll_interval: float = 1.0):
+        self._get_redis = get_redis
+        self.keep = keep
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self._armed = False
+        self._memory = False
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def save(self, capture: Capture) -> None:
+        pipe = self._get_redis().pipeline(transaction=False)
+        pipe.setex(f"profile:{capture.id}", self.ttl, jsonio.dumps(capture.to_dict()))
+        pipe.lpush(self.INDEX_KEY, capture.id)
+        pipe.ltrim(self.INDEX_KEY, 0, self.keep - 1)
+        pipe.execute()
+
+    def recent(self, limit: int = 20, min_duration_ms: float = 0) -> List[Dict]:
+        """Summaries of the latest profiles, newest first, without their stacks."""
+        redis = self._get_redis()
+        ids = [i.decode() if isinstance(i, bytes) else i for i in redis.lrange(self.INDEX_KEY, 0, self.keep - 1)]
+        if not ids:
+            return []
+        summaries = []
+        for data in redis.mget([f"profile:{i}" for i in ids]):
+            if not data:
+                continue
+            profile = jsonio.loads(data)
+            if profile["duration_ms"] < min_duration_ms:
+                continue
+            profile.pop("stacks", None)
+            profile["memory"] = [{k: v for k, v in stage.items() if k != "top"} for stage in profile["memory"]]
+            summaries.append(profile)
+            if len(summaries) >= limit:
+                break
+        return summaries
+
+    def get(self, profile_id: str) -> Optional[Dict]:
+        data = self._get_redis().get(f"profile:{profile_id}")
+        return jsonio.loads(data) if data else None
+
+    def arm(self, requests: int, ttl: int, memory: bool = False) -> None:
+        pipe = self._get_redis().pipeline(transaction=False)
+        pipe.setex(self.ARM_KEY, ttl, requests)
+        pipe.setex(self.ARM_MEMORY_KEY, ttl, int(memory))
+        pipe.execute()
+
+    def disarm(self) -> None:
+        self._get_redis().delete(self.ARM_KEY, self.ARM_MEMORY_KEY)
+
+    def claim(self) -> Optional[bool]:
+        """Take one armed capture: None if nothing is armed, else whether it includes memory."""
+        with self._lock:
+            now = time.monotonic()
+            if not self._armed and now - self._checked_at < self.poll_interval:
+                return None
+            self._checked_at = now
+        try:
+            redis = self._get_redis()
+            if not self._armed:
+                armed, memory = redis.mget([self.ARM_KEY, self.ARM_MEMORY_KEY])
+                if not armed or int(armed) <= 0:
+                    return None
+                self._armed, self._memory = True, bool(int(memory or 0))
+            if redis.decr(self.ARM_KEY) < 0:  # used up, or expired and recreated by DECR
+                redis.delete(self.ARM_KEY)
+                self._armed = False
+                return None
+            return self._memory
+        except Exception as e:  # redis errors; profiling is best effort
+            logger.warning(f"Could not check armed profiles: {e}")
+            self._armed = False
+            return None
@@ -0,0 +1,135 @@
+"""Weighted, per-tenant fair scheduling of background synthesis work.
+
+Async endpoints used to start one thread per task, so a client flooding the
+service with batch jobs delayed everyone else's. :class:`FairScheduler` feeds a
+fixed pool of worker threads instead:
+
+* every job has a priority class; classes get turns in proportion to their
+  weight (``interactive=4,batch=1`` serves four interactive jobs per batch job
+  while both are waiting), and an idle class never blocks the other;
+* inside a class, tenants are served round-robin, so one tenant's backlog
+  does not delay another tenant's next job;
+* a tenant never runs more than ``tenant_limit`` jobs at once, or its own
+  entry in ``tenant_limits``.
+"""
+import contextvars
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = ("interactive", "batch")
+DEFAULT_WEIGHTS = {"interactive": 4, "batch": 1}
+
+
+def parse_weights(spec: Optional[str]) -> Dict[str, int]:
+    """Parse ``"interactive=4,batch=1"``; unknown classes raise ValueError."""
+    weights = dict(DEFAULT_WEIGHTS)
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition("=")
+        name = name.strip()
+        if name not in PRIORITIES:
+            raise ValueError(f"unknown priority class {name!r}")
+        weights[name] = max(1, int(value))
+    return weights
+
+
+@dataclass
+class Job:
+    fn: Callable
+    args: Tuple
+    tenant: str
+    priority: str
+    enqueued_at: float = field(default_factory=time.monotonic)
+    # Context of the submitting request (e.g. its trace), entered by the worker.
+    context: contextvars.Context = field(default_factory=contextvars.copy_context)
+
+
+class FairScheduler:
+    def __init__(self, workers: int = 32, weights: Optional[Dict[str, int]] = None, tenant_limit: int = 8,
+                 tenant_limits: Optional[Dict[str, int]] = None):
+        self.workers = max(1, workers)
+        self.weights = weights or dict(DEFAULT_WEIGHTS)
+        self.tenant_limit = max(1, tenant_limit)
+        self.tenant_limits = {tenant: max(1, limit) for tenant, limit in (tenant_limits or {}).items()}
+        # One turn per weight unit, e.g. [interactive x4, batch].
+        self._turns: List[str] = [p for p in PRIORITIES for _ in range(self.weights.get(p, 1))]
+        self._turn = 0
+        self._queues: Dict[str, "OrderedDict[str, Deque[Job]]"] = {p: OrderedDict() for p in PRIORITIES}
+        self._running: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._threads: List[threading.Thread] = []
+        self._idle = 0
+
+    def submit(self, fn: Callable, *args, tenant: str = "default", priority: str = "interactive") -> None:
+        """Queue ``fn(*args)`` for a worker thread."""
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of {', '.join(PRIORITIES)}")
+        with self._lock:
+            self._queues[priority].setdefault(tenant, deque()).append(Job(fn, args, tenant, priority))
+            if self._idle:
+                # Claimed here, so a burst of submits wakes distinct workers.
+                self._idle -= 1
+                self._ready.notify()
+            elif len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f"scheduler-{len(self._threads)}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "queued": {p: sum(len(q) for q in tenants.values()) for p, tenants in self._queues.items()},
+                "running": {tenant: count for tenant, count in self._running.items() if count},
+                "workers": len(self._threads),
+            }
+
+    def _pop_from(self, priority: str) -> Optional[Job]:
+        tenants = self._queues[priority]
+        for tenant in list(tenants):
+            if self._running.get(tenant, 0) >= self.tenant_limits.get(tenant, self.tenant_limit):
+                continue
+            queue = tenants.pop(tenant)
+            job = queue.popleft()
+            if queue:
+                tenants[tenant] = queue  # re-appended: this tenant goes last next time
+            return job
+        return None
+
+    def _next_job(self) -> Optional[Job]:
+        for offset in range(len(self._turns)):
+            priority = self._turns[(self._turn + offset) % len(self._turns)]
+            job = self._pop_from(priority)
+            if job is not None:
+                self._turn = (self._turn + offset + 1) % len(self._turns)
+                self._running[job.tenant] = self._running.get(job.tenant, 0) + 1
+                return job
+        return None
+
+    def _work(self) -> None:
+        while True:
+            with self._lock:
+                job = self._next_job()
+                while job is None:
+                    self._idle += 1
+                    self._ready.wait()
+                    job = self._next_job()
+            waited = time.monotonic() - job.enqueued_at
+            if waited > 1:
+                logger.info(f"{job.priority} job of {job.tenant} waited {waited:.1f}s in queue")
+            try:
+                job.context.run(job.fn, *job.args)
+            except Exception:
+                logger.exception(f"Background job {getattr(job.fn, '__name__', job.fn)} failed")
+            finally:
+                # This thread picks the next job itself, including ones of a
+                # tenant that was at its cap until now.
+                with self._lock:
+                    self._running[job.tenant] -= 1
@@ -0,0 +1,112 @@
+"""Process pool running the CPU-bound part of image stitching.
+
+Decoding, resizing and PNG compression hold the GIL, so on the request thread
+a stitch uses one core and stalls the other requests of its worker. A
+:class:`StitchPool` keeps a set of long-lived processes instead: every input
+image is decoded by its own job straight into its box of the canvas, then the
+canvas is compressed strip by strip in parallel.
+
+Inputs and the canvas live in shared memory; jobs only receive block names and
+offsets, and return nothing but the compressed strips.
+"""
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+from typing import List, Optional, Tuple
+
+from lib import tracing
+from lib.deadline import NO_DEADLINE, Deadline, DeadlineExceeded
+from lib.image import ImageLimits, assemble_png, encode_strip, paste_into, strip_rows
+
+logger = logging.getLogger(__name__)
+
+
+def _paste_job(inputs_name: str, offset: int, length: int, canvas_name: str, canvas_width: int,
+               box: Tuple[int, int, int, int], limits: ImageLimits) -> None:
+    inputs = SharedMemory(name=inputs_name)
+    canvas = SharedMemory(name=canvas_name)
+    try:
+        paste_into(canvas.buf, canvas_width, inputs.buf[offset:offset + length], box, limits)
+    finally:
+        inputs.close()
+        canvas.close()
+
+
+def _strip_job(canvas_name: str, width: int, y0: int, y1: int, last: bool) -> Tuple[bytes, int, int]:
+    canvas = SharedMemory(name=canvas_name)
+    try:
+        return encode_strip(canvas.buf, width, y0, y1, last)
+    finally:
+        canvas.close()
+
+
+class StitchPool:
+    def __init__(self, processes: int):
+        self.processes = max(1, processes)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Forking a threaded server process is unsafe; children are spawned
+                # once and reused for every stitch.
+                self._executor = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, jobs, deadline: Deadline) -> List:
+        executor = self._get_executor()
+        try:
+            futures = [executor.submit(*job) for job in jobs]
+        except BrokenProcessPool:
+            self.shutdown()  # a child died (e.g. OOM-killed); start over on the next stitch
+            raise
+        done, pending = wait(futures, timeout=deadline.timeout(), return_when=FIRST_EXCEPTION)
+        for future in pending:
+            future.cancel()
+        failed = [future for future in done if future.exception() is not None]
+        if failed:
+            if isinstance(failed[0].exception(), BrokenProcessPool):
+                self.shutdown()
+            raise failed[0].exception()
+        if pending:
+            raise DeadlineExceeded()
+        return [future.result() for future in futures]
+
+    def compose_png(self, inputs: List[bytes], canvas: Tuple[int, int], boxes: List[Tuple[int, int, int, int]],
+                    limits: ImageLimits, deadline: Optional[Deadline] = None) -> bytes:
+        deadline = deadline or NO_DEADLINE
+        width, height = canvas
+        offsets = [0]
+        for data in inputs:
+            offsets.append(offsets[-1] + len(data))
+
+        input_block = SharedMemory(create=True, size=max(1, offsets[-1]))
+        canvas_block = SharedMemory(create=True, size=width * height * 3)  # zero-filled: black background
+        try:
+            with tracing.span("stitch.decode", images=len(inputs), processes=self.processes):
+                for data, offset in zip(inputs, offsets):
+                    input_block.buf[offset:offset + len(data)] = data
+                self._run([(_paste_job, input_block.name, offsets[i], len(data), canvas_block.name, width, box,
+                            limits) for i, (data, box) in enumerate(zip(inputs, boxes))], deadline)
+
+            with tracing.span("stitch.encode", width=width, height=height, processes=self.processes) as span:
+                rows = strip_rows(width, height)
+                strips = self._run([(_strip_job, canvas_block.name, width, y0, y1, y1 == height)
+                                    for y0, y1 in rows], deadline)
+                png = assemble_png(width, height, strips)
+                span.set("png_bytes", len(png))
+            return png
+        finally:
+            for block in (input_block, canvas_block):
+                block.close()
+                block.unlink()
@@ -0,0 +1,42 @@
+from abc import ABC, abstractmethod
+from typing import BinaryIO, Iterator, Optional, Union
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+Payload = Union[bytes, bytearray, memoryview, BinaryIO]
+
+
+class ResultStorage(ABC):
+    """Blob store for task artifacts (audio, images).
+
+    Task records in Redis only keep the key an artifact was stored under; the
+    artifact itself lives in one of the backends implementing this interface.
+    """
+
+    @abstractmethod
+    def put(self, key: str, data: Payload, ttl: Optional[int] = None,
+            content_type: str = "application/octet-stream") -> None:
+        """Store ``data`` (bytes or a readable binary file object) under ``key``.
+
+        ``ttl`` is a retention hint in seconds; backends without native expiry
+        rely on their own pruning or on bucket lifecycle rules.
+        """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the whole artifact, or None if it does not exist or has expired."""
+
+    @abstractmethod
+    def iter_chunks(self, key: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Optional[Iterator[bytes]]:
+        """Return an iterator streaming the artifact, or None if it is missing."""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove the artifact; missing keys are ignored."""
+
+
+def read_payload(data: Payload) -> bytes:
+    """Materialize a payload for backends that need the full value in memory."""
+    if hasattr(data, "read"):
+        return data.read()
+    return bytes(data)
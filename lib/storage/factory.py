@@ -0,0 +1,49 @@
+import os
+from typing import Optional
+
+from .base import ResultStorage
+
+
+def create_storage(backend: Optional[str] = None, redis_client=None,
+                   default_ttl: Optional[int] = None) -> ResultStorage:
+    """Build the result storage backend selected by ``RESULT_STORAGE``.
+
+    Supported values are ``redis`` (default), ``filesystem`` and ``s3``; each
+    backend reads its own settings from the environment. The filesystem
+    backend needs ``RESULT_STORAGE_DIR``: a directory every worker and
+    replica shares, not a container-local temp dir that loses results.
+    """
+    backend = (backend or os.getenv("RESULT_STORAGE") or "redis").lower()
+
+    if backend == "filesystem":
+        from .filesystem import FilesystemStorage
+
+        root = os.getenv("RESULT_STORAGE_DIR")
+        if not root:
+            raise RuntimeError("filesystem result storage requires RESULT_STORAGE_DIR")
+        return FilesystemStorage(root, default_ttl=default_ttl)
+
+    if backend == "redis":
+        from .redis_backend import RedisStorage
+
+        if redis_client is None:
+            raise ValueError("redis result storage requires a redis client")
+        return RedisStorage(redis_client, default_ttl=default_ttl)
+
+    if backend == "s3":
+        from .s3 import S3Storage
+
+        missing = [name for name in ("S3_ENDPOINT_URL", "S3_BUCKET", "S3_ACCESS_KEY_ID", "S3_SECRET_ACCESS_KEY")
+                   if not os.getenv(name)]
+        if missing:
+            raise RuntimeError(f"s3 result storage requires {', '.join(missing)}")
+        return S3Storage(
+            endpoint_url=os.environ["S3_ENDPOINT_URL"],
+            bucket=os.environ["S3_BUCKET"],
+            access_key=os.environ["S3_ACCESS_KEY_ID"],
+            secret_key=os.environ["S3_SECRET_ACCESS_KEY"],
+            region=os.getenv("S3_REGION", "us-east-1"),
+            prefix=os.getenv("S3_PREFIX", ""),
+        )
+
+    raise ValueError(f"Unknown RESULT_STORAGE backend: {backend}")
@@ -0,0 +1,134 @@
+import hashlib
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Iterator, Optional
+
+from .base import DEFAULT_CHUNK_SIZE, Payload, ResultStorage
+
+# Expired files are swept at most this often, piggybacking on writes.
+PRUNE_INTERVAL = 600
+# Expiry recorded for files stored without any ttl.
+NO_EXPIRY = 100 * 365 * 24 * 3600
+
+
+class FilesystemStorage(ResultStorage):
+    """Store artifacts on a local or shared (NFS, etc.) filesystem.
+
+    Files are spread over two levels of hashed shard directories so no single
+    directory grows huge, written to a temporary file and atomically renamed
+    into place so readers never see partial data, and read through ``mmap`` so
+    serving a large artifact does not copy it into the Python heap at once.
+    A file's expiry time is recorded as its mtime.
+    """
+
+    def __init__(self, root: str, default_ttl: Optional[int] = None):
+        self.root = root
+        self.default_ttl = default_ttl
+        self._last_prune = 0.0
+        self._prune_lock = threading.Lock()
+
+    def path_for(self, key: str) -> str:
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        safe_name = key.replace("/", "_")
+        return os.path.join(self.root, digest[:2], digest[2:4], safe_name)
+
+    def put(self, key: str, data: Payload, ttl: Optional[int] = None,
+            content_type: str = "application/octet-stream") -> None:
+        path = self.path_for(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                if hasattr(data, "read"):
+                    shutil.copyfileobj(data, f, DEFAULT_CHUNK_SIZE)
+                else:
+                    f.write(data)
+            expires_at = time.time() + (ttl or self.default_ttl or NO_EXPIRY)
+            os.utime(tmp_path, (expires_at, expires_at))
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+        self._maybe_prune()
+
+    def _open_live(self, key: str):
+        path = self.path_for(key)
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        if os.fstat(f.fileno()).st_mtime < time.time():
+            f.close()
+            return None
+        return f
+
+    def get(self, key: str) -> Optional[bytes]:
+        f = self._open_live(key)
+        if f is None:
+            return None
+        with f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return mm[:]
+
+    def iter_chunks(self, key: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Optional[Iterator[bytes]]:
+        f = self._open_live(key)
+        if f is None:
+            return None
+
+        def chunks():
+            with f:
+                size = os.fstat(f.fileno()).st_size
+                if size == 0:
+                    return
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    for start in range(0, size, chunk_size):
+                        yield mm[start:start + chunk_size]
+
+        return chunks()
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.path_for(key))
+        except FileNotFoundError:
+            pass
+
+    def _maybe_prune(self) -> None:
+        now = time.time()
+        if now - self._last_prune < PRUNE_INTERVAL or not self._prune_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_prune = now
+            self.prune()
+        finally:
+            self._prune_lock.release()
+
+    def prune(self) -> int:
+        """Delete expired files; returns how many were removed."""
+        removed = 0
+        now = time.time()
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    mtime = os.stat(path).st_mtime
+                    # Temp files carry their creation time; leave in-progress writes alone.
+                    if name.startswith(".tmp-"):
+                        mtime += PRUNE_INTERVAL
+                    if mtime < now:
+                        os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    continue
+        return removed
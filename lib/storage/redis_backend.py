@@ -0,0 +1,43 @@
+from typing import Iterator, Optional
+
+from .base import DEFAULT_CHUNK_SIZE, Payload, ResultStorage, read_payload
+
+
+class RedisStorage(ResultStorage):
+    """Keep artifacts in Redis next to the task records (the historical behaviour)."""
+
+    def __init__(self, client, prefix: str = "result:", default_ttl: Optional[int] = None):
+        self.client = client
+        self.prefix = prefix
+        self.default_ttl = default_ttl
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def put(self, key: str, data: Payload, ttl: Optional[int] = None,
+            content_type: str = "application/octet-stream") -> None:
+        ttl = ttl or self.default_ttl
+        value = read_payload(data)
+        if ttl:
+            self.client.setex(self._key(key), ttl, value)
+        else:
+            self.client.set(self._key(key), value)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(self._key(key))
+
+    def iter_chunks(self, key: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Optional[Iterator[bytes]]:
+        redis_key = self._key(key)
+        size = self.client.strlen(redis_key)
+        if not size:
+            return None
+
+        def chunks():
+            # GETRANGE keeps each reply small instead of pulling the whole blob at once.
+            for start in range(0, size, chunk_size):
+                yield self.client.getrange(redis_key, start, start + chunk_size - 1)
+
+        return chunks()
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self._key(key))
@@ -0,0 +1,114 @@
+import datetime
+import hashlib
+import hmac
+from typing import Iterator, Optional
+from urllib.parse import quote, urlparse
+
+import requests
+
+from .base import DEFAULT_CHUNK_SIZE, Payload, ResultStorage
+
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+
+
+class S3Storage(ResultStorage):
+    """Store artifacts in any S3-compatible object store (AWS S3, MinIO, OSS, ...).
+
+    Requests are signed with AWS Signature V4 and use path-style addressing,
+    which every S3-compatible server accepts. S3 has no per-object TTL, so
+    retention has to be configured as a lifecycle rule on the bucket.
+    """
+
+    def __init__(self, endpoint_url: str, bucket: str, access_key: str, secret_key: str,
+                 region: str = "us-east-1", prefix: str = "", timeout: float = 30):
+        self.endpoint_url = endpoint_url.rstrip("/")
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.prefix = prefix
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def _path(self, key: str) -> str:
+        return quote(f"/{self.bucket}/{self.prefix}{key}", safe="/~")
+
+    def _signed_headers(self, method: str, path: str, payload_hash: str) -> dict:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        datestamp = now.strftime("%Y%m%d")
+        host = urlparse(self.endpoint_url).netloc
+
+        canonical_headers = f"host:{host}\nx-amz-content-sha256:{payload_hash}\nx-amz-date:{amz_date}\n"
+        signed_headers = "host;x-amz-content-sha256;x-amz-date"
+        canonical_request = "\n".join([method, path, "", canonical_headers, signed_headers, payload_hash])
+
+        scope = f"{datestamp}/{self.region}/s3/aws4_request"
+        string_to_sign = "\n".join([
+            "AWS4-HMAC-SHA256",
+            amz_date,
+            scope,
+            hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+        ])
+
+        signing_key = f"AWS4{self.secret_key}".encode("utf-8")
+        for part in (datestamp, self.region, "s3", "aws4_request"):
+            signing_key = hmac.new(signing_key, part.encode("utf-8"), hashlib.sha256).digest()
+        signature = hmac.new(signing_key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+
+        return {
+            "x-amz-date": amz_date,
+            "x-amz-content-sha256": payload_hash,
+            "Authorization": (
+                f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+                f"SignedHeaders={signed_headers}, Signature={signature}"
+            ),
+        }
+
+    def _request(self, method: str, key: str, data=None, payload_hash: str = UNSIGNED_PAYLOAD,
+                 extra_headers: Optional[dict] = None, stream: bool = False) -> requests.Response:
+        path = self._path(key)
+        headers = self._signed_headers(method, path, payload_hash)
+        if extra_headers:
+            headers.update(extra_headers)
+        return self.session.request(
+            method, f"{self.endpoint_url}{path}", data=data, headers=headers,
+            timeout=self.timeout, stream=stream,
+        )
+
+    def put(self, key: str, data: Payload, ttl: Optional[int] = None,
+            content_type: str = "application/octet-stream") -> None:
+        if hasattr(data, "read"):
+            # File objects are streamed unsigned rather than hashed up front.
+            payload_hash = UNSIGNED_PAYLOAD
+        else:
+            data = bytes(data)
+            payload_hash = hashlib.sha256(data).hexdigest()
+        response = self._request("PUT", key, data=data, payload_hash=payload_hash,
+                                 extra_headers={"Content-Type": content_type})
+        response.raise_for_status()
+
+    def get(self, key: str) -> Optional[bytes]:
+        response = self._request("GET", key)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.content
+
+    def iter_chunks(self, key: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Optional[Iterator[bytes]]:
+        response = self._request("GET", key, stream=True)
+        if response.status_code == 404:
+            response.close()
+            return None
+        response.raise_for_status()
+
+        def chunks():
+            with response:
+                yield from response.iter_content(chunk_size)
+
+        return chunks()
+
+    def delete(self, key: str) -> None:
+        response = self._request("DELETE", key)
+        if response.status_code != 404:
+            response.raise_for_status()
@@ -0,0 +1,257 @@
+"""Lightweight request tracing with OpenTelemetry-compatible output.
+
+Spans form a tree per request: the HTTP route, the Redis round trips it makes,
+the upstream calls and, through the scheduler, the background task it queued.
+The current span lives in a :mod:`contextvars` variable, so it follows asyncio
+tasks and is copied into scheduled jobs. Incoming ``traceparent`` headers (W3C
+Trace Context) are continued.
+
+Finished spans are batched by a background thread and written as OTLP/JSON
+``ExportTraceServiceRequest`` documents, either POSTed to a collector
+(``TRACE_EXPORT=http://collector:4318/v1/traces``) or appended to a file, one
+document per line (``TRACE_EXPORT=file:///var/log/misc-api/traces.jsonl``).
+Tracing is off, and :func:`span` costs next to nothing, when ``TRACE_EXPORT``
+is unset.
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "misc-api")
+EXPORT = os.getenv("TRACE_EXPORT", "")
+SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", 1))
+enabled = bool(EXPORT)
+
+_BATCH_SIZE = 512
+_FLUSH_INTERVAL = 1.0
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "sampled", "start_ns", "end_ns", "attributes",
+                 "events", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool,
+                 attributes: Optional[Dict] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.events: List[tuple] = []
+        self.error: Optional[str] = None
+
+    def set(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def event(self, name: str, **attributes) -> None:
+        self.events.append((time.time_ns(), name, attributes))
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        if self.sampled:
+            _exporter().add(self)
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+class _NoopSpan:
+    traceparent = None
+
+    def set(self, key, value):
+        pass
+
+    def event(self, name, **attributes):
+        pass
+
+    def end(self, error=None):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def start_span(name: str, traceparent: Optional[str] = None, **attributes):
+    """Start a child of the current span, or of ``traceparent``, or a new trace.
+
+    The span is not made current; see :func:`span` and :func:`attach`.
+    """
+    if not enabled:
+        return NOOP_SPAN
+    parent = _current.get()
+    if parent is not None:
+        return Span(name, parent.trace_id, parent.span_id, parent.sampled, attributes)
+    match = _TRACEPARENT.match(traceparent or "")
+    if match:
+        trace_id, parent_id, flags = match.groups()
+        return Span(name, trace_id, parent_id, bool(int(flags, 16) & 1), attributes)
+    return Span(name, "%032x" % random.getrandbits(128), None, random.random() < SAMPLE_RATIO, attributes)
+
+
+def attach(span) -> Optional[contextvars.Token]:
+    """Make ``span`` current; pass the returned token to :func:`detach`."""
+    if span is NOOP_SPAN:
+        return None
+    return _current.set(span)
+
+
+def detach(token: Optional[contextvars.Token]) -> None:
+    if token is not None:
+        _current.reset(token)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator:
+    """Run the block in a child span of the current one; exceptions mark it failed."""
+    if not enabled:
+        yield NOOP_SPAN
+        return
+    current = start_span(name, **attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.end(e)
+        raise
+    finally:
+        _current.reset(token)
+        current.end()
+
+
+def traced(name: str):
+    """Decorator running every call of the function in a span called ``name``."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _value(value) -> Dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _attributes(attributes: Dict) -> List[Dict]:
+    return [{"key": key, "value": _value(value)} for key, value in attributes.items() if value is not None]
+
+
+def to_otlp(spans: List[Span]) -> Dict:
+    """OTLP/JSON ExportTraceServiceRequest of ``spans``."""
+    records = []
+    for s in spans:
+        record = {
+            "traceId": s.trace_id,
+            "spanId": s.span_id,
+            "name": s.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns),
+            "attributes": _attributes(s.attributes),
+            "status": {"code": 2, "message": s.error} if s.error else {"code": 0},
+        }
+        if s.parent_id:
+            record["parentSpanId"] = s.parent_id
+        if s.events:
+            record["events"] = [{"timeUnixNano": str(t), "name": name, "attributes": _attributes(attrs)}
+                                for t, name, attrs in s.events]
+        records.append(record)
+    return {"resourceSpans": [{
+        "resource": {"attributes": _attributes({"service.name": SERVICE_NAME, "process.pid": os.getpid()})},
+        "scopeSpans": [{"scope": {"name": "misc-api"}, "spans": records}],
+    }]}
+
+
+class Exporter:
+    """Batches finished spans and writes them to ``target`` from a daemon thread."""
+
+    def __init__(self, target: str):
+        self.target = target
+        self.pid = os.getpid()
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=10 * _BATCH_SIZE)
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def add(self, finished: Span) -> None:
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:  # the collector is down or slow; tracing must not block requests
+            pass
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + _FLUSH_INTERVAL
+            while len(batch) < _BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self.write(batch)
+            except Exception as e:
+                logger.warning(f"Could not export {len(batch)} spans: {e}")
+
+    def write(self, batch: List[Span]) -> None:
+        document = to_otlp(batch)
+        if self.target.startswith("http://") or self.target.startswith("https://"):
+            import requests
+
+            requests.post(self.target, json=document, timeout=5).raise_for_status()
+            return
+        path = self.target[len("file://"):] if self.target.startswith("file://") else self.target
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(document) + "\n")
+
+
+_exporter_instance: Optional[Exporter] = None
+_exporter_lock = threading.Lock()
+
+
+def _exporter() -> Exporter:
+    global _exporter_instance
+    instance = _exporter_instance
+    if instance is None or instance.pid != os.getpid():  # threads don't survive a fork
+        with _exporter_lock:
+            if _exporter_instance is None or _exporter_instance.pid != os.getpid():
+                _exporter_instance = Exporter(EXPORT)
+            instance = _exporter_instance
+    return instance
@@ -0,0 +1,195 @@
+"""Latency-aware routing of single-speaker TTS requests over several providers.
+
+Every :class:`Provider` wraps one backend's ``synthesize`` (DashScope
+CosyVoice, Volcano Engine, ...) and knows which of our voices it can speak,
+under which of its own names. :class:`Router` keeps per-process health of each
+provider: a moving average of its first package delay and its recent
+failures. Requests go to the fastest healthy provider that has the voice and
+fail over to the next one on errors. A provider that just failed is ranked
+after the others, and after ``failure_threshold`` failures in a row it is only
+a last resort for ``cooldown`` seconds. A provider last used more than
+``probe_interval`` seconds ago gets the next request, so one that was slow or
+failing once is not avoided forever.
+"""
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Collection, Dict, List, Optional, Tuple
+
+from lib import tracing
+from lib.cancellation import TaskCancelled
+from lib.deadline import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+FAILURE_THRESHOLD = int(os.getenv("TTS_FAILURE_THRESHOLD", 3))
+COOLDOWN = float(os.getenv("TTS_FAILURE_COOLDOWN", 30))
+PROBE_INTERVAL = float(os.getenv("TTS_PROBE_INTERVAL", 60))
+# Weight of the newest sample in the latency average.
+LATENCY_ALPHA = 0.3
+
+
+class NoProviderError(RuntimeError):
+    """No configured provider can speak the voice with the requested options."""
+
+
+def parse_voice_map(spec: Optional[str]) -> Dict[str, str]:
+    """Parse ``"libai_v2=zh_male_a,longxiaochun=zh_female_b"`` into ``{voice: provider voice}``."""
+    voices = {}
+    for item in (spec or "").split(","):
+        voice, sep, target = item.partition("=")
+        if not sep:
+            if item.strip():
+                raise ValueError(f"Invalid voice mapping {item!r}; expected voice=provider_voice")
+            continue
+        voices[voice.strip()] = target.strip()
+    return voices
+
+
+@dataclass
+class Synthesis:
+    audio: bytes
+    request_id: str
+    first_package_delay: int
+    provider: str
+    voice: str  # the provider's name of the voice
+
+
+class Provider:
+    """A TTS backend.
+
+    ``synthesize(text, voice, model, audio_options, cancellation, deadline, **kwargs)``
+    returns ``(audio, request_id, first_package_delay_ms)`` like
+    ``server.synthesize``. ``voices`` maps our voice names to the provider's;
+    None passes every voice through as is. ``options`` lists the optional
+    request parameters the provider understands; None accepts all of them.
+    """
+
+    def __init__(self, name: str, synthesize: Callable[..., Tuple[bytes, str, int]],
+                 voices: Optional[Dict[str, str]] = None, options: Optional[Collection[str]] = None):
+        self.name = name
+        self.synthesize = synthesize
+        self.voices = voices
+        self.options = options
+
+    def voice_for(self, voice: str) -> Optional[str]:
+        return voice if self.voices is None else self.voices.get(voice)
+
+    def accepts(self, kwargs: Dict) -> bool:
+        return self.options is None or all(key in self.options for key in kwargs)
+
+
+@dataclass
+class ProviderHealth:
+    requests: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    latency_ms: Optional[float] = None
+    checked_at: Optional[float] = None  # monotonic time of the last success or failure
+    open_until: float = 0.0  # skipped until then after too many failures
+    last_error: Optional[str] = None
+
+
+class Router:
+    def __init__(self, providers: List[Provider], failure_threshold: int = FAILURE_THRESHOLD,
+                 cooldown: float = COOLDOWN, probe_interval: float = PROBE_INTERVAL,
+                 clock: Callable[[], float] = time.monotonic):
+        self.providers = providers
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.probe_interval = probe_interval
+        self._clock = clock
+        self._health: Dict[str, ProviderHealth] = {p.name: ProviderHealth() for p in providers}
+        self._lock = threading.Lock()
+
+    def candidates(self, voice: str, kwargs: Optional[Dict] = None) -> List[Provider]:
+        """Providers able to serve the request, best first.
+
+        Providers in cooldown come last rather than not at all: trying one is
+        better than failing a request outright.
+        """
+        now = self._clock()
+        ranked = []
+        with self._lock:
+            for index, provider in enumerate(self.providers):
+                if provider.voice_for(voice) is None or not provider.accepts(kwargs or {}):
+                    continue
+                health = self._health[provider.name]
+                cooling = health.open_until > now
+                stale = health.checked_at is None or now - health.checked_at > self.probe_interval
+                failing = health.consecutive_failures > 0 and not stale
+                latency = 0.0 if stale or health.latency_ms is None else health.latency_ms
+                ranked.append((cooling, failing, latency, index, provider))
+        ranked.sort(key=lambda entry: entry[:4])
+        return [entry[-1] for entry in ranked]
+
+    def synthesize(self, text: str, voice: str, model: str, audio_options=None, cancellation=None,
+                   deadline=None, **kwargs) -> Synthesis:
+        candidates = self.candidates(voice, kwargs)
+        if not candidates:
+            raise NoProviderError(f"No TTS provider for voice {voice!r} with options {sorted(kwargs)}")
+
+        error: Optional[Exception] = None
+        with tracing.span("tts.route", voice=voice, candidates=len(candidates)) as span:
+            for provider in candidates:
+                provider_voice = provider.voice_for(voice)
+                started = self._clock()
+                try:
+                    audio, request_id, first_package_delay = provider.synthesize(
+                        text, provider_voice, model, audio_options=audio_options, cancellation=cancellation,
+                        deadline=deadline, **kwargs
+                    )
+                except TaskCancelled:
+                    raise
+                except Exception as e:
+                    self._record_failure(provider, e)
+                    if isinstance(e, DeadlineExceeded):
+                        raise  # no time left to try another provider
+                    if error is not None:
+                        e.__context__ = error
+                    error = e
+                    logger.warning(f"TTS provider {provider.name} failed, trying the next one: {e}")
+                    continue
+                latency = first_package_delay or (self._clock() - started) * 1000
+                self._record_success(provider, latency)
+                span.set("provider", provider.name)
+                span.set("failovers", candidates.index(provider))
+                return Synthesis(audio, request_id, first_package_delay, provider.name, provider_voice)
+        raise error
+
+    def _record_success(self, provider: Provider, latency_ms: float) -> None:
+        with self._lock:
+            health = self._health[provider.name]
+            health.requests += 1
+            health.consecutive_failures = 0
+            health.open_until = 0.0
+            if health.latency_ms is None:
+                health.latency_ms = latency_ms
+            else:
+                health.latency_ms += LATENCY_ALPHA * (latency_ms - health.latency_ms)
+            health.checked_at = self._clock()
+
+    def _record_failure(self, provider: Provider, error: Exception) -> None:
+        with self._lock:
+            health = self._health[provider.name]
+            health.requests += 1
+            health.failures += 1
+            health.consecutive_failures += 1
+            health.last_error = str(error)
+            health.checked_at = self._clock()
+            if health.consecutive_failures >= self.failure_threshold:
+                health.open_until = self._clock() + self.cooldown
+
+    def stats(self) -> Dict:
+        now = self._clock()
+        with self._lock:
+            stats = {}
+            for name, health in self._health.items():
+                values = asdict(health)
+                values["available"] = health.open_until <= now
+                values.pop("open_until")
+                values.pop("checked_at")
+                stats[name] = values
+            return stats
@@ -0,0 +1,139 @@
+"""Volcano Engine single-speaker TTS over the bidirectional websocket API.
+
+Uses the same binary framing as the podcast API (``lib/podcast/protocols.py``):
+StartConnection, StartSession with the speaker and audio parameters, one
+TaskRequest carrying the text, FinishSession, then audio frames until
+SessionFinished.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Dict, Optional, Tuple
+
+from lib import tracing
+from lib.deadline import NO_DEADLINE, Deadline, DeadlineExceeded
+from lib.podcast.protocols import (
+    EventType,
+    MsgType,
+    cancel_session,
+    finish_connection,
+    finish_session,
+    receive_message,
+    start_connection,
+    start_session,
+    task_request,
+    wait_for_event,
+)
+
+logger = logging.getLogger(__name__)
+
+ENDPOINT = os.getenv("VOLC_TTS_ENDPOINT", "wss://openspeech.bytedance.com/api/v3/tts/bidirection")
+RESOURCE_ID = os.getenv("VOLC_TTS_RESOURCE_ID", "seed-tts-1.0")
+# Longest silence tolerated between two server messages, in seconds.
+RECEIVE_TIMEOUT = float(os.getenv("VOLC_TTS_RECEIVE_TIMEOUT", 30))
+NAMESPACE = "BidirectionalTTS"
+
+
+def speech_params(volume: Optional[float] = None, speech_rate: Optional[float] = None) -> Dict[str, int]:
+    """Map DashScope's ``volume`` (0-100, 50 normal) and ``speech_rate`` (0.5-2.0)
+    onto Volcano's ``loudness_rate`` / ``speech_rate`` (-50-100, 0 normal)."""
+    params = {}
+    if speech_rate is not None:
+        params["speech_rate"] = max(-50, min(100, round((float(speech_rate) - 1) * 100)))
+    if volume is not None:
+        params["loudness_rate"] = max(-50, min(100, round((float(volume) - 50) * 2)))
+    return params
+
+
+class VolcanoTTSClient:
+    def __init__(self, appid: str, access_token: str, resource_id: Optional[str] = None,
+                 endpoint: Optional[str] = None):
+        self.appid = appid
+        self.access_token = access_token
+        self.resource_id = resource_id or RESOURCE_ID
+        self.endpoint = endpoint or ENDPOINT
+
+    async def synthesize(self, text: str, speaker: str, encoding: str = "mp3", sample_rate: int = 24000,
+                         deadline: Optional[Deadline] = None, **params) -> Tuple[bytes, str, int]:
+        """Synthesize ``text`` with ``speaker``; returns audio, the connect id and the
+        first package delay in milliseconds, like DashScope's synthesizer.
+
+        ``params`` go into ``audio_params`` (see :func:`speech_params`).
+        Cancelling the awaiting task sends ``CancelSession`` upstream.
+        """
+        import websockets
+
+        deadline = deadline or NO_DEADLINE
+
+        async def bounded(awaitable):
+            return await asyncio.wait_for(awaitable, timeout=deadline.timeout(RECEIVE_TIMEOUT))
+
+        connect_id = str(uuid.uuid4())
+        headers = {
+            "X-Api-App-Id": self.appid,
+            "X-Api-Access-Key": self.access_token,
+            "X-Api-Resource-Id": self.resource_id,
+            "X-Api-Connect-Id": connect_id,
+        }
+        req_params = {
+            "speaker": speaker,
+            "audio_params": {"format": encoding, "sample_rate": sample_rate, **params},
+        }
+        request = {"user": {"uid": connect_id}, "namespace": NAMESPACE, "req_params": req_params}
+
+        audio = bytearray()
+        first_package_delay = 0
+        websocket = None
+        session_id = str(uuid.uuid4())
+        started = time.perf_counter()
+        with tracing.span("volcano.synthesize", speaker=speaker, characters=len(text)) as span:
+            try:
+                websocket = await websockets.connect(self.endpoint, additional_headers=headers,
+                                                     open_timeout=deadline.timeout(10))
+                await start_connection(websocket)
+                await bounded(wait_for_event(websocket, MsgType.FullServerResponse, EventType.ConnectionStarted))
+                await start_session(websocket, json.dumps({**request, "event": EventType.StartSession}).encode(),
+                                    session_id)
+                await bounded(wait_for_event(websocket, MsgType.FullServerResponse, EventType.SessionStarted))
+                task = {**request, "event": EventType.TaskRequest, "req_params": {**req_params, "text": text}}
+                await task_request(websocket, json.dumps(task).encode(), session_id)
+                await finish_session(websocket, session_id)
+
+                while True:
+                    msg = await bounded(receive_message(websocket))
+                    if msg.type == MsgType.AudioOnlyServer and msg.event == EventType.TTSResponse:
+                        if not audio:
+                            first_package_delay = int((time.perf_counter() - started) * 1000)
+                        audio.extend(msg.payload)
+                    elif msg.type == MsgType.Error:
+                        raise RuntimeError(f"Server error: {msg.payload.decode()}")
+                    elif msg.event == EventType.SessionFailed:
+                        raise RuntimeError(f"Session failed: {msg.payload.decode()}")
+                    elif msg.event == EventType.SessionFinished:
+                        break
+
+                await finish_connection(websocket)
+                await bounded(wait_for_event(websocket, MsgType.FullServerResponse, EventType.ConnectionFinished))
+            except asyncio.CancelledError:
+                if websocket is not None:
+                    try:
+                        await asyncio.wait_for(cancel_session(websocket, session_id), timeout=2)
+                    except Exception as e:
+                        logger.warning(f"Could not cancel TTS session {session_id}: {e}")
+                raise
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                if deadline.expired:
+                    raise DeadlineExceeded() from e
+                raise
+            finally:
+                if websocket is not None:
+                    await websocket.close()
+
+            span.set("first_package_delay_ms", first_package_delay)
+            span.set("audio_bytes", len(audio))
+        return bytes(audio), connect_id, first_package_delay
@@ -0,0 +1,153 @@
+"""Warm-up of upstream connections and hot voices, with cold-start metrics.
+
+A fresh worker pays for DNS lookups, TLS handshakes, SDK setup and upstream
+voice loading on its first requests; users see it as a high
+``first_package_delay`` or a slow podcast handshake. :class:`Warmer` runs a
+set of named warm-up targets when the worker starts and again every
+``interval`` seconds, so connections and upstream caches stay primed while
+traffic is low.
+
+It also keeps per-process metrics of real traffic for the same keys
+(:meth:`Warmer.observe`): how many requests there were, how many of them were
+served cold (before any warm-up of their key succeeded) and their latencies.
+Keys that keep showing cold requests are the ones to add to the warm-up list.
+"""
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Optional
+
+from lib import tracing
+
+logger = logging.getLogger(__name__)
+
+# Bound on distinct observed keys, e.g. voices requested by clients.
+MAX_KEYS = 256
+
+
+def parse_voices(spec: Optional[str], default_model: str):
+    """Parse ``"libai_v2,cosyvoice-v1:longxiaochun"`` into ``(model, voice)`` pairs."""
+    voices = []
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        model, _, voice = item.rpartition(":")
+        voices.append((model or default_model, voice))
+    return voices
+
+
+@dataclass
+class TargetStats:
+    runs: int = 0
+    failures: int = 0
+    # Latency reported by the target (e.g. first package delay), else its run time.
+    first_ms: Optional[float] = None
+    last_ms: Optional[float] = None
+    last_run_at: Optional[float] = None
+    last_error: Optional[str] = None
+
+
+@dataclass
+class TrafficStats:
+    requests: int = 0
+    cold_requests: int = 0
+    cold_ms: Optional[float] = None
+    total_ms: float = 0.0
+
+    def as_dict(self) -> Dict:
+        values = asdict(self)
+        total = values.pop("total_ms")
+        values["avg_ms"] = round(total / self.requests, 3) if self.requests else None
+        return values
+
+
+class Warmer:
+    """Runs warm-up ``targets`` (name -> callable returning a latency in ms or None)."""
+
+    def __init__(self, targets: Dict[str, Callable[[], Optional[float]]], interval: float = 0):
+        self.targets = targets
+        self.interval = interval
+        self._stats: Dict[str, TargetStats] = {name: TargetStats() for name in targets}
+        self._traffic: Dict[str, TrafficStats] = {}
+        self._warm = set()
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> None:
+        for name, target in self.targets.items():
+            started = time.perf_counter()
+            error = None
+            with tracing.span("warmup", target=name) as span:
+                try:
+                    latency = target()
+                except Exception as e:
+                    error = e
+                    latency = None
+                    span.set("error", str(e))
+            if latency is None:
+                latency = (time.perf_counter() - started) * 1000
+            with self._lock:
+                stats = self._stats[name]
+                stats.runs += 1
+                stats.last_run_at = time.time()
+                if error is not None:
+                    stats.failures += 1
+                    stats.last_error = str(error)
+                    logger.warning(f"Warm-up of {name} failed: {error}")
+                    continue
+                stats.last_ms = round(latency, 3)
+                if stats.first_ms is None:
+                    stats.first_ms = stats.last_ms
+                self._warm.add(name)
+        self._ready.set()
+
+    def start(self, wait: float = 0) -> None:
+        """Warm up in a daemon thread, repeating every ``interval`` seconds when set.
+
+        Blocks up to ``wait`` seconds for the first round, so a worker can hold
+        off taking traffic until it is warm.
+        """
+        if self._thread is None and self.targets:
+            self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+            self._thread.start()
+        if wait > 0 and not self._ready.wait(wait):
+            logger.warning(f"Warm-up still running after {wait}s; serving anyway")
+
+    def _run(self) -> None:
+        while True:
+            self.run_once()
+            if self.interval <= 0:
+                return
+            time.sleep(self.interval)
+
+    def observe(self, key: str, latency_ms: Optional[float]) -> None:
+        """Record a real request for ``key``; the first one before a warm-up counts as cold."""
+        if latency_ms is None:
+            return
+        with self._lock:
+            traffic = self._traffic.get(key)
+            if traffic is None:
+                if len(self._traffic) >= MAX_KEYS:
+                    return
+                traffic = self._traffic[key] = TrafficStats()
+            if key not in self._warm:
+                # The first request warmed the key for the ones after it.
+                traffic.cold_requests += 1
+                traffic.cold_ms = round(latency_ms, 3)
+                self._warm.add(key)
+            traffic.requests += 1
+            traffic.total_ms += latency_ms
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "ready": self._ready.is_set(),
+                "interval": self.interval,
+                "targets": {name: asdict(stats) for name, stats in self._stats.items()},
+                "traffic": {key: traffic.as_dict() for key, traffic in self._traffic.items()},
+            }
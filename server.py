@@ -6,51 +6,830 @@ Payload: {"text": "要转换的文本", "voice": "音色(可选)"}
 Response: {"voice_b64": "base64编码的音频数据", "request_id": "...", "first_package_delay_ms": 123}
 """
 import base64
+import functools
+import hashlib
+import hmac
 import os
-from typing import Tuple, List
-from io import BytesIO
-
-from flask import Flask, jsonify, request
-import dashscope
-from dashscope.audio.tts_v2 import SpeechSynthesizer
-import requests
-from PIL import Image
+import random
+from typing import Tuple, List, Optional
+
+from flask import Blueprint, Flask, Response, g, jsonify, request, url_for
 import asyncio
 import threading
 import json
+import logging
+import math
 import time
 import uuid
-import redis
+from lib.audio import (
+    PODCAST_FORMATS,
+    WAV_HEADER_SIZE,
+    AudioOptions,
+    dashscope_format,
+    dashscope_source_format,
+    needs_transcode,
+    patch_wav_header,
+    podcast_source_format,
+    transcode,
+    transcode_stream,
+)
+from lib.cancellation import CancellationRegistry, TaskCancelled
+from lib.deadline import NO_DEADLINE, Deadline, DeadlineExceeded
+from lib import compression, jsonio, lifecycle, profiling, tracing
+from lib.image import ImageLimits, ImageRejected, stitch_images as stitch_image_bytes
 from lib.podcast.client import PodcastTTSClient
+from lib.stitch_pool import StitchPool
+from lib.warmup import Warmer, parse_voices
+from lib.scheduler import PRIORITIES, FairScheduler, parse_weights
+from lib.podcast.cache import RoundCache, generate_with_cache
+from lib.podcast.segments import JOINABLE_FORMATS, SessionLimit, audio_parts, generate_segments, split_scripts
+from lib.podcast.spool import AudioSpool
+from lib.podcast.timeline import SUBTITLE_FORMATS, build_timeline, render_subtitles
+from lib.tts.routing import NoProviderError, Provider, Router, parse_voice_map
+from lib.tts.volcano import VolcanoTTSClient, speech_params
 
-# Resolve and validate the dashscope API key early so we can return a clearer error
-# instead of a TypeError from the SDK when it tries to concat None.
-_resolved_api_key = os.getenv("DASHSCOPE_API_KEY") or dashscope.api_key
-if not _resolved_api_key:
-    raise RuntimeError("DASHSCOPE_API_KEY is not set; please export it for the service to start.")
-dashscope.api_key = _resolved_api_key
+# Heavy SDKs (dashscope, PIL, requests, redis) are imported on first use so
+# that importing this module and booting a worker stay cheap, and so that a
+# deployment only pays for the features it enables.
 
-app = Flask(__name__)
+cosyvoice_bp = Blueprint("cosyvoice", __name__)
+podcast_bp = Blueprint("podcast", __name__)
+image_bp = Blueprint("image", __name__)
+tasks_bp = Blueprint("tasks", __name__)
+admin_bp = Blueprint("admin", __name__)
 
 DEFAULT_MODEL = "cosyvoice-v2"
 DEFAULT_VOICE = "libai_v2"
 
+_dashscope_api_key = os.getenv("DASHSCOPE_API_KEY")
 _volc_appid = os.getenv("VOLC_APPID")
 _volc_access_token = os.getenv("VOLC_ACCESS_TOKEN")
 
 _redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-redis_client = redis.from_url(_redis_url)
 REDIS_TTL = 7 * 24 * 3600  # 7 days
+# Records carrying audio are large, so they expire sooner than task metadata.
+RESULT_TTL = int(os.getenv("RESULT_TTL", 24 * 3600))
+
+# Audio results above RESULT_INLINE_MAX_BYTES, or above RESULT_SPILL_MIN_BYTES
+# while Redis is past REDIS_MEMORY_HIGH_WATERMARK of its maxmemory, are written
+# to the result storage backend (RESULT_STORAGE) and only a pointer is kept in
+# the task record.
+RESULT_INLINE_MAX_BYTES = int(os.getenv("RESULT_INLINE_MAX_BYTES", 256 * 1024))
+RESULT_SPILL_MIN_BYTES = int(os.getenv("RESULT_SPILL_MIN_BYTES", 64 * 1024))
+REDIS_MEMORY_HIGH_WATERMARK = float(os.getenv("REDIS_MEMORY_HIGH_WATERMARK", 0.75))
+_MEMORY_CHECK_INTERVAL = 30
+_memory_state = {"checked_at": 0.0, "under_pressure": False}
+_memory_lock = threading.Lock()
+# How long an identical payload keeps coalescing onto the same in-flight task.
+# Should comfortably cover the slowest generation; the key is dropped as soon
+# as the task finishes.
+INFLIGHT_TTL = int(os.getenv("INFLIGHT_TTL", 3600))
+TASK_KINDS = ("cosyvoice", "podcast", "stitch")
+# Background synthesis runs on a shared pool of SCHEDULER_WORKERS threads per
+# process. Priority classes share it by SCHEDULER_WEIGHTS, tenants round-robin
+# within a class and run at most TENANT_MAX_CONCURRENCY tasks each. The default
+# tenant holds every caller without a mapped key, so it may use all workers.
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", 32))
+SCHEDULER_WEIGHTS = parse_weights(os.getenv("SCHEDULER_WEIGHTS"))
+TENANT_MAX_CONCURRENCY = int(os.getenv("TENANT_MAX_CONCURRENCY", 8))
+# {"<api key>": {"tenant": "...", "priority": "interactive" | "batch",
+#                "tenant_header": bool, "priority_override": bool}}, matched
+# against the X-API-Key header or an "Authorization: Bearer" token. The last two
+# let a trusted key (e.g. a gateway) pick the tenant via X-Tenant-Id and raise
+# the priority from the request body.
+TENANT_API_KEYS = json.loads(os.getenv("TENANT_API_KEYS") or "{}")
+DEFAULT_TENANT = "default"
+# Default time budget (seconds) of synchronous requests and of async tasks
+# (0: none). Clients shorten it with a "timeout" field / X-Request-Timeout
+# header, or pass an absolute X-Request-Deadline (unix time).
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", 300))
+TASK_TIMEOUT = float(os.getenv("TASK_TIMEOUT", 0))
+IMAGE_FETCH_TIMEOUT = 10
+# Per-input byte and pixel limits and the largest stitched output; together
+# they bound the memory of one stitch request.
+IMAGE_LIMITS = ImageLimits(
+    max_bytes=int(os.getenv("IMAGE_MAX_BYTES", 20 * 1024 * 1024)),
+    max_pixels=int(os.getenv("IMAGE_MAX_PIXELS", 40_000_000)),
+    max_output_pixels=int(os.getenv("STITCH_MAX_PIXELS", 100_000_000)),
+)
+# Processes decoding and encoding stitched images (0: on the request thread).
+STITCH_PROCESSES = int(os.getenv("STITCH_PROCESSES", os.cpu_count() or 1))
+# How often running workers check whether their task was cancelled (seconds).
+CANCEL_POLL_INTERVAL = float(os.getenv("CANCEL_POLL_INTERVAL", 1))
+# Opt-in parallel podcast generation ("parallel": true): scripts are cut at
+# speaker turns into segments of about PODCAST_SEGMENT_LINES lines, and at most
+# PODCAST_SEGMENT_CONCURRENCY Volcano sessions run at once per task, and at most
+# PODCAST_SESSION_LIMIT across all tasks of the process.
+PODCAST_SEGMENT_LINES = int(os.getenv("PODCAST_SEGMENT_LINES", 8))
+PODCAST_SEGMENT_CONCURRENCY = int(os.getenv("PODCAST_SEGMENT_CONCURRENCY", 4))
+PODCAST_SESSION_LIMIT = int(os.getenv("PODCAST_SESSION_LIMIT", 16))
+# Retention of per-round podcast audio in result storage; 0 disables the cache.
+# With the cache on, only lines whose (speaker, text, audio config) were not
+# generated before are sent upstream.
+PODCAST_ROUND_CACHE_TTL = int(os.getenv("PODCAST_ROUND_CACHE_TTL", 0))
+# Upper bound on ids per bulk status request, keeping a single MGET reasonable.
+MAX_BULK_TASK_IDS = int(os.getenv("MAX_BULK_TASK_IDS", 1000))
+FINISHED_STATUSES = ("success", "failed", "cancelled")
+# Fields never returned by the bulk status endpoint, and left out of the status
+# copy of each record it reads; fetch the task itself for results.
+_RESULT_FIELDS = ("voice_b64", "voice_ref", "image_ref", "timeline", "subtitles")
+# Base64 audio and images barely shrink, so task results carrying them are sent uncompressed.
+_MEDIA_FIELDS = ("voice_b64", "voice_ref", "image_b64", "image_ref")
+
+
+def _env_flag(name: str, default: bool = True) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() not in ("0", "false", "no", "off", "")
+
+
+# Per-feature switches; single-purpose deployments turn the others off.
+ENABLE_COSYVOICE = _env_flag("ENABLE_COSYVOICE")
+ENABLE_PODCAST = _env_flag("ENABLE_PODCAST")
+ENABLE_IMAGE = _env_flag("ENABLE_IMAGE")
+# Profiling of live traffic (lib/profiling.py); header triggers and the
+# /admin endpoints also need ADMIN_TOKEN.
+ENABLE_PROFILING = _env_flag("ENABLE_PROFILING", False)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", 100))
+PROFILE_TTL = int(os.getenv("PROFILE_TTL", 24 * 3600))
+MAX_PROFILED_REQUESTS = 1000
+# Warm-up of upstream connections and hot voices at worker start (lib/warmup.py).
+ENABLE_WARMUP = _env_flag("ENABLE_WARMUP", False)
+WARMUP_VOICES = parse_voices(os.getenv("WARMUP_VOICES"), DEFAULT_MODEL)
+WARMUP_PODCAST_SPEAKERS = [s.strip() for s in os.getenv("WARMUP_PODCAST_SPEAKERS", "").split(",") if s.strip()]
+WARMUP_TEXT = os.getenv("WARMUP_TEXT", "你好。")
+WARMUP_INTERVAL = float(os.getenv("WARMUP_INTERVAL", 0))
+WARMUP_WAIT = float(os.getenv("WARMUP_WAIT", 30))
+WARMUP_TIMEOUT = 30
+# Providers serving /v1/voice/cosyvoice, tried by latency and health (lib/tts/routing.py).
+# Volcano only speaks the voices mapped in TTS_VOICE_MAP ("our_voice=volcano_speaker,...").
+TTS_PROVIDERS = [p.strip() for p in os.getenv("TTS_PROVIDERS", "dashscope,volcano").split(",") if p.strip()]
+TTS_VOICE_MAP = parse_voice_map(os.getenv("TTS_VOICE_MAP"))
+VOLCANO_TTS_OPTIONS = ("volume", "speech_rate")
+
+_clients = {}
+_clients_lock = threading.RLock()
+
+
+def _lazy_client(name: str, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = factory()
+    return client
+
+
+def _create_redis():
+    import redis
+
+    # A blocking pool makes bursts wait for a free connection instead of failing
+    # with "Too many connections" or opening an unbounded number of sockets.
+    return redis.from_url(
+        _redis_url,
+        connection_pool_class=redis.BlockingConnectionPool,
+        max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", 32)),
+        timeout=float(os.getenv("REDIS_POOL_TIMEOUT", 5)),
+        socket_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", 5)),
+        socket_connect_timeout=float(os.getenv("REDIS_CONNECT_TIMEOUT", 2)),
+        health_check_interval=30,
+    )
+
+
+def get_redis():
+    """Process-wide Redis client, created on first use."""
+    return _lazy_client("redis", _create_redis)
+
+
+def get_result_storage():
+    """Result storage backend selected by RESULT_STORAGE, created on first use."""
+    from lib.storage.factory import create_storage
+
+    return _lazy_client("result_storage", lambda: create_storage(redis_client=get_redis(), default_ttl=RESULT_TTL))
+
+
+def get_scheduler() -> FairScheduler:
+    """Process-wide scheduler feeding the background synthesis threads."""
+    return _lazy_client("scheduler", lambda: FairScheduler(SCHEDULER_WORKERS, SCHEDULER_WEIGHTS,
+                                                           TENANT_MAX_CONCURRENCY,
+                                                           {DEFAULT_TENANT: SCHEDULER_WORKERS}))
+
+
+def get_cancellations() -> CancellationRegistry:
+    """Watcher of the cancel keys of tasks running in this process."""
+    return _lazy_client("cancellations", lambda: CancellationRegistry(get_redis, CANCEL_POLL_INTERVAL))
+
+
+def get_profiles() -> profiling.ProfileStore:
+    """Profiles of this deployment and the armed-capture counter, kept in Redis."""
+    return _lazy_client("profiles", lambda: profiling.ProfileStore(get_redis, PROFILE_KEEP, PROFILE_TTL))
+
+
+def get_heartbeats() -> lifecycle.Heartbeats:
+    """Heartbeats of the tasks queued or running in this process."""
+    return _lazy_client("heartbeats", lambda: lifecycle.Heartbeats(get_redis))
+
+
+def get_task_metrics() -> lifecycle.TaskMetrics:
+    """Queue and run durations of the tasks finished by this process."""
+    return _lazy_client("task_metrics", lifecycle.TaskMetrics)
+
+
+def get_reaper() -> lifecycle.Reaper:
+    """Reaper of tasks whose worker was lost, re-queueing them in this process."""
+    return _lazy_client("reaper", lambda: lifecycle.Reaper(get_redis, _requeue_task, REDIS_TTL,
+                                                           metrics=get_task_metrics()))
+
+
+def get_tts_router() -> Router:
+    """Router of single-speaker TTS requests over the configured providers."""
+    return _lazy_client("tts_router", _create_tts_router)
+
+
+def get_warmer() -> Warmer:
+    """Warm-up targets of this worker and its cold-start metrics."""
+    return _lazy_client("warmer", lambda: Warmer(_warmup_targets() if ENABLE_WARMUP else {}, WARMUP_INTERVAL))
+
+
+def get_stitch_pool() -> Optional[StitchPool]:
+    """Process pool of this worker for stitch jobs, or None when STITCH_PROCESSES is 0."""
+    if STITCH_PROCESSES <= 0:
+        return None
+    return _lazy_client("stitch_pool", lambda: StitchPool(STITCH_PROCESSES))
+
+
+def get_podcast_sessions() -> SessionLimit:
+    """Process-wide cap on parallel podcast sessions, shared by every task."""
+    return _lazy_client("podcast_sessions", lambda: SessionLimit(PODCAST_SESSION_LIMIT))
+
+
+def _resolve_dashscope_api_key() -> Optional[str]:
+    if _dashscope_api_key:
+        return _dashscope_api_key
+    # Only import the SDK to look for a key configured some other way.
+    import dashscope
+
+    return dashscope.api_key
+
+
+def _configure_dashscope():
+    import dashscope
+
+    # Resolve the key ourselves so a missing key gives a clearer error than
+    # the TypeError the SDK raises when it tries to concat None.
+    dashscope.api_key = _resolve_dashscope_api_key()
+    if not dashscope.api_key:
+        raise RuntimeError("DASHSCOPE_API_KEY is not set")
+    return dashscope
+
+
+def reset_clients() -> None:
+    """Forget clients created in this process, e.g. in a gunicorn master before fork.
+
+    Sockets and locks must not be shared between forked workers; each worker
+    rebuilds its own clients on first use.
+    """
+    with _clients_lock:
+        for name in [name for name in _clients if name != "app"]:
+            del _clients[name]
+    _memory_state["checked_at"] = 0.0
+
+
+def preload_sdks() -> None:
+    """Import the SDKs of the enabled features up front.
+
+    Called in a preloading gunicorn master so the modules are loaded once and
+    shared copy-on-write by every worker, instead of each worker importing
+    them on its first request.
+    """
+    import redis  # noqa: F401
+
+    if ENABLE_COSYVOICE:
+        import dashscope.audio.tts_v2  # noqa: F401
+    if ENABLE_PODCAST:
+        import websockets  # noqa: F401
+    if ENABLE_IMAGE:
+        import PIL.Image  # noqa: F401
+        import requests  # noqa: F401
+
+
+def __getattr__(name):
+    # Backwards compatible module attributes, resolved lazily.
+    if name == "redis_client":
+        return get_redis()
+    if name == "app":
+        return _lazy_client("app", create_app)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _payload_fingerprint(params: dict) -> str:
+    """Stable hash of the parameters that determine a task's output."""
+    canonical = json.dumps(params, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _task_in_progress(kind: str, task_id: str) -> bool:
+    data = get_redis().get(f"{kind}_task:{task_id}")
+    if not data:
+        return True  # reserved, its record is about to be created
+    return jsonio.loads(data).get("status") == "processing"
+
+
+# Replace the holder of KEYS[1] only if it is still ARGV[1], so one of several
+# concurrent takeovers of a stale reservation wins.
+_COMPARE_AND_SET = """-- compare-and-set
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    redis.call("SET", KEYS[1], ARGV[2], "EX", ARGV[3])
+    return 1
+end
+return 0
+"""
+
+
+def _compare_and_set(key: str, expected: bytes, value: str, ttl: int) -> bool:
+    script = _lazy_client("compare_and_set", lambda: get_redis().register_script(_COMPARE_AND_SET))
+    return bool(script(keys=[key], args=[expected, value, ttl]))
+
+
+@tracing.traced("redis.reserve_task")
+def _reserve_task(kind: str, fingerprint: str) -> Tuple[str, bool]:
+    """Reserve a task id for a submission, reusing an existing one for duplicates.
+
+    A client supplied ``Idempotency-Key`` header always maps to the task created by
+    its first use. Independently, identical payloads are coalesced onto the task
+    that is still generating them. Reservations are atomic ``SET NX``, and a
+    finished holder is replaced by compare-and-set, so concurrent duplicates
+    across workers agree on a single task.
+
+    Returns ``(task_id, created)``; ``created`` is False for a duplicate.
+    """
+    task_id = str(uuid.uuid4())
+
+    idempotency_key = (request.headers.get("Idempotency-Key") or "").strip()
+    idempotency_redis_key = f"{kind}_idempotency:{idempotency_key}" if idempotency_key else None
+    if idempotency_redis_key and not get_redis().set(idempotency_redis_key, task_id, nx=True, ex=REDIS_TTL):
+        existing = get_redis().get(idempotency_redis_key)
+        if existing:
+            return existing.decode("utf-8"), False
+
+    inflight_key = f"{kind}_inflight:{fingerprint}"
+    # Every pass that does not return lost a race to another submission, which
+    # then holds the key; the next pass coalesces onto it.
+    while not get_redis().set(inflight_key, task_id, nx=True, ex=INFLIGHT_TTL):
+        existing = get_redis().get(inflight_key)
+        if not existing:
+            continue  # released in the meantime
+        existing_id = existing.decode("utf-8")
+        if _task_in_progress(kind, existing_id):
+            if idempotency_redis_key:
+                get_redis().set(idempotency_redis_key, existing_id, ex=REDIS_TTL)
+            return existing_id, False
+        # The previous holder finished or died without releasing the key.
+        if _compare_and_set(inflight_key, existing, task_id, INFLIGHT_TTL):
+            break
+
+    return task_id, True
+
+
+def _request_deadline(payload: dict, default: float) -> Deadline:
+    """Earliest of the client's deadline/timeout and ``default`` seconds from now.
+
+    Raises ValueError for malformed values.
+    """
+    candidates = []
+    if default:
+        candidates.append(time.time() + default)
+
+    timeout = payload.get("timeout", request.headers.get("X-Request-Timeout"))
+    if timeout is not None:
+        try:
+            timeout = float(timeout)
+        except (TypeError, ValueError):
+            timeout = 0
+        if timeout <= 0:
+            raise ValueError("parameter 'timeout' must be a positive number of seconds")
+        candidates.append(time.time() + timeout)
+
+    header = request.headers.get("X-Request-Deadline")
+    if header:
+        try:
+            candidates.append(float(header))
+        except ValueError:
+            raise ValueError("header 'X-Request-Deadline' must be a unix timestamp")
+
+    return Deadline(min(candidates) if candidates else None)
+
 
+def _scheduling_class(payload: dict) -> Tuple[str, str]:
+    """``(tenant, priority)`` of a submission, raising ValueError for an unknown priority.
+
+    The tenant and default priority come from the API key mapping. Callers
+    only pick their tenant (``X-Tenant-Id``) or raise their priority (body
+    ``priority``) when their key allows it; anyone may lower it to batch.
+    """
+    api_key = request.headers.get("X-API-Key") or ""
+    authorization = request.headers.get("Authorization") or ""
+    if not api_key and authorization.lower().startswith("bearer "):
+        api_key = authorization[7:].strip()
+    mapping = TENANT_API_KEYS.get(api_key, {}) if api_key else {}
+
+    tenant = mapping.get("tenant") or DEFAULT_TENANT
+    if mapping.get("tenant_header"):
+        tenant = (request.headers.get("X-Tenant-Id") or "").strip() or tenant
+    priority = mapping.get("priority") or "interactive"
+    requested = payload.get("priority")
+    if requested and requested not in PRIORITIES:
+        raise ValueError(f"parameter 'priority' must be one of {', '.join(PRIORITIES)}")
+    if requested == "batch" or (requested and mapping.get("priority_override")):
+        priority = requested
+    return tenant, priority
+
+
+def _redis_under_memory_pressure() -> bool:
+    """Whether Redis is close to maxmemory; sampled at most every 30 seconds."""
+    with _memory_lock:
+        now = time.time()
+        if now - _memory_state["checked_at"] < _MEMORY_CHECK_INTERVAL:
+            return _memory_state["under_pressure"]
+        _memory_state["checked_at"] = now
+        try:
+            info = get_redis().info("memory")
+            maxmemory = int(info.get("maxmemory") or 0)
+            used = int(info.get("used_memory") or 0)
+            _memory_state["under_pressure"] = bool(maxmemory) and used / maxmemory >= REDIS_MEMORY_HIGH_WATERMARK
+        except Exception as e:  # redis errors; the check is best effort
+            logging.warning(f"Could not read Redis memory info: {e}")
+        return _memory_state["under_pressure"]
+
+
+def _should_offload(size: int) -> bool:
+    if size > RESULT_INLINE_MAX_BYTES:
+        return True
+    return size >= RESULT_SPILL_MIN_BYTES and _redis_under_memory_pressure()
+
+
+def _audio_result_fields(kind: str, task_id: str, audio) -> dict:
+    """Fields describing an audio result (bytes or an AudioSpool): inline base64, or a pointer into result storage."""
+    spooled = isinstance(audio, AudioSpool)
+    if not _should_offload(len(audio)):
+        return {"voice_b64": base64.b64encode(audio.read() if spooled else audio).decode("ascii")}
+
+    ref = f"{kind}/{task_id}"
+    # Spooled audio is streamed to storage from its buffer or temp file.
+    get_result_storage().put(ref, audio.reader() if spooled else audio, ttl=RESULT_TTL)
+    return {"voice_ref": ref}
+
+
+def _write_record(pipe, kind: str, task_id: str, ttl: int, record: dict) -> None:
+    """Queue writes of a task record and of its status copy without results, see :func:`bulk_task_status`."""
+    pipe.setex(f"{kind}_task:{task_id}", ttl, jsonio.dumps(record))
+    status = {field: value for field, value in record.items() if field not in _RESULT_FIELDS}
+    pipe.set(lifecycle.status_key(kind, task_id), jsonio.dumps(status), ex=ttl)
+
+
+@tracing.traced("redis.create_task")
+def _create_task(run: lifecycle.TaskRun, params: Optional[dict] = None) -> None:
+    """Store a new task's queued record, index it for the reaper and start its heartbeat, in one round trip.
+
+    ``params`` are kept so the reaper can queue the task again if its worker is lost.
+    """
+    heartbeat_key = lifecycle.heartbeat_key(run.kind, run.task_id)
+    pipe = get_redis().pipeline(transaction=False)
+    _write_record(pipe, run.kind, run.task_id, REDIS_TTL, run.record())
+    pipe.zadd(lifecycle.ACTIVE_KEY, {f"{run.kind}:{run.task_id}": run.created_at})
+    pipe.set(heartbeat_key, os.getpid(), ex=lifecycle.HEARTBEAT_TTL)
+    if params is not None:
+        pipe.setex(lifecycle.params_key(run.kind, run.task_id), REDIS_TTL, jsonio.dumps(params))
+    pipe.execute()
+    get_heartbeats().add(heartbeat_key)
+
+
+def _submit_task(run: lifecycle.TaskRun, job: tuple, tenant: str, priority: str) -> None:
+    """Queue ``job`` (function and arguments); the worker picks up ``run`` from the job's context."""
+    with lifecycle.submitting(run):
+        get_scheduler().submit(*job, tenant=tenant, priority=priority)
+
+
+def _start_task(kind: str, task_id: str) -> lifecycle.TaskRun:
+    """Mark a task running; the returned run collects its stage durations until :func:`_finish_task`."""
+    run = lifecycle.current()
+    if run is None or run.task_id != task_id:  # not started through the scheduler
+        run = lifecycle.TaskRun(kind, task_id)
+    run.transition(lifecycle.RUNNING)
+    lifecycle.activate(run)
+    get_heartbeats().add(lifecycle.heartbeat_key(kind, task_id))
+    try:
+        with tracing.span("redis.start_task"):
+            pipe = get_redis().pipeline(transaction=False)
+            pipe.exists(_cancel_key(kind, task_id))
+            _write_record(pipe, kind, task_id, REDIS_TTL, run.record())
+            run.cancel_requested = pipe.execute()[0] == 1
+    except Exception as e:  # redis errors; the final record is written at the end anyway
+        logging.warning(f"Could not mark {kind} task {task_id} running: {e}")
+    return run
+
+
+def _check_startable(run: lifecycle.TaskRun, deadline: Optional[Deadline]) -> None:
+    """Don't start work nobody waits for anymore: the task was cancelled while queued or is past its deadline."""
+    if run.cancel_requested:
+        raise TaskCancelled(_cancel_key(run.kind, run.task_id))
+    if deadline is not None:
+        deadline.check()
+
+
+def _requeue_task(run: lifecycle.TaskRun, params: dict) -> bool:
+    """Queue a task taken over by the reaper again in this process."""
+    build = _REQUEUEABLE.get(run.kind)
+    if build is None:
+        return False
+    get_heartbeats().add(lifecycle.heartbeat_key(run.kind, run.task_id))
+    _submit_task(run, build(run.task_id, params), params["tenant"], params["priority"])
+    return True
+
+
+def _failed_task_info(task_id: str, error: Exception) -> dict:
+    task_info = {
+        "status": "failed",
+        "error": str(error),
+        "task_id": task_id
+    }
+    if isinstance(error, DeadlineExceeded):
+        task_info["state"] = lifecycle.EXPIRED
+    return task_info
+
+
+@tracing.traced("redis.finish_task")
+def _finish_task(kind: str, task_id: str, task_info: dict, fingerprint: Optional[str] = None,
+                 run: Optional[lifecycle.TaskRun] = None) -> None:
+    """Persist a task's final record, drop it from the reaper's index and stop coalescing onto it, in one round trip."""
+    run = run or lifecycle.TaskRun(kind, task_id)
+    task_info = run.finish(task_info)
+    lifecycle.deactivate(run)
+    get_task_metrics().observe(run)
+    ttl = RESULT_TTL if any(field in task_info for field in ("voice_b64", "voice_ref", "image_ref")) else REDIS_TTL
+    inflight_key = f"{kind}_inflight:{fingerprint}" if fingerprint else None
+    heartbeat_key = lifecycle.heartbeat_key(kind, task_id)
+    get_heartbeats().remove(heartbeat_key)
+
+    pipe = get_redis().pipeline(transaction=False)
+    _write_record(pipe, kind, task_id, ttl, task_info)
+    pipe.zrem(lifecycle.ACTIVE_KEY, f"{kind}:{task_id}")
+    pipe.delete(lifecycle.params_key(kind, task_id), heartbeat_key)
+    if inflight_key:
+        pipe.get(inflight_key)
+    results = pipe.execute()
+
+    if inflight_key and results[-1] == task_id.encode("utf-8"):
+        get_redis().delete(inflight_key)
+
+
+def _inline_results(task_info: dict) -> Optional[dict]:
+    """Inline audio kept in result storage into a task record; None if it expired."""
+    voice_ref = task_info.pop("voice_ref", None)
+    if voice_ref:
+        audio = get_result_storage().get(voice_ref)
+        if audio is None:
+            return None
+        task_info["voice_b64"] = base64.b64encode(audio).decode("ascii")
+    return task_info
+
+
+def _json_response(obj, status: int = 200, compress: bool = True) -> Response:
+    """JSON response, compressed with the best encoding the client accepts unless ``compress`` is False."""
+    body = jsonio.dumps_bytes(obj)
+    encoding = compression.negotiate(request.accept_encodings, len(body)) if compress else None
+    response = Response(compression.compress(body, encoding) if encoding else body, status=status,
+                        mimetype="application/json")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def _cache_headers(response: Response, status: Optional[str], etag: Optional[str]) -> Response:
+    if etag:
+        response.set_etag(etag)
+    if status == "success":
+        # The result of a task id never changes until it expires.
+        response.headers["Cache-Control"] = f"private, max-age={RESULT_TTL}, immutable"
+    else:
+        response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def _task_response(kind: str, task_id: str, transform=_inline_results):
+    """Task status with a strong ETag once the task finished.
+
+    Finished records never change, so a matching ``If-None-Match`` is answered
+    with 304 before result storage is read or anything is serialized.
+    """
+    with tracing.span("redis.get_task"):
+        data = get_redis().get(f"{kind}_task:{task_id}")
+    if not data:
+        return jsonify({"error": "Task not found"}), 404
+    task_info = jsonio.loads(data)
+    status = task_info.get("status")
+    compress = not any(field in task_info for field in _MEDIA_FIELDS)
+
+    etag = None
+    if status in FINISHED_STATUSES:
+        encoding = compression.negotiate(request.accept_encodings, compression.MIN_SIZE) if compress else None
+        etag = hashlib.sha256(data).hexdigest()[:32] + (f"-{encoding}" if encoding else "")
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+            response.vary.add("Accept-Encoding")
+            return _cache_headers(response, status, etag)
+
+    with tracing.span("results.load"):
+        task_info = transform(task_info)
+    if task_info is None:
+        return jsonify({"error": "Task not found"}), 404
+    # The tag names the negotiated encoding even when a small body is sent
+    # uncompressed; the bytes behind each tag are still always the same.
+    return _cache_headers(_json_response(task_info, compress=compress), status, etag)
+
+
+def _cancel_key(kind: str, task_id: str) -> str:
+    return f"{kind}_cancel:{task_id}"
+
+
+@tracing.traced("redis.cancel_task")
+def _cancel_task(kind: str, task_id: str):
+    """Ask the worker running a task to stop; it marks the task ``cancelled``."""
+    data = get_redis().get(f"{kind}_task:{task_id}")
+    if not data:
+        return jsonify({"error": "Task not found"}), 404
+    status = jsonio.loads(data).get("status")
+    if status != "processing":
+        return jsonify({"error": f"Task is already {status}", "status": status, "task_id": task_id}), 409
+
+    get_redis().set(_cancel_key(kind, task_id), 1, ex=INFLIGHT_TTL)
+    return jsonify({"status": "cancelling", "task_id": task_id}), 202
+
+
+def _cancelled_task_info(kind: str, task_id: str) -> dict:
+    get_redis().delete(_cancel_key(kind, task_id))
+    return {
+        "status": "cancelled",
+        "task_id": task_id
+    }
+
+
+async def _run_cancellable(cancellation, coro):
+    """Await ``coro`` as a task that is cancelled together with ``cancellation``."""
+    task = asyncio.ensure_future(coro)
+    loop = asyncio.get_running_loop()
+    cancellation.on_cancel(lambda: loop.call_soon_threadsafe(task.cancel))
+    try:
+        return await task
+    except asyncio.CancelledError:
+        if cancellation.cancelled:
+            raise TaskCancelled(cancellation.key)
+        raise
+
+
+def synthesize(text: str, voice: str, model: str = DEFAULT_MODEL,
+               audio_options: Optional[AudioOptions] = None, cancellation=None,
+               deadline: Optional[Deadline] = None, **kwargs) -> Tuple[bytes, str, int]:
+    """Run CosyVoice TTS and return audio bytes plus request metadata.
+
+    ``audio_options`` is mapped onto a native DashScope format when one exists;
+    otherwise lossless WAV is requested and transcoded locally. A cancelled
+    ``cancellation`` stops the upstream stream and raises TaskCancelled; the
+    upstream wait is bounded by ``deadline`` (DeadlineExceeded).
+    """
+    deadline = deadline or NO_DEADLINE
+    transcode_needed = False
+    if audio_options and not audio_options.is_default():
+        native_format = dashscope_format(audio_options)
+        if native_format is None:
+            native_format = dashscope_source_format(audio_options)
+            transcode_needed = True
+        kwargs["format"] = native_format
+
+    _lazy_client("dashscope", _configure_dashscope)
+    from dashscope.audio.tts_v2 import SpeechSynthesizer
 
-def synthesize(text: str, voice: str, model: str = DEFAULT_MODEL, **kwargs) -> Tuple[bytes, str, int]:
-    """Run CosyVoice TTS and return audio bytes plus request metadata."""
     synthesizer = SpeechSynthesizer(model=model, voice=voice, **kwargs)
-    audio = synthesizer.call(text)
+    if cancellation is not None:
+        cancellation.raise_if_cancelled()
+        cancellation.on_cancel(synthesizer.streaming_cancel)
+    timeout = deadline.timeout()
+    with tracing.span("cosyvoice.synthesize", model=model, voice=voice, characters=len(text)) as span:
+        try:
+            # Rounded up so a wait that runs out also leaves the deadline expired.
+            audio = synthesizer.call(text, timeout_millis=math.ceil(timeout * 1000) if timeout else None)
+        except TimeoutError:
+            # The SDK closes the task when call() times out, so there is nothing left to cancel.
+            # Its own connect/start timeouts are TimeoutErrors as well; those are upstream errors.
+            if deadline.expired:
+                raise DeadlineExceeded()
+            raise
+        span.set("first_package_delay_ms", synthesizer.get_first_package_delay())
+        span.set("audio_bytes", len(audio))
+    if cancellation is not None:
+        cancellation.raise_if_cancelled()
+    if transcode_needed:
+        with tracing.span("audio.transcode", format=audio_options.format):
+            audio = transcode(audio, audio_options, src_format="wav")
     return audio, synthesizer.get_last_request_id(), synthesizer.get_first_package_delay()
 
 
-@app.route("/v1/voice/cosyvoice", methods=["POST"])
+def synthesize_volcano(text: str, voice: str, model: str = None,
+                       audio_options: Optional[AudioOptions] = None, cancellation=None,
+                       deadline: Optional[Deadline] = None, **kwargs) -> Tuple[bytes, str, int]:
+    """Like :func:`synthesize`, with Volcano Engine TTS and ``voice`` one of its speakers.
+
+    ``model`` is ignored; ``volume`` and ``speech_rate`` are mapped onto
+    Volcano's scales.
+    """
+    audio_options = audio_options or AudioOptions()
+    source_format, sample_rate = podcast_source_format(audio_options)
+    client = VolcanoTTSClient(appid=_volc_appid, access_token=_volc_access_token)
+    coro = client.synthesize(text, voice, encoding=PODCAST_FORMATS[source_format], sample_rate=sample_rate,
+                             deadline=deadline, **speech_params(**kwargs))
+    if cancellation is not None:
+        cancellation.raise_if_cancelled()
+        coro = _run_cancellable(cancellation, coro)
+    audio, request_id, first_package_delay = asyncio.run(coro)
+    if needs_transcode(source_format, sample_rate, audio_options):
+        with tracing.span("audio.transcode", format=audio_options.format):
+            audio = transcode(audio, audio_options, src_format=source_format, src_rate=sample_rate)
+    return audio, request_id, first_package_delay
+
+
+def _create_tts_router() -> Router:
+    providers = []
+    for name in TTS_PROVIDERS:
+        if name == "dashscope":
+            # Resolved per call rather than bound here, so the router follows synthesize.
+            providers.append(Provider("dashscope", lambda *args, **kwargs: synthesize(*args, **kwargs)))
+        elif name == "volcano":
+            if TTS_VOICE_MAP and _volc_appid and _volc_access_token:
+                providers.append(Provider("volcano", synthesize_volcano, voices=TTS_VOICE_MAP,
+                                          options=VOLCANO_TTS_OPTIONS))
+        else:
+            raise ValueError(f"Unknown TTS provider {name!r} in TTS_PROVIDERS")
+    return Router(providers)
+
+
+def _voice_key(model: str, voice: str, provider: str = "dashscope") -> str:
+    if provider != "dashscope":
+        return f"{provider}:{voice}"
+    return f"cosyvoice:{model}/{voice}"
+
+
+def _warm_voice(model: str, voice: str):
+    def target():
+        # A short synthesis loads the voice upstream and sets up the SDK.
+        _, _, first_package_delay = synthesize(WARMUP_TEXT, voice, model, deadline=Deadline.after(WARMUP_TIMEOUT))
+        return first_package_delay
+    return target
+
+
+def _warm_redis():
+    get_redis().ping()  # opens the first pooled connection
+
+
+def _warm_podcast_handshake():
+    client = PodcastTTSClient(appid=_volc_appid, access_token=_volc_access_token)
+    return asyncio.run(client.warm_up(WARMUP_TIMEOUT))
+
+
+def _warm_podcast_speakers():
+    client = PodcastTTSClient(appid=_volc_appid, access_token=_volc_access_token)
+    scripts = [{"speaker": speaker, "text": WARMUP_TEXT} for speaker in WARMUP_PODCAST_SPEAKERS]
+    asyncio.run(client.generate_rounds(scripts, deadline=Deadline.after(WARMUP_TIMEOUT)))
+    return None  # the whole session is the latency of interest
+
+
+def _warmup_targets() -> dict:
+    targets = {"redis": _warm_redis}
+    if ENABLE_COSYVOICE:
+        for model, voice in WARMUP_VOICES or [(DEFAULT_MODEL, DEFAULT_VOICE)]:
+            targets[_voice_key(model, voice)] = _warm_voice(model, voice)
+    if ENABLE_PODCAST:
+        targets["podcast:handshake"] = _warm_podcast_handshake
+        if WARMUP_PODCAST_SPEAKERS:
+            targets["podcast:speakers"] = _warm_podcast_speakers
+    return targets
+
+
+def start_warmup() -> None:
+    """Warm up this worker, waiting up to WARMUP_WAIT seconds; called once per worker after fork."""
+    if ENABLE_WARMUP:
+        get_warmer().start(WARMUP_WAIT)
+
+
+def start_reaper() -> None:
+    """Start looking for tasks whose worker was lost; called once per worker after fork."""
+    get_reaper().start()
+
+
+@cosyvoice_bp.route("/v1/voice/cosyvoice", methods=["POST"])
 def cosyvoice_endpoint():
     payload = request.get_json(silent=True) or {}
     text = (payload.get("text") or "").strip()
@@ -67,45 +846,94 @@ def cosyvoice_endpoint():
         return jsonify({"error": "parameter 'text' is required"}), 400
 
     try:
-        audio, request_id, first_pkg_delay = synthesize(text=text, voice=voice, model=model, **kwargs)
-    except Exception as exc:  # dashscope errors propagate here
+        audio_options = AudioOptions.from_payload(payload)
+        deadline = _request_deadline(payload, REQUEST_TIMEOUT)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    try:
+        result = get_tts_router().synthesize(
+            text, voice, model, audio_options=audio_options, deadline=deadline, **kwargs
+        )
+        get_warmer().observe(_voice_key(model, result.voice, result.provider), result.first_package_delay)
+    except NoProviderError as exc:
+        return jsonify({"error": str(exc)}), 400
+    except DeadlineExceeded as exc:
+        return jsonify({"error": str(exc)}), 504
+    except Exception as exc:  # errors of the last provider tried propagate here
         return jsonify({"error": str(exc)}), 500
 
-    voice_b64 = base64.b64encode(audio).decode("ascii")
+    voice_b64 = base64.b64encode(result.audio).decode("ascii")
     return jsonify(
         {
             "voice_b64": voice_b64,
-            "request_id": request_id,
-            "first_package_delay_ms": first_pkg_delay,
+            "request_id": result.request_id,
+            "first_package_delay_ms": result.first_package_delay,
+            "provider": result.provider,
         }
     )
 
 
-def process_cosyvoice_task(task_id, text, voice, model, kwargs):
+def _save_profile(capture: profiling.Capture) -> None:
+    # Sampled captures are only worth keeping when they caught something slow.
+    if not (capture.explicit or capture.slow):
+        return
+    try:
+        get_profiles().save(capture)
+    except Exception as e:  # redis errors; profiling is best effort
+        logging.warning(f"Could not save profile {capture.id}: {e}")
+
+
+def _profiled(name: str):
+    """Profile a background task when the request that queued it was profiled (or by sampling)."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            capture = profiling.child(name) if ENABLE_PROFILING else None
+            if capture is None:
+                return fn(*args, **kwargs)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _save_profile(profiling.finish(capture))
+        return wrapper
+    return decorate
+
+
+@tracing.traced("task.cosyvoice")
+@_profiled("task.cosyvoice")
+def process_cosyvoice_task(task_id, text, voice, model, kwargs, fingerprint=None, audio_options=None,
+                           deadline=None):
+    run = _start_task("cosyvoice", task_id)
     try:
-        audio, request_id, first_pkg_delay = synthesize(text=text, voice=voice, model=model, **kwargs)
-        voice_b64 = base64.b64encode(audio).decode("ascii")
-        
+        _check_startable(run, deadline)
+        with get_cancellations().watch(_cancel_key("cosyvoice", task_id)) as cancellation, \
+                lifecycle.stage("synthesize"):
+            result = get_tts_router().synthesize(
+                text, voice, model, audio_options=audio_options, cancellation=cancellation,
+                deadline=deadline, **kwargs
+            )
+        get_warmer().observe(_voice_key(model, result.voice, result.provider), result.first_package_delay)
+
+        with lifecycle.stage("store"):
+            result_fields = _audio_result_fields("cosyvoice", task_id, result.audio)
         task_info = {
             "status": "success",
-            "voice_b64": voice_b64,
-            "request_id": request_id,
-            "first_package_delay_ms": first_pkg_delay,
-            "created_at": time.time(),
+            **result_fields,
+            "request_id": result.request_id,
+            "first_package_delay_ms": result.first_package_delay,
+            "provider": result.provider,
             "task_id": task_id
         }
+    except TaskCancelled:
+        task_info = _cancelled_task_info("cosyvoice", task_id)
     except Exception as e:
-        task_info = {
-            "status": "failed",
-            "error": str(e),
-            "created_at": time.time(),
-            "task_id": task_id
-        }
+        task_info = _failed_task_info(task_id, e)
     
-    redis_client.setex(f"cosyvoice_task:{task_id}", REDIS_TTL, json.dumps(task_info))
+    _finish_task("cosyvoice", task_id, task_info, fingerprint, run)
 
 
-@app.route("/v1/voice/cosyvoice/async", methods=["POST"])
+@cosyvoice_bp.route("/v1/voice/cosyvoice/async", methods=["POST"])
 def async_cosyvoice_endpoint():
     payload = request.get_json(silent=True) or {}
     text = (payload.get("text") or "").strip()
@@ -121,83 +949,63 @@ def async_cosyvoice_endpoint():
     if not text:
         return jsonify({"error": "parameter 'text' is required"}), 400
 
-    task_id = str(uuid.uuid4())
-    
-    task_info = {
-        "status": "processing",
-        "created_at": time.time(),
-        "task_id": task_id
-    }
-    redis_client.setex(f"cosyvoice_task:{task_id}", REDIS_TTL, json.dumps(task_info))
+    try:
+        audio_options = AudioOptions.from_payload(payload)
+        tenant, priority = _scheduling_class(payload)
+        deadline = _request_deadline(payload, TASK_TIMEOUT)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    if deadline.expired:  # checked before any Redis round trip
+        return jsonify({"error": "deadline exceeded"}), 504
 
-    thread = threading.Thread(
-        target=process_cosyvoice_task,
-        args=(task_id, text, voice, model, kwargs)
+    fingerprint = _payload_fingerprint(
+        {"text": text, "voice": voice, "model": model, **kwargs, **audio_options.to_dict()}
     )
-    thread.start()
+    task_id, created = _reserve_task("cosyvoice", fingerprint)
+    if not created:
+        return jsonify({"task_id": task_id})
+
+    params = {"text": text, "voice": voice, "model": model, "kwargs": kwargs, "fingerprint": fingerprint,
+              "audio": audio_options.to_dict(), "deadline": deadline.expires_at,
+              "tenant": tenant, "priority": priority}
+    run = lifecycle.TaskRun("cosyvoice", task_id)
+    _create_task(run, params)
+    _submit_task(run, _cosyvoice_job(task_id, params), tenant, priority)
 
     return jsonify({"task_id": task_id})
 
 
-@app.route("/v1/voice/cosyvoice/async/<task_id>", methods=["GET"])
+def _cosyvoice_job(task_id: str, params: dict) -> tuple:
+    return (process_cosyvoice_task, task_id, params["text"], params["voice"], params["model"], params["kwargs"],
+            params["fingerprint"], AudioOptions.from_payload(params["audio"]), Deadline(params["deadline"]))
+
+
+@cosyvoice_bp.route("/v1/voice/cosyvoice/async/<task_id>", methods=["GET"])
 def query_cosyvoice_task(task_id):
-    data = redis_client.get(f"cosyvoice_task:{task_id}")
-    if not data:
-        return jsonify({"error": "Task not found"}), 404
-        
-    return jsonify(json.loads(data))
+    return _task_response("cosyvoice", task_id)
 
 
-def stitch_images(image_list: List[str], direction: str = "horizontal") -> str:
-    images = []
-    for img_str in image_list:
-        try:
-            if img_str.startswith("http://") or img_str.startswith("https://"):
-                response = requests.get(img_str, timeout=10)
-                response.raise_for_status()
-                img_data = response.content
-            else:
-                # Handle base64
-                if "," in img_str:
-                    img_str = img_str.split(",", 1)[1]
-                img_data = base64.b64decode(img_str)
-            
-            images.append(Image.open(BytesIO(img_data)))
-        except Exception as e:
-            print(f"Error loading image: {e}")
-            continue
+@cosyvoice_bp.route("/v1/voice/cosyvoice/async/<task_id>", methods=["DELETE"])
+def cancel_cosyvoice_task(task_id):
+    return _cancel_task("cosyvoice", task_id)
+
+
+def stitch_images(image_list: list, direction: str = "horizontal",
+                  deadline: Optional[Deadline] = None, max_size: Optional[int] = None) -> str:
+    with profiling.memory("stitch"):
+        png = stitch_image_bytes(image_list, direction, IMAGE_LIMITS, deadline=deadline, max_size=max_size,
+                                 fetch_timeout=IMAGE_FETCH_TIMEOUT, pool=get_stitch_pool())
+    return base64.b64encode(png).decode("ascii")
+
 
-    if not images:
-        raise ValueError("No valid images to stitch")
-
-    if direction == "vertical":
-        width = max(img.width for img in images)
-        height = sum(img.height for img in images)
-        result = Image.new("RGB", (width, height))
-        y_offset = 0
-        for img in images:
-            result.paste(img, (0, y_offset))
-            y_offset += img.height
-    else:  # horizontal
-        width = sum(img.width for img in images)
-        height = max(img.height for img in images)
-        result = Image.new("RGB", (width, height))
-        x_offset = 0
-        for img in images:
-            result.paste(img, (x_offset, 0))
-            x_offset += img.width
-
-    buffered = BytesIO()
-    result.save(buffered, format="PNG")
-    return base64.b64encode(buffered.getvalue()).decode("ascii")
-
-
-@app.route("/v1/voice/podcast", methods=["POST"])
+@podcast_bp.route("/v1/voice/podcast", methods=["POST"])
 def podcast_endpoint():
     payload = request.get_json(silent=True) or {}
     scripts = payload.get("scripts")
     use_head_music = payload.get("use_head_music") or False
     use_tail_music = payload.get("use_tail_music") or False
+    parallel = payload.get("parallel") or False
+    subtitles = payload.get("subtitles")
     
     if not scripts or not isinstance(scripts, list):
          return jsonify({"error": "parameter 'scripts' is required and must be a list"}), 400
@@ -205,85 +1013,615 @@ def podcast_endpoint():
     if not _volc_appid or not _volc_access_token:
          return jsonify({"error": "VOLC_APPID or VOLC_ACCESS_TOKEN not set on server"}), 500
 
-    task_id = str(uuid.uuid4())
-    
-    # Initialize task status in Redis
-    task_info = {
-        "status": "processing",
-        "created_at": time.time(),
-        "task_id": task_id
-    }
-    redis_client.setex(f"podcast_task:{task_id}", REDIS_TTL, json.dumps(task_info))
+    try:
+        audio_options = AudioOptions.from_payload(payload)
+        tenant, priority = _scheduling_class(payload)
+        deadline = _request_deadline(payload, TASK_TIMEOUT)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    if deadline.expired:  # checked before any Redis round trip
+        return jsonify({"error": "deadline exceeded"}), 504
+    if subtitles is not None and subtitles not in SUBTITLE_FORMATS:
+        return jsonify({"error": f"parameter 'subtitles' must be one of {', '.join(SUBTITLE_FORMATS)}"}), 400
 
-    # Start background task
-    thread = threading.Thread(
-        target=process_podcast_task,
-        args=(task_id, scripts, use_head_music, use_tail_music)
+    fingerprint = _payload_fingerprint(
+        {"scripts": scripts, "use_head_music": use_head_music, "use_tail_music": use_tail_music,
+         "parallel": bool(parallel), "subtitles": subtitles, **audio_options.to_dict()}
     )
-    thread.start()
+    task_id, created = _reserve_task("podcast", fingerprint)
+    if not created:
+        return jsonify({"task_id": task_id})
+
+    # Initialize task status in Redis
+    params = {"scripts": scripts, "use_head_music": use_head_music, "use_tail_music": use_tail_music,
+              "fingerprint": fingerprint, "audio": audio_options.to_dict(), "parallel": bool(parallel),
+              "subtitles": subtitles, "deadline": deadline.expires_at, "tenant": tenant, "priority": priority}
+    run = lifecycle.TaskRun("podcast", task_id)
+    _create_task(run, params)
+
+    # Queue background task
+    _submit_task(run, _podcast_job(task_id, params), tenant, priority)
 
     return jsonify({"task_id": task_id})
 
 
-@app.route("/v1/voice/podcast/<task_id>", methods=["GET"])
+def _podcast_job(task_id: str, params: dict) -> tuple:
+    return (process_podcast_task, task_id, params["scripts"], params["use_head_music"], params["use_tail_music"],
+            params["fingerprint"], AudioOptions.from_payload(params["audio"]), params["parallel"],
+            params["subtitles"], Deadline(params["deadline"]))
+
+
+# Job builders from the parameters kept by _create_task, for tasks the reaper queues again.
+_REQUEUEABLE = {"cosyvoice": _cosyvoice_job, "podcast": _podcast_job}
+
+
+@podcast_bp.route("/v1/voice/podcast/<task_id>", methods=["GET"])
 def query_podcast_task(task_id):
-    data = redis_client.get(f"podcast_task:{task_id}")
-    if not data:
-        return jsonify({"error": "Task not found"}), 404
-        
-    return jsonify(json.loads(data))
+    return _task_response("podcast", task_id)
+
+
+@podcast_bp.route("/v1/voice/podcast/<task_id>", methods=["DELETE"])
+def cancel_podcast_task(task_id):
+    return _cancel_task("podcast", task_id)
+
+
+@tasks_bp.route("/v1/tasks/status", methods=["POST"])
+def bulk_task_status():
+    """Resolve many task ids of any kind with a Redis MGET of their status copies.
+
+    Payload: {"task_ids": ["..."], "fields": ["status", "error"] (optional)}
+    Audio is never included, nor read from Redis; ``fields`` further narrows
+    the returned keys.
+    """
+    payload = request.get_json(silent=True) or {}
+    task_ids = payload.get("task_ids")
+    fields = payload.get("fields")
+
+    if not task_ids or not isinstance(task_ids, list) or not all(isinstance(t, str) for t in task_ids):
+        return jsonify({"error": "parameter 'task_ids' is required and must be a list of strings"}), 400
+    if len(task_ids) > MAX_BULK_TASK_IDS:
+        return jsonify({"error": f"at most {MAX_BULK_TASK_IDS} task_ids per request"}), 400
+    if fields is not None and (not isinstance(fields, list) or not all(isinstance(f, str) for f in fields)):
+        return jsonify({"error": "parameter 'fields' must be a list of strings"}), 400
+
+    task_ids = list(dict.fromkeys(task_ids))
+    keys = [lifecycle.status_key(kind, task_id) for task_id in task_ids for kind in TASK_KINDS]
+    with tracing.span("redis.mget", keys=len(keys)):
+        values = get_redis().mget(keys)
+
+    # Records written before status copies existed are read whole, until they expire.
+    unresolved = [index for index in range(0, len(values), len(TASK_KINDS))
+                  if not any(values[index:index + len(TASK_KINDS)])]
+    if unresolved:
+        legacy_keys = [f"{kind}_task:{task_ids[index // len(TASK_KINDS)]}" for index in unresolved
+                       for kind in TASK_KINDS]
+        with tracing.span("redis.mget", keys=len(legacy_keys)):
+            legacy = get_redis().mget(legacy_keys)
+        for position, index in enumerate(unresolved):
+            values[index:index + len(TASK_KINDS)] = legacy[position * len(TASK_KINDS):(position + 1) * len(TASK_KINDS)]
+
+    tasks = {}
+    missing = []
+    for index, task_id in enumerate(task_ids):
+        for offset, kind in enumerate(TASK_KINDS):
+            data = values[index * len(TASK_KINDS) + offset]
+            if data:
+                break
+        else:
+            missing.append(task_id)
+            continue
+
+        record = jsonio.loads(data)
+        if fields is not None:
+            record = {field: record[field] for field in fields if field in record}
+        for field in _RESULT_FIELDS:
+            record.pop(field, None)
+        record["task_id"] = task_id
+        record["type"] = kind
+        tasks[task_id] = record
+
+    return _json_response({"tasks": tasks, "missing": missing})
+
+
+def _generate_podcast_segments(client, scripts, source_format, sample_rate, use_head_music,
+                               use_tail_music, deadline=None, spool_factory=None):
+    """Coroutine generating ``scripts`` as parallel segments, returning the rounds of all segments."""
+    segments = split_scripts(scripts, PODCAST_SEGMENT_LINES)
+    return generate_segments(
+        client,
+        segments,
+        PODCAST_SEGMENT_CONCURRENCY,
+        use_head_music=use_head_music,
+        use_tail_music=use_tail_music,
+        encoding=PODCAST_FORMATS[source_format],
+        sample_rate=sample_rate,
+        deadline=deadline,
+        spool_factory=spool_factory,
+        limit=get_podcast_sessions(),
+    )
+
+
+def _generate_podcast_cached(client, scripts, source_format, sample_rate, use_head_music, use_tail_music,
+                             parallel, deadline=None):
+    """Coroutine generating only the rounds missing from the round cache, returning all rounds."""
+    cache = RoundCache(get_result_storage(), ttl=PODCAST_ROUND_CACHE_TTL)
+    return generate_with_cache(
+        client,
+        scripts,
+        cache,
+        PODCAST_SEGMENT_CONCURRENCY,
+        use_head_music=use_head_music,
+        use_tail_music=use_tail_music,
+        encoding=PODCAST_FORMATS[source_format],
+        sample_rate=sample_rate,
+        max_lines=PODCAST_SEGMENT_LINES if parallel else None,
+        deadline=deadline,
+        limit=get_podcast_sessions(),
+    )
 
 
-def process_podcast_task(task_id, scripts, use_head_music, use_tail_music):
+def _spool_rounds(rounds, spool: AudioSpool, fmt: str, trim: bool) -> List[int]:
+    """Move the audio of ``rounds`` into ``spool`` one round at a time; returns each round's size there.
+
+    Rounds the session already wrote into ``spool`` stay where they are. With
+    ``trim`` the rounds come from separate sessions and are cut to whole
+    samples / MP3 frames so they join into one stream.
+    """
+    sizes = []
+    for r in rounds:
+        if r.spool is spool:
+            sizes.append(r.spool_size)
+            continue
+        part = r.read_audio()
+        if trim:
+            part = audio_parts([part], fmt)[0]
+        spool.write(part)
+        sizes.append(len(part))
+        r.audio, r.spool = b"", None  # the spool holds the only copy now
+    return sizes
+
+
+@tracing.traced("task.podcast")
+@_profiled("task.podcast")
+def process_podcast_task(task_id, scripts, use_head_music, use_tail_music, fingerprint=None,
+                         audio_options=None, parallel=False, subtitles=None, deadline=None):
+    audio_options = audio_options or AudioOptions()
+    # Round audio is written once, into this spool; parallel segments get one each.
+    spool = AudioSpool()
+    segment_spools: List[AudioSpool] = []
+
+    def segment_spool() -> AudioSpool:
+        segment_spools.append(AudioSpool())
+        return segment_spools[-1]
+
+    run = _start_task("podcast", task_id)
     try:
+        _check_startable(run, deadline)
         client = PodcastTTSClient(appid=_volc_appid, access_token=_volc_access_token)
-        # Using asyncio.run to call async code
-        audio_bytes = asyncio.run(client.generate_audio(
-            scripts, 
-            use_head_music=use_head_music, 
-            use_tail_music=use_tail_music
-        ))
-        voice_b64 = base64.b64encode(audio_bytes).decode("ascii")
-        
-        # Update success status
+        source_format, sample_rate = podcast_source_format(audio_options)
+        if (parallel or PODCAST_ROUND_CACHE_TTL) and source_format not in JOINABLE_FORMATS:
+            # Ogg streams can't be concatenated; join raw PCM and encode once.
+            source_format = "pcm"
+        if PODCAST_ROUND_CACHE_TTL:
+            generation = _generate_podcast_cached(client, scripts, source_format, sample_rate,
+                                                  use_head_music, use_tail_music, parallel, deadline)
+        elif parallel:
+            generation = _generate_podcast_segments(client, scripts, source_format, sample_rate,
+                                                    use_head_music, use_tail_music, deadline, segment_spool)
+        else:
+            generation = client.generate_rounds(
+                scripts, 
+                encoding=PODCAST_FORMATS[source_format],
+                sample_rate=sample_rate,
+                use_head_music=use_head_music, 
+                use_tail_music=use_tail_music,
+                deadline=deadline,
+                sink=spool,
+            )
+        with profiling.memory("podcast.audio"):
+            with get_cancellations().watch(_cancel_key("podcast", task_id)) as cancellation, \
+                    lifecycle.stage("generate"), \
+                    tracing.span("podcast.generate", lines=len(scripts), parallel=bool(parallel)):
+                # Using asyncio.run to call async code
+                rounds = asyncio.run(_run_cancellable(cancellation, generation))
+            get_warmer().observe("podcast:handshake", client.handshake_ms)
+
+            with lifecycle.stage("assemble"), tracing.span("podcast.assemble", rounds=len(rounds)):
+                # Rounds of a single session are already one continuous stream.
+                sizes = _spool_rounds(rounds, spool, source_format, trim=bool(parallel or PODCAST_ROUND_CACHE_TTL))
+                for segment in segment_spools:
+                    segment.close()
+                transcoded = needs_transcode(source_format, sample_rate, audio_options)
+                with spool.buffer() as data:
+                    timeline = build_timeline(rounds, sizes, source_format, sample_rate,
+                                              byte_offsets=not transcoded, data=data)
+            if transcoded:
+                with lifecycle.stage("transcode"), tracing.span("audio.transcode", format=audio_options.format):
+                    encoded = AudioSpool()
+                    for chunk in transcode_stream(spool.chunks(), audio_options, source_format, sample_rate):
+                        encoded.write(chunk)
+                    if encoded.read(0, 4) == b"RIFF":
+                        encoded.overwrite(0, patch_wav_header(encoded.read(0, WAV_HEADER_SIZE), len(encoded)))
+                    spool.close()
+                    spool = encoded
+
+        with lifecycle.stage("store"), tracing.span("results.store", bytes=len(spool), spilled=spool.spilled):
+            result_fields = _audio_result_fields("podcast", task_id, spool)
+
+        # Update success status; created_at stays the submission time.
         task_info = {
             "status": "success",
-            "voice_b64": voice_b64,
-            "created_at": time.time(), # Update time or keep original? Keeping simple.
+            **result_fields,
+            "timeline": timeline,
             "task_id": task_id
         }
+        if subtitles:
+            task_info["subtitles"] = render_subtitles(timeline, subtitles)
+    except TaskCancelled:
+        task_info = _cancelled_task_info("podcast", task_id)
     except Exception as e:
-        task_info = {
-            "status": "failed",
-            "error": str(e),
-            "created_at": time.time(),
-            "task_id": task_id
-        }
+        task_info = _failed_task_info(task_id, e)
+    finally:
+        spool.close()
+        for segment in segment_spools:
+            segment.close()
     
-    redis_client.setex(f"podcast_task:{task_id}", REDIS_TTL, json.dumps(task_info))
+    _finish_task("podcast", task_id, task_info, fingerprint, run)
 
 
-@app.route("/v1/image/stitch", methods=["POST"])
-def stitch_endpoint():
+def _stitch_request() -> Tuple[dict, list]:
+    """Parameters and images of a stitch request.
+
+    Besides JSON with URL/base64 ``images``, accepts multipart/form-data with
+    image files in ``images`` parts (text ``images`` fields are added after
+    them), or a raw ``image/*`` / ``application/octet-stream`` body holding one
+    image, with parameters and extra ``images`` URLs in the query string.
+    Uploaded images stay binary, no base64 round trip.
+    """
+    content_type = request.mimetype
+    if content_type == "multipart/form-data":
+        params = request.form.to_dict()
+        images = []
+        for upload in request.files.getlist("images"):
+            data = upload.stream.read(IMAGE_LIMITS.max_bytes + 1)
+            if len(data) > IMAGE_LIMITS.max_bytes:
+                raise ImageRejected(f"image is larger than {IMAGE_LIMITS.max_bytes} bytes")
+            images.append(data)
+        return params, images + request.form.getlist("images")
+    if content_type.startswith("image/") or content_type == "application/octet-stream":
+        if (request.content_length or 0) > IMAGE_LIMITS.max_bytes:
+            raise ImageRejected(f"image is larger than {IMAGE_LIMITS.max_bytes} bytes")
+        return request.args.to_dict(), [request.get_data()] + request.args.getlist("images")
+
     payload = request.get_json(silent=True) or {}
-    images = payload.get("images") or []
+    return payload, payload.get("images") or []
+
+
+def _stitch_params(payload: dict, images) -> Tuple[list, str, Optional[int]]:
+    """``(images, direction, max_size)`` of a stitch request; raises ValueError when invalid."""
     direction = payload.get("direction") or "horizontal"
+    max_size = payload.get("max_size")
+    if isinstance(max_size, str) and max_size.isdigit():  # form and query values
+        max_size = int(max_size)
 
     if not images or not isinstance(images, list):
-         return jsonify({"error": "parameter 'images' is required and must be a list"}), 400
+        raise ValueError("parameter 'images' is required and must be a list")
+    if max_size is not None and (not isinstance(max_size, int) or isinstance(max_size, bool) or max_size <= 0):
+        raise ValueError("parameter 'max_size' must be a positive integer")
+    return images, direction, max_size
+
+
+def _stitch_fingerprint(images: list, direction: str, max_size: Optional[int]) -> str:
+    # Uploaded images are represented by their digest.
+    sources = [hashlib.sha256(image).hexdigest() if isinstance(image, bytes) else image for image in images]
+    return _payload_fingerprint({"images": sources, "direction": direction, "max_size": max_size})
 
+
+@image_bp.route("/v1/image/stitch", methods=["POST"])
+def stitch_endpoint():
     try:
-        result_b64 = stitch_images(images, direction)
+        payload, images = _stitch_request()
+        images, direction, max_size = _stitch_params(payload, images)
+        deadline = _request_deadline(payload, REQUEST_TIMEOUT)
+    except ImageRejected as exc:
+        return jsonify({"error": str(exc)}), 413
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    try:
+        result_b64 = stitch_images(images, direction, deadline, max_size)
         return jsonify({"image_b64": result_b64})
+    except DeadlineExceeded as e:
+        return jsonify({"error": str(e)}), 504
+    except ImageRejected as e:
+        return jsonify({"error": str(e)}), 413
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@tracing.traced("task.stitch")
+@_profiled("task.stitch")
+def process_stitch_task(task_id, images, direction, max_size=None, fingerprint=None, deadline=None):
+    run = _start_task("stitch", task_id)
+    try:
+        _check_startable(run, deadline)
+        with get_cancellations().watch(_cancel_key("stitch", task_id)) as cancellation, \
+                lifecycle.stage("stitch"), profiling.memory("stitch"):
+            png = stitch_image_bytes(images, direction, IMAGE_LIMITS, deadline=deadline, max_size=max_size,
+                                     fetch_timeout=IMAGE_FETCH_TIMEOUT, pool=get_stitch_pool())
+            # Pool jobs can't be interrupted; a cancelled stitch only drops its result.
+            cancellation.raise_if_cancelled()
+
+        ref = f"stitch/{task_id}"
+        with lifecycle.stage("store"), tracing.span("results.store", bytes=len(png)):
+            get_result_storage().put(ref, png, ttl=RESULT_TTL, content_type="image/png")
+        task_info = {
+            "status": "success",
+            "image_ref": ref,
+            "content_type": "image/png",
+            "size": len(png),
+            "task_id": task_id
+        }
+    except TaskCancelled:
+        task_info = _cancelled_task_info("stitch", task_id)
+    except Exception as e:
+        task_info = _failed_task_info(task_id, e)
+
+    _finish_task("stitch", task_id, task_info, fingerprint, run)
+
+
+@image_bp.route("/v1/image/stitch/async", methods=["POST"])
+def async_stitch_endpoint():
+    try:
+        payload, images = _stitch_request()
+        images, direction, max_size = _stitch_params(payload, images)
+        tenant, priority = _scheduling_class(payload)
+        deadline = _request_deadline(payload, TASK_TIMEOUT)
+    except ImageRejected as exc:
+        return jsonify({"error": str(exc)}), 413
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    if deadline.expired:  # checked before any Redis round trip
+        return jsonify({"error": "deadline exceeded"}), 504
+
+    fingerprint = _stitch_fingerprint(images, direction, max_size)
+    task_id, created = _reserve_task("stitch", fingerprint)
+    if not created:
+        return jsonify({"task_id": task_id})
+
+    # Images are not kept for re-queueing; a stitch whose worker is lost fails.
+    run = lifecycle.TaskRun("stitch", task_id)
+    _create_task(run)
+    _submit_task(run, (process_stitch_task, task_id, images, direction, max_size, fingerprint, deadline),
+                 tenant, priority)
+
+    return jsonify({"task_id": task_id})
+
+
+@image_bp.route("/v1/image/stitch/async/<task_id>", methods=["GET"])
+def query_stitch_task(task_id):
+    def with_image_url(task_info):
+        if task_info.pop("image_ref", None):
+            task_info["image_url"] = url_for("image.download_stitch_result", task_id=task_id)
+        return task_info
+
+    return _task_response("stitch", task_id, with_image_url)
+
+
+@image_bp.route("/v1/image/stitch/async/<task_id>/image", methods=["GET"])
+def download_stitch_result(task_id):
+    """Stream a finished stitch from result storage without loading it whole."""
+    data = get_redis().get(f"stitch_task:{task_id}")
+    if not data:
+        return jsonify({"error": "Task not found"}), 404
+    task_info = jsonio.loads(data)
+    if task_info.get("status") != "success":
+        return jsonify({"error": "Task has no image", "status": task_info.get("status"), "task_id": task_id}), 409
+
+    etag = hashlib.sha256(data).hexdigest()[:32]
+    if request.if_none_match.contains_weak(etag):
+        return _cache_headers(Response(status=304), "success", etag)
+    chunks = get_result_storage().iter_chunks(task_info["image_ref"])
+    if chunks is None:
+        return jsonify({"error": "Result expired"}), 404
+    headers = {"Content-Length": str(task_info["size"])} if "size" in task_info else {}
+    response = Response(chunks, mimetype=task_info.get("content_type", "image/png"), headers=headers)
+    return _cache_headers(response, "success", etag)
+
+
+@image_bp.route("/v1/image/stitch/async/<task_id>", methods=["DELETE"])
+def cancel_stitch_task(task_id):
+    return _cancel_task("stitch", task_id)
+
+
+def _start_request_span() -> None:
+    if not tracing.enabled:
+        return
+    route = request.url_rule.rule if request.url_rule else request.path
+    span = tracing.start_span(f"{request.method} {route}", traceparent=request.headers.get("traceparent"),
+                              **{"http.method": request.method, "http.route": route})
+    g.trace_span = span
+    g.trace_token = tracing.attach(span)
+
+
+def _tag_response(response: Response) -> Response:
+    span = g.get("trace_span")
+    if span is not None:
+        span.set("http.status_code", response.status_code)
+        response.headers["traceparent"] = span.traceparent
+    return response
+
+
+def _end_request_span(error=None) -> None:
+    span = g.pop("trace_span", None)
+    if span is not None:
+        tracing.detach(g.pop("trace_token", None))
+        span.end(error)
+
+
+def _is_admin() -> bool:
+    if not ADMIN_TOKEN:
+        return False
+    supplied = request.headers.get("X-Admin-Token") or request.headers.get("Authorization", "").removeprefix("Bearer ")
+    return hmac.compare_digest(supplied.encode("utf-8"), ADMIN_TOKEN.encode("utf-8"))
+
+
+def _start_request_profile() -> None:
+    """Profile this request if asked to by ``X-Profile``, an armed capture, or sampling."""
+    if not ENABLE_PROFILING or request.blueprint == "admin":
+        return
+    header = request.headers.get("X-Profile", "").strip().lower()
+    if header and _is_admin():
+        options = {"explicit": True, "memory": header == "memory"}
+    else:
+        memory = get_profiles().claim()
+        if memory is not None:
+            options = {"explicit": True, "memory": memory}
+        elif profiling.SAMPLE_RATIO and random.random() < profiling.SAMPLE_RATIO:
+            options = {}
+        else:
+            return
+    route = request.url_rule.rule if request.url_rule else request.path
+    capture = profiling.start(f"{request.method} {route}", **options)
+    if capture is not None:
+        span = tracing.current_span()
+        if span is not None:
+            capture.attributes["trace_id"] = span.trace_id
+        g.profile = capture
+
+
+def _tag_profile(response: Response) -> Response:
+    capture = g.get("profile")
+    if capture is not None:
+        capture.attributes["status_code"] = response.status_code
+        if capture.explicit:
+            response.headers["X-Profile-Id"] = capture.id
+    return response
+
+
+def _end_request_profile(error=None) -> None:
+    capture = g.pop("profile", None)
+    if capture is not None:
+        _save_profile(profiling.finish(capture))
+
+
+@admin_bp.before_request
+def _require_admin():
+    if not _is_admin():
+        return jsonify({"error": "Unauthorized"}), 401
+
+
+def _profiling_disabled():
+    return jsonify({"error": "Profiling is disabled; set ENABLE_PROFILING=1"}), 404
+
+
+@admin_bp.route("/admin/profiling", methods=["POST"])
+def arm_profiling():
+    """Profile the next ``requests`` requests served by any worker within ``ttl`` seconds."""
+    if not ENABLE_PROFILING:
+        return _profiling_disabled()
+    payload = request.get_json(silent=True) or {}
+    count = payload.get("requests", 10)
+    ttl = payload.get("ttl", 300)
+    if not isinstance(count, int) or not 1 <= count <= MAX_PROFILED_REQUESTS:
+        return jsonify({"error": f"parameter 'requests' must be an integer between 1 and {MAX_PROFILED_REQUESTS}"}), 400
+    if not isinstance(ttl, int) or ttl <= 0:
+        return jsonify({"error": "parameter 'ttl' must be a positive integer"}), 400
+    get_profiles().arm(count, ttl, bool(payload.get("memory")))
+    return jsonify({"requests": count, "ttl": ttl, "memory": bool(payload.get("memory"))}), 202
+
+
+@admin_bp.route("/admin/profiling", methods=["DELETE"])
+def disarm_profiling():
+    if not ENABLE_PROFILING:
+        return _profiling_disabled()
+    get_profiles().disarm()
+    return jsonify({"requests": 0})
+
+
+@admin_bp.route("/admin/profiles", methods=["GET"])
+def list_profiles():
+    if not ENABLE_PROFILING:
+        return _profiling_disabled()
+    try:
+        limit = int(request.args.get("limit", 20))
+        min_duration_ms = float(request.args.get("min_duration_ms", 0))
+    except ValueError:
+        return jsonify({"error": "parameters 'limit' and 'min_duration_ms' must be numbers"}), 400
+    return jsonify({"profiles": get_profiles().recent(limit, min_duration_ms)})
+
+
+@admin_bp.route("/admin/profiles/<profile_id>", methods=["GET"])
+def get_profile(profile_id):
+    if not ENABLE_PROFILING:
+        return _profiling_disabled()
+    profile = get_profiles().get(profile_id)
+    if profile is None:
+        return jsonify({"error": "Profile not found"}), 404
+    if request.args.get("format") == "folded":
+        return Response(profiling.folded(profile), mimetype="text/plain")
+    return jsonify(profile)
+
+
+@admin_bp.route("/admin/warmup", methods=["GET"])
+def warmup_stats():
+    """Warm-up results and cold-start metrics of the worker serving this request."""
+    return jsonify(get_warmer().stats())
+
+
+@admin_bp.route("/admin/tts", methods=["GET"])
+def tts_provider_stats():
+    """Latency and health of the TTS providers as seen by the worker serving this request."""
+    return jsonify({"pid": os.getpid(), "providers": get_tts_router().stats()})
+
+
+@admin_bp.route("/admin/tasks", methods=["GET"])
+def task_stats():
+    """Task states, queue and run durations and reaper outcomes of the worker serving this request."""
+    return jsonify({"scheduler": get_scheduler().stats(), **get_task_metrics().stats()})
+
+
 def create_app() -> Flask:
-    """Flask factory for WSGI/ASGI servers."""
+    """Flask factory for WSGI/ASGI servers.
+
+    Only the blueprints of enabled features are registered. No SDK is imported
+    and no client is created here; each is built on first use.
+    """
+    if ENABLE_COSYVOICE and not _resolve_dashscope_api_key():
+        raise RuntimeError("DASHSCOPE_API_KEY is not set; please export it or set ENABLE_COSYVOICE=0.")
+
+    app = Flask(__name__)
+    app.json = jsonio.FastJSONProvider(app)
+    app.before_request(_start_request_span)
+    app.after_request(_tag_response)
+    app.teardown_request(_end_request_span)
+    if ENABLE_PROFILING:
+        app.before_request(_start_request_profile)
+        app.after_request(_tag_profile)
+        app.teardown_request(_end_request_profile)
+    if ENABLE_PROFILING or ADMIN_TOKEN:
+        app.register_blueprint(admin_bp)
+    if ENABLE_COSYVOICE:
+        app.register_blueprint(cosyvoice_bp)
+    if ENABLE_PODCAST:
+        app.register_blueprint(podcast_bp)
+    if ENABLE_IMAGE:
+        app.register_blueprint(image_bp)
+    if ENABLE_COSYVOICE or ENABLE_PODCAST or ENABLE_IMAGE:
+        app.register_blueprint(tasks_bp)
     return app
 
 
+def create_asgi_app():
+    """ASGI wrapper of :func:`create_app` for uvicorn workers (needs the ``asgi`` extra)."""
+    from asgiref.wsgi import WsgiToAsgi
+
+    return WsgiToAsgi(create_app())
+
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
-    app.run(host="0.0.0.0", port=port, debug=False)
+    flask_app = create_app()
+    start_warmup()
+    start_reaper()
+    flask_app.run(host="0.0.0.0", port=port, debug=False)
@@ -0,0 +1,135 @@
+import io
+import tracemalloc
+import unittest
+import wave
+from unittest.mock import patch
+
+from dashscope.audio.tts_v2 import AudioFormat
+
+from lib.audio import (
+    AudioConversionError,
+    AudioOptions,
+    dashscope_format,
+    dashscope_source_format,
+    needs_transcode,
+    podcast_source_format,
+    sniff_format,
+    transcode,
+    transcode_stream,
+)
+
+
+def make_wav(frames: int, rate: int) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(2)
+        writer.setframerate(rate)
+        writer.writeframes(b"\x00\x01" * frames)
+    return buffer.getvalue()
+
+
+class AudioOptionsTest(unittest.TestCase):
+    def test_from_payload(self):
+        options = AudioOptions.from_payload({"format": "OGG_OPUS", "sample_rate": 48000, "bitrate": 32})
+        self.assertEqual(options, AudioOptions("opus", 48000, 32))
+        self.assertTrue(AudioOptions.from_payload({}).is_default())
+
+    def test_from_payload_validation(self):
+        for payload in ({"format": "flac"}, {"sample_rate": 12345}, {"bitrate": "64"},
+                        {"format": "wav", "bitrate": 64}):
+            with self.assertRaises(ValueError):
+                AudioOptions.from_payload(payload)
+
+
+class UpstreamFormatTest(unittest.TestCase):
+    def test_dashscope_native_format(self):
+        self.assertEqual(dashscope_format(AudioOptions("opus", 24000, 32)), AudioFormat.OGG_OPUS_24KHZ_MONO_32KBPS)
+        self.assertEqual(dashscope_format(AudioOptions("wav", 16000)), AudioFormat.WAV_16000HZ_MONO_16BIT)
+        self.assertIsNone(dashscope_format(AudioOptions()))
+
+    def test_dashscope_format_defaults_to_native_rate(self):
+        cases = {
+            AudioOptions("mp3"): AudioFormat.MP3_24000HZ_MONO_256KBPS,
+            AudioOptions("wav"): AudioFormat.WAV_24000HZ_MONO_16BIT,
+            AudioOptions("pcm"): AudioFormat.PCM_24000HZ_MONO_16BIT,
+            AudioOptions("opus"): AudioFormat.OGG_OPUS_24KHZ_MONO_16KBPS,
+            AudioOptions("opus", bitrate=64): AudioFormat.OGG_OPUS_24KHZ_MONO_64KBPS,
+            AudioOptions(bitrate=256): AudioFormat.MP3_24000HZ_MONO_256KBPS,
+        }
+        for options, expected in cases.items():
+            self.assertEqual(dashscope_format(options), expected, options)
+        # No 24 kHz MP3 at 128 kbps: WAV is requested and transcoded instead of falling back to 8 kHz.
+        self.assertIsNone(dashscope_format(AudioOptions("mp3", bitrate=128)))
+
+    def test_dashscope_fallback_source(self):
+        options = AudioOptions("mp3", 32000)
+        self.assertIsNone(dashscope_format(options))
+        self.assertEqual(dashscope_source_format(options), AudioFormat.WAV_24000HZ_MONO_16BIT)
+
+    def test_podcast_source_format(self):
+        self.assertEqual(podcast_source_format(AudioOptions()), ("mp3", 24000))
+        self.assertEqual(podcast_source_format(AudioOptions("wav", 16000)), ("pcm", 16000))
+        self.assertFalse(needs_transcode("mp3", 24000, AudioOptions()))
+        self.assertTrue(needs_transcode("pcm", 16000, AudioOptions("wav", 16000)))
+        self.assertTrue(needs_transcode("mp3", 24000, AudioOptions("mp3", bitrate=64)))
+
+
+class TranscodeTest(unittest.TestCase):
+    def test_sniff_format(self):
+        self.assertEqual(sniff_format(make_wav(10, 8000)), "wav")
+        self.assertEqual(sniff_format(b"OggS\x00"), "opus")
+        self.assertEqual(sniff_format(b"ID3\x04"), "mp3")
+        self.assertIsNone(sniff_format(b"\x00\x00"))
+
+    def test_wav_to_pcm_and_back(self):
+        wav = make_wav(100, 16000)
+        pcm = transcode(wav, AudioOptions("pcm"))
+        self.assertEqual(pcm, b"\x00\x01" * 100)
+
+        wrapped = transcode(pcm, AudioOptions("wav"), src_format="pcm", src_rate=16000)
+        with wave.open(io.BytesIO(wrapped), "rb") as reader:
+            self.assertEqual(reader.getframerate(), 16000)
+            self.assertEqual(reader.getnframes(), 100)
+
+    def test_resample_wav(self):
+        resampled = transcode(make_wav(1600, 16000), AudioOptions("wav", 8000))
+        with wave.open(io.BytesIO(resampled), "rb") as reader:
+            self.assertEqual(reader.getframerate(), 8000)
+            self.assertAlmostEqual(reader.getnframes(), 800, delta=2)
+
+    def test_stream_matches_whole_payload(self):
+        wav = make_wav(4000, 16000)
+        pieces = [wav[i:i + 999] for i in range(0, len(wav), 999)]  # odd sizes split samples
+        streamed = b"".join(transcode_stream(pieces, AudioOptions("pcm", 8000), "wav"))
+        self.assertEqual(streamed, transcode(wav, AudioOptions("pcm", 8000)))
+
+    def test_stream_buffering_does_not_grow_with_length(self):
+        def peak(chunks):
+            episode = (b"\x00\x01" * 32 * 1024 for _ in range(chunks))
+            tracemalloc.start()
+            try:
+                for _ in transcode_stream(episode, AudioOptions("wav", 16000), "pcm", 24000):
+                    pass
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        short, long = peak(8), peak(128)  # 512 KiB vs 8 MiB of audio
+        self.assertLess(long, 512 * 1024)
+        self.assertLess(long, short * 2)
+
+    def test_streamed_wav_header_is_patched(self):
+        wav = transcode(b"\x00\x01" * 10, AudioOptions("wav"), src_format="pcm", src_rate=8000)
+        self.assertEqual(len(wav), 64)
+        with wave.open(io.BytesIO(wav), "rb") as reader:
+            self.assertEqual(reader.getnframes(), 10)
+
+    def test_compressed_target_requires_ffmpeg(self):
+        with patch("lib.audio.shutil.which", return_value=None):
+            with self.assertRaises(AudioConversionError):
+                transcode(make_wav(10, 16000), AudioOptions("opus"))
+
+
+if __name__ == "__main__":
+    unittest.main()
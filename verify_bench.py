@@ -0,0 +1,64 @@
+import asyncio
+import unittest
+
+from bench.fake_upstreams import FakePodcastServer, FakeRedis
+from bench.run import percentile
+from lib.podcast.client import PodcastTTSClient
+
+
+class FakePodcastServerTest(unittest.TestCase):
+    def test_client_round_trip(self):
+        server = FakePodcastServer(round_delay=0.01, chunks=3, chunk_size=100).start()
+        try:
+            client = PodcastTTSClient(appid="a", access_token="t", endpoint=server.url)
+            scripts = [{"speaker": "s1", "text": "one"}, {"speaker": "s2", "text": "two"}]
+            audio = asyncio.run(client.generate_audio(scripts))
+        finally:
+            server.stop()
+
+        self.assertEqual(len(audio), 2 * 3 * 100)
+        self.assertEqual(server.sessions, 1)
+
+
+class FakeRedisTest(unittest.TestCase):
+    def test_set_nx_and_pipeline(self):
+        client = FakeRedis()
+        self.assertTrue(client.set("k", "v", nx=True, ex=10))
+        self.assertIsNone(client.set("k", "w", nx=True))
+
+        pipe = client.pipeline(transaction=False)
+        pipe.setex("a", 10, b"1")
+        pipe.get("k")
+        self.assertEqual(pipe.execute(), [True, b"v"])
+        self.assertEqual(client.mget(["a", "missing"]), [b"1", None])
+
+    def test_profile_store_commands(self):
+        client = FakeRedis()
+        client.set("arm", 2, ex=60)
+        self.assertEqual([client.decr("arm"), client.decr("arm"), client.decr("gone")], [1, 0, -1])
+
+        for item in ("a", "b", "c"):
+            client.lpush("index", item)
+        client.ltrim("index", 0, 1)
+        self.assertEqual(client.lrange("index", 0, -1), [b"c", b"b"])
+        self.assertEqual(client.delete("index"), 1)
+        self.assertEqual(client.lrange("index", 0, -1), [])
+
+    def test_reaper_index(self):
+        client = FakeRedis()
+        client.zadd("active", {"a": 3, "b": 1, "c": 2})
+        self.assertEqual(client.zrangebyscore("active", "-inf", 2.5, start=0, num=1), [b"b"])
+        self.assertEqual(client.zrem("active", "b", "missing"), 1)
+        self.assertEqual(client.zrangebyscore("active", "-inf", "+inf"), [b"c", b"a"])
+
+
+class PercentileTest(unittest.TestCase):
+    def test_nearest_rank(self):
+        values = [float(v) for v in range(1, 101)]
+        self.assertEqual(percentile(values, 50), 50.0)
+        self.assertEqual(percentile(values, 99), 99.0)
+        self.assertEqual(percentile([], 50), 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
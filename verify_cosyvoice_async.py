@@ -12,7 +12,12 @@ with patch.dict(os.environ, {"VOLC_APPID": "test_app_id", "VOLC_ACCESS_TOKEN": "
     with patch("redis.from_url") as mock_redis_init:
         mock_redis = MagicMock()
         mock_redis_init.return_value = mock_redis
-        from server import app, process_cosyvoice_task
+        import server
+        from server import app, process_cosyvoice_task, redis_client
+
+from bench.fake_upstreams import FakeRedis, FakeSynthesizer
+from lib.cancellation import CancellationRegistry
+from lib.deadline import Deadline
 
 class CosyVoiceAsyncValidationTest(unittest.TestCase):
     def setUp(self):
@@ -21,10 +26,10 @@ class CosyVoiceAsyncValidationTest(unittest.TestCase):
         # Reset redis mock
         from server import redis_client
         self.redis_client = redis_client
-        self.redis_client.reset_mock()
+        self.redis_client.reset_mock(return_value=True, side_effect=True)
 
-    @patch("server.threading.Thread")
-    def test_cosyvoice_endpoint_async_submit(self, MockThread):
+    @patch("server.get_scheduler")
+    def test_cosyvoice_endpoint_async_submit(self, MockScheduler):
         payload = {
             "text": "Hello world",
             "voice": "test_voice",
@@ -41,8 +46,7 @@ class CosyVoiceAsyncValidationTest(unittest.TestCase):
         task_id = data["task_id"]
         
         # Verify initial redis state set
-        self.redis_client.setex.assert_called_once()
-        args, _ = self.redis_client.setex.call_args
+        args, _ = self.redis_client.pipeline.return_value.setex.call_args_list[0]
         self.assertEqual(args[0], f"cosyvoice_task:{task_id}")
         # TTL check (REDIS_TTL is 7 days)
         self.assertEqual(args[1], 7 * 24 * 3600)
@@ -50,16 +54,103 @@ class CosyVoiceAsyncValidationTest(unittest.TestCase):
         self.assertEqual(stored_data["status"], "processing")
         self.assertEqual(stored_data["task_id"], task_id)
         
-        # Verify thread started
-        MockThread.assert_called_once()
-        thread_args = MockThread.call_args[1]
-        self.assertEqual(thread_args["target"], process_cosyvoice_task)
+        # Verify the task was queued
+        submit = MockScheduler.return_value.submit
+        submit.assert_called_once()
+        job_args, job_kwargs = submit.call_args
+        self.assertEqual(job_args[0], process_cosyvoice_task)
+        thread_args = {"args": job_args[1:]}
         self.assertEqual(thread_args["args"][0], task_id)
         self.assertEqual(thread_args["args"][1], payload["text"])
         self.assertEqual(thread_args["args"][2], payload["voice"])
         self.assertEqual(thread_args["args"][3], payload["model"])
         
-        MockThread.return_value.start.assert_called_once()
+        self.assertEqual(job_kwargs, {"tenant": "default", "priority": "interactive"})
+
+    @patch("server.get_scheduler")
+    def test_cosyvoice_async_submit_coalesces_duplicates(self, MockScheduler):
+        existing = {"status": "processing", "task_id": "existing-id"}
+
+        def fake_get(key):
+            if key.startswith("cosyvoice_inflight:"):
+                return b"existing-id"
+            if key == "cosyvoice_task:existing-id":
+                return json.dumps(existing).encode("utf-8")
+            return None
+
+        self.redis_client.set.return_value = None
+        self.redis_client.get.side_effect = fake_get
+
+        response = self.app.post("/v1/voice/cosyvoice/async",
+                                 data=json.dumps({"text": "Hello world"}),
+                                 content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)["task_id"], "existing-id")
+        self.redis_client.setex.assert_not_called()
+        MockScheduler.return_value.submit.assert_not_called()
+
+    @patch("server.get_scheduler")
+    def test_cosyvoice_async_submit_reservation_races(self, MockScheduler):
+        redis = FakeRedis()
+        payload = json.dumps({"text": "Hello world"})
+        with patch("server.get_redis", return_value=redis), patch.dict("server._clients"):
+            first = self.app.post("/v1/voice/cosyvoice/async", data=payload, content_type="application/json")
+            first_id = json.loads(first.data)["task_id"]
+            key = redis.keys("cosyvoice_inflight:*")[0].decode()
+
+            # Reserved, record not written yet: still the same task.
+            redis.delete(f"cosyvoice_task:{first_id}")
+            second = self.app.post("/v1/voice/cosyvoice/async", data=payload, content_type="application/json")
+            self.assertEqual(json.loads(second.data)["task_id"], first_id)
+
+            # Finished without releasing: exactly one takeover wins.
+            redis.set(f"cosyvoice_task:{first_id}", json.dumps({"status": "success"}))
+            third = self.app.post("/v1/voice/cosyvoice/async", data=payload, content_type="application/json")
+            third_id = json.loads(third.data)["task_id"]
+            self.assertNotEqual(third_id, first_id)
+            self.assertEqual(redis.get(key), third_id.encode())
+            self.assertFalse(server._compare_and_set(key, first_id.encode(), "late", 60))
+            self.assertEqual(redis.get(key), third_id.encode())
+
+        self.assertEqual(MockScheduler.return_value.submit.call_count, 2)
+
+    @patch("server.get_scheduler")
+    def test_cosyvoice_async_submit_idempotency_key(self, MockScheduler):
+        self.redis_client.set.return_value = None
+        self.redis_client.get.return_value = b"first-id"
+
+        response = self.app.post("/v1/voice/cosyvoice/async",
+                                 data=json.dumps({"text": "Hello world"}),
+                                 content_type="application/json",
+                                 headers={"Idempotency-Key": "retry-1"})
+
+        self.assertEqual(json.loads(response.data)["task_id"], "first-id")
+        self.redis_client.set.assert_called_once_with(
+            "cosyvoice_idempotency:retry-1", ANY, nx=True, ex=7 * 24 * 3600
+        )
+        MockScheduler.return_value.submit.assert_not_called()
+
+    @patch("dashscope.audio.tts_v2.SpeechSynthesizer")
+    def test_cosyvoice_requested_format_passed_upstream(self, MockSynthesizer):
+        from dashscope.audio.tts_v2 import AudioFormat
+
+        MockSynthesizer.return_value.call.return_value = b"opus"
+        MockSynthesizer.return_value.get_last_request_id.return_value = "req-1"
+        MockSynthesizer.return_value.get_first_package_delay.return_value = 10
+
+        response = self.app.post("/v1/voice/cosyvoice",
+                                 data=json.dumps({"text": "Hi", "format": "opus", "sample_rate": 24000, "bitrate": 32}),
+                                 content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(MockSynthesizer.call_args.kwargs["format"], AudioFormat.OGG_OPUS_24KHZ_MONO_32KBPS)
+
+    def test_cosyvoice_invalid_format(self):
+        response = self.app.post("/v1/voice/cosyvoice/async",
+                                 data=json.dumps({"text": "Hi", "format": "flac"}),
+                                 content_type="application/json")
+        self.assertEqual(response.status_code, 400)
 
     def test_query_cosyvoice_task_found(self):
         task_id = "some-uuid"
@@ -81,6 +172,20 @@ class CosyVoiceAsyncValidationTest(unittest.TestCase):
         response = self.app.get("/v1/voice/cosyvoice/async/missing-id")
         self.assertEqual(response.status_code, 404)
 
+    @patch("server.synthesize")
+    def test_process_cosyvoice_task_cancelled_while_queued(self, mock_synthesize):
+        # The worker's start pipeline finds the cancel key set by DELETE.
+        self.redis_client.pipeline.return_value.execute.return_value = [1, True, True]
+
+        process_cosyvoice_task("task-q", "Hello", "v1", "m1", {})
+
+        mock_synthesize.assert_not_called()
+        pipe = self.redis_client.pipeline.return_value
+        pipe.exists.assert_called_once_with("cosyvoice_cancel:task-q")
+        val = json.loads(pipe.setex.call_args[0][2])
+        self.assertEqual(val["status"], "cancelled")
+        self.redis_client.delete.assert_any_call("cosyvoice_cancel:task-q")
+
     @patch("server.synthesize")
     def test_process_cosyvoice_task_success(self, mock_synthesize):
         # synthesize returns (audio_bytes, request_id, first_pkg_delay)
@@ -96,8 +201,8 @@ class CosyVoiceAsyncValidationTest(unittest.TestCase):
         process_cosyvoice_task(task_id, text, voice, model, kwargs)
         
         # Verify redis update for success
-        self.redis_client.setex.assert_called()
-        call_args = self.redis_client.setex.call_args
+        self.redis_client.pipeline.return_value.setex.assert_called()
+        call_args = self.redis_client.pipeline.return_value.setex.call_args
         key = call_args[0][0]
         val = json.loads(call_args[0][2])
         
@@ -117,11 +222,119 @@ class CosyVoiceAsyncValidationTest(unittest.TestCase):
         
         process_cosyvoice_task(task_id, "text", "voice", "model", {})
         
-        self.redis_client.setex.assert_called()
-        val = json.loads(self.redis_client.setex.call_args[0][2])
+        self.redis_client.pipeline.return_value.setex.assert_called()
+        val = json.loads(self.redis_client.pipeline.return_value.setex.call_args[0][2])
         
         self.assertEqual(val["status"], "failed")
         self.assertEqual(val["error"], "TTS Error")
 
+    @patch("server.TENANT_API_KEYS", {"key-1": {"tenant": "newsroom", "priority": "batch"},
+                                      "gateway": {"tenant_header": True, "priority_override": True}})
+    @patch("server.get_scheduler")
+    def test_cosyvoice_async_scheduling_class(self, MockScheduler):
+        submit = MockScheduler.return_value.submit
+        self.app.post("/v1/voice/cosyvoice/async", data=json.dumps({"text": "a"}), content_type="application/json",
+                      headers={"Authorization": "Bearer key-1"})
+        self.assertEqual(submit.call_args[1], {"tenant": "newsroom", "priority": "batch"})
+
+        self.app.post("/v1/voice/cosyvoice/async", data=json.dumps({"text": "b", "priority": "interactive"}),
+                      content_type="application/json", headers={"X-API-Key": "gateway", "X-Tenant-Id": "player"})
+        self.assertEqual(submit.call_args[1], {"tenant": "player", "priority": "interactive"})
+
+        response = self.app.post("/v1/voice/cosyvoice/async", data=json.dumps({"text": "c", "priority": "urgent"}),
+                                 content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(submit.call_count, 2)
+
+    @patch("server.TENANT_API_KEYS", {"key-1": {"tenant": "newsroom", "priority": "batch"}})
+    @patch("server.get_scheduler")
+    def test_cosyvoice_async_untrusted_scheduling_hints(self, MockScheduler):
+        submit = MockScheduler.return_value.submit
+        self.app.post("/v1/voice/cosyvoice/async", data=json.dumps({"text": "a", "priority": "interactive"}),
+                      content_type="application/json", headers={"X-API-Key": "key-1", "X-Tenant-Id": "other"})
+        self.assertEqual(submit.call_args[1], {"tenant": "newsroom", "priority": "batch"})
+
+        self.app.post("/v1/voice/cosyvoice/async", data=json.dumps({"text": "b", "priority": "batch"}),
+                      content_type="application/json", headers={"X-Tenant-Id": "player"})
+        self.assertEqual(submit.call_args[1], {"tenant": "default", "priority": "batch"})
+
+    def test_cancel_cosyvoice_task(self):
+        self.redis_client.get.return_value = json.dumps({"status": "processing"}).encode("utf-8")
+        response = self.app.delete("/v1/voice/cosyvoice/async/task-1")
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(json.loads(response.data)["status"], "cancelling")
+        self.redis_client.set.assert_called_once_with("cosyvoice_cancel:task-1", 1, ex=3600)
+
+    def test_cancel_finished_or_missing_cosyvoice_task(self):
+        self.redis_client.get.return_value = json.dumps({"status": "success"}).encode("utf-8")
+        self.assertEqual(self.app.delete("/v1/voice/cosyvoice/async/task-1").status_code, 409)
+        self.redis_client.get.return_value = None
+        self.assertEqual(self.app.delete("/v1/voice/cosyvoice/async/task-1").status_code, 404)
+        self.redis_client.set.assert_not_called()
+
+    def test_process_cosyvoice_task_cancelled(self):
+        self.redis_client.mget.return_value = [b"1"]
+        registry = CancellationRegistry(lambda: self.redis_client, interval=0.01)
+
+        with patch.dict("server._clients", {"cancellations": registry}), \
+                patch("dashscope.audio.tts_v2.SpeechSynthesizer", FakeSynthesizer), \
+                patch.object(FakeSynthesizer, "delay", 30):
+            started = time.monotonic()
+            process_cosyvoice_task("task-c", "text", "voice", "model", {})
+
+        self.assertLess(time.monotonic() - started, 5)
+        val = json.loads(self.redis_client.pipeline.return_value.setex.call_args[0][2])
+        self.assertEqual(val["status"], "cancelled")
+        self.redis_client.delete.assert_any_call("cosyvoice_cancel:task-c")
+
+    def test_cosyvoice_request_timeout(self):
+        with patch("dashscope.audio.tts_v2.SpeechSynthesizer", FakeSynthesizer), \
+                patch.object(FakeSynthesizer, "delay", 30):
+            started = time.monotonic()
+            response = self.app.post("/v1/voice/cosyvoice", data=json.dumps({"text": "Hi", "timeout": 0.2}),
+                                     content_type="application/json")
+
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(response.status_code, 504)
+        self.assertEqual(json.loads(response.data), {"error": "deadline exceeded"})
+
+        response = self.app.post("/v1/voice/cosyvoice", data=json.dumps({"text": "Hi"}),
+                                 content_type="application/json", headers={"X-Request-Deadline": "soon"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_upstream_timeout_before_deadline_is_not_504(self):
+        with patch("dashscope.audio.tts_v2.SpeechSynthesizer", FakeSynthesizer), \
+                patch.object(FakeSynthesizer, "call", side_effect=TimeoutError("start speech synthesizer failed within 5s.")):
+            response = self.app.post("/v1/voice/cosyvoice", data=json.dumps({"text": "Hi", "timeout": 60}),
+                                     content_type="application/json")
+
+        self.assertEqual(response.status_code, 500)
+
+    def test_process_cosyvoice_task_upstream_timeout_expires(self):
+        with patch("dashscope.audio.tts_v2.SpeechSynthesizer", FakeSynthesizer), \
+                patch.object(FakeSynthesizer, "delay", 30):
+            process_cosyvoice_task("task-t", "text", "voice", "model", {}, deadline=Deadline(time.time() + 0.2))
+
+        val = json.loads(self.redis_client.pipeline.return_value.setex.call_args[0][2])
+        self.assertEqual((val["state"], val["error"]), ("expired", "deadline exceeded"))
+
+    @patch("server.get_scheduler")
+    def test_cosyvoice_async_deadline_passed_to_task(self, MockScheduler):
+        before = time.time()
+        self.app.post("/v1/voice/cosyvoice/async", data=json.dumps({"text": "a", "timeout": 60}),
+                      content_type="application/json", headers={"X-Request-Deadline": str(before + 30)})
+        deadline = MockScheduler.return_value.submit.call_args[0][-1]
+        self.assertEqual(deadline.expires_at, before + 30)
+
+    @patch("server.synthesize")
+    def test_process_cosyvoice_task_deadline_passed(self, mock_synthesize):
+        process_cosyvoice_task("task-late", "text", "voice", "model", {}, deadline=Deadline(time.time() - 1))
+
+        mock_synthesize.assert_not_called()
+        val = json.loads(self.redis_client.pipeline.return_value.setex.call_args[0][2])
+        self.assertEqual(val["status"], "failed")
+        self.assertEqual(val["error"], "deadline exceeded")
+
 if __name__ == "__main__":
     unittest.main()
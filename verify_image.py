@@ -0,0 +1,82 @@
+import base64
+import unittest
+import unittest.mock
+from io import BytesIO
+
+from PIL import Image
+
+from lib import image as image_module
+from lib.image import ImageLimits, ImageRejected, read_source, stitch_images
+from lib.stitch_pool import StitchPool
+
+
+def encoded(mode: str, size, fmt: str = "PNG", color=None) -> str:
+    buffered = BytesIO()
+    Image.new(mode, size, color).save(buffered, format=fmt)
+    return base64.b64encode(buffered.getvalue()).decode("ascii")
+
+
+def decoded(png: bytes) -> Image.Image:
+    return Image.open(BytesIO(png))
+
+
+class StitchImagesTest(unittest.TestCase):
+    def test_stitches_mixed_modes_as_rgb(self):
+        png = stitch_images([encoded("RGBA", (10, 20), color=(255, 0, 0, 128)),
+                             "data:image/png;base64," + encoded("P", (5, 10)),
+                             encoded("CMYK", (4, 4), "JPEG")], "horizontal")
+        result = decoded(png)
+        self.assertEqual((result.mode, result.size), ("RGB", (19, 20)))
+        self.assertEqual(result.getpixel((0, 0)), (255, 0, 0))
+
+    def test_max_size_scales_jpegs_down(self):
+        png = stitch_images([encoded("RGB", (800, 400), "JPEG"), encoded("RGB", (100, 60))], "vertical",
+                            max_size=200)
+        self.assertEqual(decoded(png).size, (200, 160))
+
+    def test_oversized_inputs_are_rejected(self):
+        limits = ImageLimits(max_pixels=100 * 100)
+        with self.assertRaises(ImageRejected):
+            stitch_images([encoded("RGB", (101, 100)), encoded("RGB", (10, 10))], "vertical", limits)
+        with self.assertRaises(ImageRejected):
+            stitch_images([encoded("RGB", (10, 10))] * 2, "vertical", ImageLimits(max_bytes=16))
+
+    def test_invalid_inputs_are_skipped(self):
+        png = stitch_images(["not an image", encoded("RGB", (10, 10))], "vertical")
+        self.assertEqual(decoded(png).size, (10, 10))
+
+        with self.assertRaises(ValueError):
+            stitch_images(["not an image"], "vertical")
+
+    def test_rejects_large_output_before_decoding(self):
+        limits = ImageLimits(max_output_pixels=1000)
+        with self.assertRaises(ImageRejected):
+            stitch_images([encoded("RGB", (30, 30))] * 2, "horizontal", limits)
+
+    def test_base64_byte_limit(self):
+        source = encoded("RGB", (64, 64), color=(1, 2, 3))
+        with self.assertRaises(ImageRejected):
+            read_source(source, ImageLimits(max_bytes=len(source) // 2))
+
+
+class StitchPoolTest(unittest.TestCase):
+    def test_pool_output_matches_in_process_output(self):
+        sources = [encoded("RGB", (300, 200), "JPEG", (200, 10, 10)), encoded("LA", (120, 260)),
+                   encoded("RGB", (50, 50), color=(0, 0, 255))]
+        with unittest.mock.patch.object(image_module, "PNG_STRIP_BYTES", 300 * 3 * 16):
+            expected = stitch_images(sources, "horizontal")  # several strips
+            pool = StitchPool(2)
+            try:
+                self.assertEqual(stitch_images(sources, "horizontal", pool=pool), expected)
+            finally:
+                pool.shutdown()
+
+        result = decoded(expected)
+        result.load()  # checks the zlib stream and its checksum
+        self.assertEqual(result.size, (470, 260))
+        self.assertEqual(result.getpixel((460, 10)), (0, 0, 255))
+        self.assertEqual(result.getpixel((460, 100)), (0, 0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import base64
+import json
+import os
+import tempfile
+import unittest
+from io import BytesIO
+from unittest.mock import MagicMock, patch
+
+# Mock environment variables before importing server
+with patch.dict(os.environ, {"VOLC_APPID": "test_app_id", "VOLC_ACCESS_TOKEN": "test_token", "REDIS_URL": "redis://mock", "DASHSCOPE_API_KEY": "mock_key"}):
+    # Mock redis before importing server
+    with patch("redis.from_url") as mock_redis_init:
+        mock_redis = MagicMock()
+        mock_redis_init.return_value = mock_redis
+        from server import app, process_stitch_task, redis_client
+
+from PIL import Image
+
+from lib.image import ImageLimits
+from lib.storage.filesystem import FilesystemStorage
+
+
+def encoded(size, color) -> str:
+    buffered = BytesIO()
+    Image.new("RGB", size, color).save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode("ascii")
+
+
+class StitchAsyncTest(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        from server import redis_client
+        self.redis_client = redis_client
+        self.redis_client.reset_mock(return_value=True, side_effect=True)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage = FilesystemStorage(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @patch("server.get_scheduler")
+    def test_async_stitch_submit(self, MockScheduler):
+        images = [encoded((4, 4), "red")]
+        response = self.app.post("/v1/image/stitch/async", data=json.dumps({"images": images, "priority": "batch"}),
+                                 content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+        task_id = json.loads(response.data)["task_id"]
+        args, _ = self.redis_client.pipeline.return_value.setex.call_args
+        self.assertEqual(args[0], f"stitch_task:{task_id}")
+        self.assertEqual(json.loads(args[2])["status"], "processing")
+
+        job_args, job_kwargs = MockScheduler.return_value.submit.call_args
+        self.assertEqual(job_args[:5], (process_stitch_task, task_id, images, "horizontal", None))
+        self.assertEqual(job_kwargs, {"tenant": "default", "priority": "batch"})
+
+    def test_async_stitch_validation(self):
+        for payload in ({"images": []}, {"images": ["x"], "max_size": 0}):
+            response = self.app.post("/v1/image/stitch/async", data=json.dumps(payload),
+                                     content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+        self.redis_client.pipeline.return_value.setex.assert_not_called()
+
+    @patch("server.get_stitch_pool", return_value=None)
+    def test_process_and_download(self, _pool):
+        with patch.dict("server._clients", {"result_storage": self.storage}):
+            process_stitch_task("task-1", [encoded((4, 4), "red"), encoded((2, 4), "blue")], "horizontal")
+
+            record = json.loads(self.redis_client.pipeline.return_value.setex.call_args[0][2])
+            self.assertEqual(record["status"], "success")
+            self.assertEqual(record["image_ref"], "stitch/task-1")
+            self.redis_client.get.return_value = json.dumps(record).encode("utf-8")
+
+            status = json.loads(self.app.get("/v1/image/stitch/async/task-1").data)
+            self.assertNotIn("image_ref", status)
+            self.assertEqual(status["image_url"], "/v1/image/stitch/async/task-1/image")
+
+            response = self.app.get(status["image_url"])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "image/png")
+        self.assertEqual(int(response.headers["Content-Length"]), record["size"])
+        self.assertEqual(Image.open(BytesIO(response.data)).size, (6, 4))
+
+    def test_download_unfinished_or_missing(self):
+        self.redis_client.get.return_value = json.dumps({"status": "processing"}).encode("utf-8")
+        self.assertEqual(self.app.get("/v1/image/stitch/async/task-1/image").status_code, 409)
+        self.redis_client.get.return_value = None
+        self.assertEqual(self.app.get("/v1/image/stitch/async/task-1/image").status_code, 404)
+
+    @patch("server.get_stitch_pool", return_value=None)
+    def test_process_stitch_failure(self, _pool):
+        process_stitch_task("task-2", ["not an image"], "vertical")
+
+        record = json.loads(self.redis_client.pipeline.return_value.setex.call_args[0][2])
+        self.assertEqual(record["status"], "failed")
+        self.assertEqual(record["error"], "No valid images to stitch")
+
+
+@patch("server.get_stitch_pool", return_value=None)
+class StitchUploadTest(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+
+    def png(self, size, color) -> bytes:
+        return base64.b64decode(encoded(size, color))
+
+    def test_multipart_upload(self, _pool):
+        response = self.app.post("/v1/image/stitch", content_type="multipart/form-data", data={
+            "images": [(BytesIO(self.png((4, 4), "red")), "a.png"), (BytesIO(self.png((4, 2), "blue")), "b.png")],
+            "direction": "vertical",
+            "max_size": "2",
+        })
+
+        self.assertEqual(response.status_code, 200)
+        result = Image.open(BytesIO(base64.b64decode(response.get_json()["image_b64"])))
+        self.assertEqual(result.size, (2, 3))
+        self.assertEqual(result.getpixel((0, 0)), (255, 0, 0))
+
+    def test_raw_upload(self, _pool):
+        response = self.app.post("/v1/image/stitch?max_size=2", data=self.png((4, 4), "red"),
+                                 content_type="image/png")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Image.open(BytesIO(base64.b64decode(response.get_json()["image_b64"]))).size, (2, 2))
+
+        with patch("server.IMAGE_LIMITS", ImageLimits(max_bytes=10)):
+            response = self.app.post("/v1/image/stitch", data=self.png((4, 4), "red"), content_type="image/png")
+        self.assertEqual(response.status_code, 413)
+
+
+if __name__ == "__main__":
+    unittest.main()
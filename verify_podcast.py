@@ -1,18 +1,26 @@
 
+import asyncio
 import unittest
 from unittest.mock import patch, MagicMock, ANY
 import os
 import json
 import base64
+import gzip
+import tempfile
 import time
 
 # Mock environment variables before importing server
-with patch.dict(os.environ, {"VOLC_APPID": "test_app_id", "VOLC_ACCESS_TOKEN": "test_token", "REDIS_URL": "redis://mock"}):
+with patch.dict(os.environ, {"VOLC_APPID": "test_app_id", "VOLC_ACCESS_TOKEN": "test_token", "REDIS_URL": "redis://mock", "ENABLE_COSYVOICE": "0"}):
     # Mock redis before importing server
     with patch("redis.from_url") as mock_redis_init:
         mock_redis = MagicMock()
         mock_redis_init.return_value = mock_redis
-        from server import app, process_podcast_task
+        from server import app, process_podcast_task, redis_client
+
+from lib.audio import AudioOptions
+from lib.cancellation import CancellationRegistry
+from lib.podcast.client import PodcastRound
+from lib.storage.filesystem import FilesystemStorage
 
 class PodcastAsyncValidationTest(unittest.TestCase):
     def setUp(self):
@@ -21,10 +29,10 @@ class PodcastAsyncValidationTest(unittest.TestCase):
         # Reset redis mock
         from server import redis_client
         self.redis_client = redis_client
-        self.redis_client.reset_mock()
+        self.redis_client.reset_mock(return_value=True, side_effect=True)
 
-    @patch("server.threading.Thread")
-    def test_podcast_endpoint_async_submit(self, MockThread):
+    @patch("server.get_scheduler")
+    def test_podcast_endpoint_async_submit(self, MockScheduler):
         payload = {
             "scripts": [{"speaker": "s1", "text": "t1"}],
             "use_head_music": True
@@ -40,8 +48,7 @@ class PodcastAsyncValidationTest(unittest.TestCase):
         task_id = data["task_id"]
         
         # Verify initial redis state set
-        self.redis_client.setex.assert_called_once()
-        args, _ = self.redis_client.setex.call_args
+        args, _ = self.redis_client.pipeline.return_value.setex.call_args_list[0]
         self.assertEqual(args[0], f"podcast_task:{task_id}")
         # TTL check
         self.assertEqual(args[1], 7 * 24 * 3600)
@@ -49,15 +56,17 @@ class PodcastAsyncValidationTest(unittest.TestCase):
         self.assertEqual(stored_data["status"], "processing")
         self.assertEqual(stored_data["task_id"], task_id)
         
-        # Verify thread started
-        MockThread.assert_called_once()
-        thread_args = MockThread.call_args[1]
-        self.assertEqual(thread_args["target"], process_podcast_task)
+        # Verify the task was queued
+        submit = MockScheduler.return_value.submit
+        submit.assert_called_once()
+        job_args, job_kwargs = submit.call_args
+        self.assertEqual(job_args[0], process_podcast_task)
+        thread_args = {"args": job_args[1:]}
         self.assertEqual(thread_args["args"][0], task_id)
         self.assertEqual(thread_args["args"][1], payload["scripts"])
         self.assertEqual(thread_args["args"][2], True) # head music
         
-        MockThread.return_value.start.assert_called_once()
+        self.assertEqual(job_kwargs, {"tenant": "default", "priority": "interactive"})
 
     def test_query_podcast_task_found(self):
         task_id = "some-uuid"
@@ -74,6 +83,44 @@ class PodcastAsyncValidationTest(unittest.TestCase):
         self.assertEqual(json.loads(response.data), mock_data)
         self.redis_client.get.assert_called_with(f"podcast_task:{task_id}")
 
+    def test_query_podcast_task_conditional_and_compressed(self):
+        storage = MagicMock()
+        storage.get.return_value = b"\x00" * 4096
+        record = {"status": "success", "voice_ref": "podcast/t1", "task_id": "t1"}
+        self.redis_client.get.return_value = json.dumps(record).encode("utf-8")
+
+        with patch.dict("server._clients", {"result_storage": storage}):
+            response = self.app.get("/v1/voice/podcast/t1", headers={"Accept-Encoding": "gzip"})
+            etag = response.headers["ETag"]
+            self.assertNotIn("Content-Encoding", response.headers)  # audio is not worth compressing
+            self.assertIn("immutable", response.headers["Cache-Control"])
+            self.assertEqual(json.loads(response.data)["voice_b64"], base64.b64encode(b"\x00" * 4096).decode("ascii"))
+
+            response = self.app.get("/v1/voice/podcast/t1",
+                                    headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.data, b"")
+            self.assertEqual(storage.get.call_count, 1)
+
+            response = self.app.get("/v1/voice/podcast/t1", headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+
+        failed = {"status": "failed", "error": "x" * 4096, "task_id": "t1"}
+        self.redis_client.get.return_value = json.dumps(failed).encode("utf-8")
+        response = self.app.get("/v1/voice/podcast/t1", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(response.data)), failed)
+
+        response = self.app.get("/v1/voice/podcast/t1", headers={"If-None-Match": response.headers["ETag"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Content-Encoding", response.headers)
+
+    def test_query_processing_podcast_task_not_cached(self):
+        self.redis_client.get.return_value = json.dumps({"status": "processing"}).encode("utf-8")
+        response = self.app.get("/v1/voice/podcast/t1")
+        self.assertNotIn("ETag", response.headers)
+        self.assertEqual(response.headers["Cache-Control"], "private, no-cache")
+
     def test_query_podcast_task_not_found(self):
         self.redis_client.get.return_value = None
         response = self.app.get("/v1/voice/podcast/missing-id")
@@ -83,8 +130,8 @@ class PodcastAsyncValidationTest(unittest.TestCase):
     def test_process_podcast_task_success(self, MockClient):
         mock_client_instance = MockClient.return_value
         async def async_mock(*args, **kwargs):
-            return b"audio_bytes"
-        mock_client_instance.generate_audio.side_effect = async_mock
+            return [PodcastRound(round_id=0, speaker="s1", text="hi", audio=b"audio_bytes")]
+        mock_client_instance.generate_rounds.side_effect = async_mock
         
         task_id = "task-123"
         scripts = [{"text": "hi"}]
@@ -93,34 +140,111 @@ class PodcastAsyncValidationTest(unittest.TestCase):
         process_podcast_task(task_id, scripts, False, False)
         
         # Verify redis update for success
-        self.redis_client.setex.assert_called()
-        call_args = self.redis_client.setex.call_args
+        self.redis_client.pipeline.return_value.setex.assert_called()
+        call_args = self.redis_client.pipeline.return_value.setex.call_args
         key = call_args[0][0]
         ttl = call_args[0][1]
         val = json.loads(call_args[0][2])
         
         self.assertEqual(key, f"podcast_task:{task_id}")
+        # Audio results use the shorter result retention
+        self.assertEqual(ttl, 24 * 3600)
         self.assertEqual(val["status"], "success")
         self.assertIn("voice_b64", val)
         # Expected base64 of "audio_bytes" is "YXVkaW9fYnl0ZXM="
         self.assertEqual(val["voice_b64"], "YXVkaW9fYnl0ZXM=")
+        self.assertEqual(val["timeline"], [{"round_id": 0, "speaker": "s1", "text": "hi", "start": 0.0, "end": 0.0,
+                                            "offset": 0, "size": 11}])
+
+    def test_podcast_endpoint_rejects_unknown_subtitles(self):
+        payload = {"scripts": [{"speaker": "s1", "text": "t1"}], "subtitles": "ass"}
+        response = self.app.post("/v1/voice/podcast", data=json.dumps(payload), content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+    @patch("server.PodcastTTSClient")
+    def test_process_podcast_task_spills_large_audio(self, MockClient):
+        async def async_mock(*args, **kwargs):
+            return [PodcastRound(round_id=0, audio=b"audio_bytes")]
+        MockClient.return_value.generate_rounds.side_effect = async_mock
+
+        with tempfile.TemporaryDirectory() as storage_dir, \
+                patch.dict("server._clients", {"result_storage": FilesystemStorage(storage_dir)}), \
+                patch("server.RESULT_INLINE_MAX_BYTES", 4):
+            process_podcast_task("task-big", [{"text": "hi"}], False, False)
+
+            stored = self.redis_client.pipeline.return_value.setex.call_args[0][2]
+            val = json.loads(stored)
+            self.assertNotIn("voice_b64", val)
+            self.assertEqual(val["voice_ref"], "podcast/task-big")
+
+            # Querying inlines the spilled audio again
+            self.redis_client.get.return_value = stored.encode("utf-8")
+            response = self.app.get("/v1/voice/podcast/task-big")
+            self.assertEqual(json.loads(response.data)["voice_b64"], "YXVkaW9fYnl0ZXM=")
+
+    @patch("server.PODCAST_SEGMENT_LINES", 1)
+    @patch("server.PodcastTTSClient")
+    def test_process_podcast_task_parallel_segments(self, MockClient):
+        async def async_mock(scripts, **kwargs):
+            return [PodcastRound(round_id=0, speaker=scripts[0]["speaker"], text=scripts[0]["text"],
+                                 audio=scripts[0]["text"].encode("utf-8") + b"\x00")]
+        MockClient.return_value.generate_rounds.side_effect = async_mock
+
+        scripts = [{"speaker": "a", "text": "one"}, {"speaker": "b", "text": "two"}]
+        process_podcast_task("task-par", scripts, True, True, None, AudioOptions("pcm"), True, "srt")
+
+        calls = MockClient.return_value.generate_rounds.call_args_list
+        self.assertEqual(len(calls), 2)
+        self.assertEqual([c.kwargs["use_head_music"] for c in calls], [True, False])
+        self.assertEqual([c.kwargs["use_tail_music"] for c in calls], [False, True])
+        val = json.loads(self.redis_client.pipeline.return_value.setex.call_args[0][2])
+        self.assertEqual(base64.b64decode(val["voice_b64"]), b"one\x00two\x00")
+        self.assertEqual([(r["round_id"], r["offset"], r["size"]) for r in val["timeline"]], [(0, 0, 4), (1, 4, 4)])
+        self.assertIn("00:00:00,000 --> 00:00:00,000\none", val["subtitles"])
 
     @patch("server.PodcastTTSClient")
     def test_process_podcast_task_failure(self, MockClient):
         mock_client_instance = MockClient.return_value
         async def async_mock(*args, **kwargs):
             raise RuntimeError("TTS Error")
-        mock_client_instance.generate_audio.side_effect = async_mock
+        mock_client_instance.generate_rounds.side_effect = async_mock
         
         task_id = "task-err"
         
         process_podcast_task(task_id, [], False, False)
         
-        self.redis_client.setex.assert_called()
-        val = json.loads(self.redis_client.setex.call_args[0][2])
+        self.redis_client.pipeline.return_value.setex.assert_called()
+        val = json.loads(self.redis_client.pipeline.return_value.setex.call_args[0][2])
         
         self.assertEqual(val["status"], "failed")
         self.assertEqual(val["error"], "TTS Error")
 
+    def test_cancel_podcast_task(self):
+        self.redis_client.get.return_value = json.dumps({"status": "processing"}).encode("utf-8")
+        response = self.app.delete("/v1/voice/podcast/task-1")
+        self.assertEqual(response.status_code, 202)
+        self.redis_client.set.assert_called_once_with("podcast_cancel:task-1", 1, ex=3600)
+
+    @patch("server.PodcastTTSClient")
+    def test_process_podcast_task_cancelled(self, MockClient):
+        stopped = []
+
+        async def never_finishes(*args, **kwargs):
+            try:
+                await asyncio.sleep(30)
+            except asyncio.CancelledError:
+                stopped.append(True)
+                raise
+        MockClient.return_value.generate_rounds.side_effect = never_finishes
+        self.redis_client.mget.return_value = [b"1"]
+        registry = CancellationRegistry(lambda: self.redis_client, interval=0.01)
+
+        with patch.dict("server._clients", {"cancellations": registry}):
+            process_podcast_task("task-c", [{"text": "hi"}], False, False)
+
+        self.assertEqual(stopped, [True])
+        val = json.loads(self.redis_client.pipeline.return_value.setex.call_args[0][2])
+        self.assertEqual(val["status"], "cancelled")
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,67 @@
+import asyncio
+import tempfile
+import unittest
+
+from bench.fake_upstreams import FakePodcastServer
+from lib.podcast.cache import RoundCache, generate_with_cache
+from lib.podcast.client import HEAD_MUSIC_ROUND, TAIL_MUSIC_ROUND, PodcastTTSClient
+from lib.storage.filesystem import FilesystemStorage
+
+
+def line(speaker: str, text: str) -> dict:
+    return {"speaker": speaker, "text": text}
+
+
+class RoundCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.storage_dir = tempfile.TemporaryDirectory()
+        self.cache = RoundCache(FilesystemStorage(self.storage_dir.name), ttl=60)
+        self.server = FakePodcastServer(round_delay=0.0, chunks=1, chunk_size=10).start()
+        self.client = PodcastTTSClient(appid="a", access_token="t", endpoint=self.server.url)
+
+    def tearDown(self):
+        self.server.stop()
+        self.storage_dir.cleanup()
+
+    def generate(self, scripts, **kwargs):
+        return asyncio.run(generate_with_cache(self.client, scripts, self.cache, 4, **kwargs))
+
+    def test_client_keeps_rounds_separate(self):
+        rounds = asyncio.run(self.client.generate_rounds([line("a", "1"), line("b", "2")], use_head_music=True))
+        self.assertEqual([r.round_id for r in rounds], [HEAD_MUSIC_ROUND, 0, 1])
+        self.assertEqual([r.text for r in rounds], [None, "1", "2"])
+        self.assertTrue(all(len(r.audio) == 10 for r in rounds))
+
+    def test_only_changed_lines_are_generated(self):
+        scripts = [line("a", "1"), line("b", "2"), line("a", "3"), line("b", "4")]
+        first = self.generate(scripts, use_head_music=True, use_tail_music=True)
+        self.assertEqual(self.server.sessions, 1)
+        self.assertEqual(len(first), 6)
+
+        edited = [scripts[0], line("b", "2 edited"), scripts[2], line("b", "4 edited")]
+        second = self.generate(edited, use_head_music=True, use_tail_music=True)
+
+        # One session per run of changed lines; music comes from the cache.
+        self.assertEqual(self.server.sessions, 3)
+        self.assertEqual([r.round_id for r in second], [HEAD_MUSIC_ROUND, 0, 1, 2, 3, TAIL_MUSIC_ROUND])
+        self.assertEqual([r.text for r in second[1:-1]], ["1", "2 edited", "3", "4 edited"])
+
+        self.generate(edited, use_head_music=True, use_tail_music=True)
+        self.assertEqual(self.server.sessions, 3)
+
+    def test_missing_music_regenerates_adjacent_line(self):
+        scripts = [line("a", "1"), line("b", "2")]
+        self.generate(scripts)
+        rounds = self.generate(scripts, use_tail_music=True)
+        self.assertEqual(self.server.sessions, 2)
+        self.assertEqual(rounds[-1].round_id, TAIL_MUSIC_ROUND)
+
+    def test_audio_config_is_part_of_the_key(self):
+        scripts = [line("a", "1")]
+        self.generate(scripts, encoding="mp3")
+        self.generate(scripts, encoding="pcm")
+        self.assertEqual(self.server.sessions, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import asyncio
+import threading
+import unittest
+
+from lib.podcast.client import PodcastRound
+from lib.podcast.segments import SessionLimit, audio_duration, generate_segments, join_audio, split_scripts
+from lib.podcast.timeline import build_timeline, render_subtitles
+
+# MPEG-2 layer III, 32 kbps, 24 kHz: 96 byte frames.
+MP3_HEADER = b"\xff\xf3\x44\xc4"
+
+
+def mp3_frame(fill: bytes) -> bytes:
+    return MP3_HEADER + fill * 92
+
+
+def mp3_file(*fills: bytes) -> bytes:
+    id3 = b"ID3\x04\x00\x00\x00\x00\x00\x05" + b"\x00" * 5
+    info = MP3_HEADER + b"\x00" * 32 + b"Info" + b"\x00" * 56
+    return id3 + info + b"".join(mp3_frame(fill) for fill in fills) + b"TAG" + b"\x00" * 125
+
+
+def line(speaker: str, text: str) -> dict:
+    return {"speaker": speaker, "text": text}
+
+
+class SplitScriptsTest(unittest.TestCase):
+    def test_cuts_at_speaker_turns(self):
+        scripts = [line("a", "1"), line("a", "2"), line("b", "3"), line("a", "4"), line("b", "5")]
+        segments = split_scripts(scripts, 3)
+        self.assertEqual(segments, [scripts[:3], scripts[3:]])
+
+    def test_long_turn_stays_whole(self):
+        scripts = [line("a", str(i)) for i in range(5)] + [line("b", "x")]
+        self.assertEqual(split_scripts(scripts, 2), [scripts[:5], scripts[5:]])
+
+
+class JoinAudioTest(unittest.TestCase):
+    def test_mp3_join_keeps_only_audio_frames(self):
+        joined = join_audio([mp3_file(b"\x01", b"\x02"), mp3_file(b"\x03")], "mp3")
+        self.assertEqual(joined, mp3_frame(b"\x01") + mp3_frame(b"\x02") + mp3_frame(b"\x03"))
+
+    def test_pcm_join_keeps_whole_samples(self):
+        self.assertEqual(join_audio([b"\x01\x02\x03", b"\x04\x05"], "pcm"), b"\x01\x02\x04\x05")
+
+    def test_rejects_unjoinable_format(self):
+        with self.assertRaises(ValueError):
+            join_audio([b"OggS"], "ogg_opus")
+
+
+class GenerateSegmentsTest(unittest.TestCase):
+    def test_music_only_on_outer_segments(self):
+        calls = []
+
+        class Client:
+            async def generate_rounds(self, scripts, **kwargs):
+                calls.append((scripts[0]["text"], kwargs))
+                await asyncio.sleep(0)
+                return [PodcastRound(round_id=0, text=s["text"], audio=s["text"].encode()) for s in scripts]
+
+        segments = [[line("a", "1")], [line("b", "2"), line("a", "3")], [line("b", "4")]]
+        rounds = asyncio.run(generate_segments(Client(), segments, 2, use_head_music=True, use_tail_music=True,
+                                               encoding="mp3"))
+
+        self.assertEqual([(r.round_id, r.audio) for r in rounds], [(0, b"1"), (1, b"2"), (2, b"3"), (3, b"4")])
+        flags = {text: (kw["use_head_music"], kw["use_tail_music"], kw["encoding"]) for text, kw in calls}
+        self.assertEqual(flags, {"1": (True, False, "mp3"), "2": (False, False, "mp3"), "4": (False, True, "mp3")})
+
+
+    def test_session_limit_is_shared_across_tasks(self):
+        limit = SessionLimit(3)
+        lock = threading.Lock()
+        state = {"running": 0, "peak": 0}
+
+        class Client:
+            async def generate_rounds(self, scripts, **kwargs):
+                with lock:
+                    state["running"] += 1
+                    state["peak"] = max(state["peak"], state["running"])
+                await asyncio.sleep(0.01)
+                with lock:
+                    state["running"] -= 1
+                return [PodcastRound(round_id=0, text=s["text"]) for s in scripts]
+
+        def task():  # every podcast task runs its own event loop
+            segments = [[line("a", str(i))] for i in range(6)]
+            asyncio.run(generate_segments(Client(), segments, 4, limit=limit))
+
+        threads = [threading.Thread(target=task) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual((state["peak"], limit.active), (3, 0))
+
+    def test_cancelled_waiter_gives_up_its_slot(self):
+        limit = SessionLimit(1)
+
+        async def main():
+            await limit.acquire()
+            waiter = asyncio.ensure_future(limit.acquire())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            limit.release()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiter
+            async with limit:
+                self.assertEqual(limit.active, 1)
+
+        asyncio.run(main())
+        self.assertEqual(limit.active, 0)
+
+
+class TimelineTest(unittest.TestCase):
+    def test_mp3_duration_counts_frames(self):
+        # 576 samples per MPEG-2 frame at 24 kHz.
+        self.assertAlmostEqual(audio_duration(mp3_frame(b"\x01") * 25, "mp3", 24000), 0.6)
+        self.assertEqual(audio_duration(b"\x00" * 48000, "pcm", 24000), 1.0)
+        self.assertIsNone(audio_duration(b"OggS", "ogg_opus", 24000))
+
+    def test_timeline_and_subtitles(self):
+        rounds = [PodcastRound(round_id=-1), PodcastRound(round_id=0, speaker="a", text="Hello"),
+                  PodcastRound(round_id=1, speaker="b", text="Hi there")]
+        parts = [b"\x00" * 24000, b"\x00" * 96000, b"\x00" * 4800]
+        timeline = build_timeline(rounds, parts, "pcm", 24000)
+
+        self.assertEqual(timeline, [
+            {"round_id": -1, "start": 0.0, "end": 0.5, "offset": 0, "size": 24000},
+            {"round_id": 0, "speaker": "a", "text": "Hello", "start": 0.5, "end": 2.5, "offset": 24000, "size": 96000},
+            {"round_id": 1, "speaker": "b", "text": "Hi there", "start": 2.5, "end": 2.6, "offset": 120000,
+             "size": 4800},
+        ])
+        self.assertEqual(render_subtitles(timeline, "srt"),
+                         "1\n00:00:00,500 --> 00:00:02,500\nHello\n\n2\n00:00:02,500 --> 00:00:02,600\nHi there\n")
+        self.assertTrue(render_subtitles(timeline, "vtt").startswith("WEBVTT\n\n1\n00:00:00.500 --> 00:00:02.500\n<v a>Hello"))
+
+    def test_timeline_without_durations(self):
+        timeline = build_timeline([PodcastRound(round_id=0, text="x")], [b"OggS"], "ogg_opus", 24000,
+                                  byte_offsets=False)
+        self.assertEqual(timeline, [{"round_id": 0, "text": "x"}])
+        self.assertEqual(render_subtitles(timeline, "srt"), "\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import asyncio
+import json
+import os
+import tempfile
+import tracemalloc
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Mock environment variables before importing server
+with patch.dict(os.environ, {"VOLC_APPID": "test_app_id", "VOLC_ACCESS_TOKEN": "test_token", "REDIS_URL": "redis://mock", "DASHSCOPE_API_KEY": "mock_key"}):
+    # Mock redis before importing server
+    with patch("redis.from_url") as mock_redis_init:
+        mock_redis = MagicMock()
+        mock_redis_init.return_value = mock_redis
+        import server
+        from server import redis_client
+
+from bench.fake_upstreams import FakePodcastServer
+from lib.audio import AudioOptions
+from lib.podcast.client import PodcastTTSClient
+from lib.podcast.spool import AudioSpool
+from lib.storage.filesystem import FilesystemStorage
+
+
+def line(speaker: str, text: str) -> dict:
+    return {"speaker": speaker, "text": text}
+
+
+class AudioSpoolTest(unittest.TestCase):
+    def test_spills_past_max_memory(self):
+        with AudioSpool(max_memory=8) as spool:
+            spool.write(b"abcd")
+            self.assertFalse(spool.spilled)
+            spool.write(b"efghij")
+            self.assertTrue(spool.spilled)
+            self.assertEqual((len(spool), spool.read()), (10, b"abcdefghij"))
+            self.assertEqual(list(spool.chunks(4)), [b"abcd", b"efgh", b"ij"])
+            with spool.buffer() as data:
+                self.assertEqual(data.find(b"ghi"), 6)
+            self.assertEqual(spool.reader().read(), b"abcdefghij")
+
+    def test_truncate_drops_a_retried_round(self):
+        for max_memory in (64, 4):
+            with AudioSpool(max_memory=max_memory) as spool:
+                spool.write(b"round0")
+                spool.write(b"partial")
+                spool.truncate(6)
+                spool.write(b"round1")
+                self.assertEqual(spool.read(), b"round0round1")
+                self.assertEqual(spool.read(6, 3), b"rou")
+
+    def test_overwrite_patches_in_place(self):
+        for max_memory in (64, 4):
+            with AudioSpool(max_memory=max_memory) as spool:
+                spool.write(b"HEADbody")
+                spool.overwrite(0, b"head")
+                self.assertEqual((len(spool), spool.read()), (8, b"headbody"))
+                with self.assertRaises(ValueError):
+                    spool.overwrite(6, b"long")
+
+
+class ClientSinkTest(unittest.TestCase):
+    def test_rounds_point_into_the_sink(self):
+        upstream = FakePodcastServer(round_delay=0.0, chunks=3, chunk_size=5).start()
+        try:
+            client = PodcastTTSClient(appid="a", access_token="t", endpoint=upstream.url)
+            with AudioSpool(max_memory=16) as spool:
+                rounds = asyncio.run(client.generate_rounds([line("a", "1"), line("b", "2")], sink=spool))
+                self.assertEqual([(r.spool_offset, r.spool_size, r.audio) for r in rounds], [(0, 15, b""), (15, 15, b"")])
+                self.assertTrue(spool.spilled)
+                self.assertEqual(rounds[1].read_audio(), spool.read(15))
+        finally:
+            upstream.stop()
+
+
+class ProcessPodcastMemoryTest(unittest.TestCase):
+    def setUp(self):
+        self.redis_client = redis_client
+        self.redis_client.reset_mock(return_value=True, side_effect=True)
+        self.upstream = FakePodcastServer(round_delay=0.02, chunks=16, chunk_size=64 * 1024).start()
+        self.storage_dir = tempfile.TemporaryDirectory()
+        self.storage = FilesystemStorage(self.storage_dir.name)
+        patches = [
+            patch("lib.podcast.client.ENDPOINT", self.upstream.url),
+            patch("lib.podcast.spool.MAX_MEMORY", 256 * 1024),
+            patch("server.RESULT_INLINE_MAX_BYTES", 1024),
+            patch.dict("server._clients", {"result_storage": self.storage}),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def tearDown(self):
+        self.upstream.stop()
+        self.storage_dir.cleanup()
+
+    def test_episode_is_not_copied_in_memory(self):
+        scripts = [line("a", str(i)) for i in range(4)]  # 4 rounds of 1 MiB
+        tracemalloc.start()
+        try:
+            server.process_podcast_task("task-spool", scripts, False, False, None, AudioOptions("pcm"))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        val = json.loads(self.redis_client.pipeline.return_value.setex.call_args[0][2])
+        self.assertEqual(val["status"], "success")
+        self.assertEqual(val["voice_ref"], "podcast/task-spool")
+        self.assertEqual(os.path.getsize(self.storage.path_for("podcast/task-spool")), 4 * 1024 * 1024)
+        self.assertEqual([r["offset"] for r in val["timeline"]], [0, 1 << 20, 2 << 20, 3 << 20])
+        # One copy of the episode alone would be 4 MiB.
+        self.assertLess(peak, 2 * 1024 * 1024)
+
+
+if __name__ == "__main__":
+    unittest.main()
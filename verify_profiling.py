@@ -0,0 +1,133 @@
+import base64
+import json
+import os
+import time
+import unittest
+from io import BytesIO
+from unittest.mock import MagicMock, patch
+
+# Mock environment variables before importing server
+with patch.dict(os.environ, {"VOLC_APPID": "test_app_id", "VOLC_ACCESS_TOKEN": "test_token", "REDIS_URL": "redis://mock", "DASHSCOPE_API_KEY": "mock_key"}):
+    # Mock redis before importing server
+    with patch("redis.from_url") as mock_redis_init:
+        mock_redis = MagicMock()
+        mock_redis_init.return_value = mock_redis
+        import server
+        from server import redis_client
+
+from PIL import Image
+
+from lib import profiling
+
+
+def spin(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def encoded(size, color) -> str:
+    buffered = BytesIO()
+    Image.new("RGB", size, color).save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode("ascii")
+
+
+class CaptureTest(unittest.TestCase):
+    def test_samples_stacks_of_the_profiled_thread(self):
+        capture = profiling.start("test")
+        spin(0.1)
+        profiling.finish(capture)
+
+        self.assertIsNone(profiling.current())
+        self.assertGreater(capture.samples, 0)
+        self.assertTrue(any("spin (" in stack and "verify_profiling.py" in stack for stack in capture.stacks))
+        self.assertGreaterEqual(capture.duration_ms, 100)
+        lines = profiling.folded(capture.to_dict()).splitlines()
+        self.assertEqual(sum(int(line.rsplit(" ", 1)[1]) for line in lines), capture.samples)
+
+    def test_memory_stage(self):
+        with profiling.memory("ignored"):  # no capture, nothing measured
+            pass
+        capture = profiling.start("test", explicit=True, memory=True)
+        with profiling.memory("accumulate"):
+            held = bytearray(4 * 1024 * 1024)
+            transient = bytes(8 * 1024 * 1024)
+            del transient
+        profiling.finish(capture)
+
+        (stage,) = capture.memory_stages
+        self.assertEqual(stage["stage"], "accumulate")
+        self.assertGreaterEqual(stage["peak_bytes"], 12 * 1024 * 1024)
+        self.assertGreaterEqual(stage["retained_bytes"], len(held))
+        self.assertIn("verify_profiling.py", stage["top"][0]["where"])
+
+    def test_claim_armed_captures(self):
+        redis = MagicMock()
+        store = profiling.ProfileStore(lambda: redis, poll_interval=60)
+        redis.mget.return_value = [b"1", b"1"]
+        redis.decr.side_effect = [0, -1]
+
+        self.assertIs(store.claim(), True)
+        self.assertIsNone(store.claim())
+        redis.delete.assert_called_once_with(store.ARM_KEY)
+        self.assertIsNone(store.claim())  # polled again only after poll_interval
+        self.assertEqual(redis.mget.call_count, 1)
+
+
+@patch("server.get_stitch_pool", return_value=None)
+class ProfilingEndpointsTest(unittest.TestCase):
+    def setUp(self):
+        patches = [patch("server.ENABLE_PROFILING", True), patch("server.ADMIN_TOKEN", "secret")]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.app = server.create_app().test_client()
+        self.redis_client = redis_client
+        self.redis_client.reset_mock(return_value=True, side_effect=True)
+        self.redis_client.mget.return_value = [None, None]
+
+    def test_profile_header_captures_request(self, _pool):
+        images = [encoded((4, 4), "red"), encoded((4, 4), "blue")]
+        response = self.app.post("/v1/image/stitch", data=json.dumps({"images": images}),
+                                 content_type="application/json",
+                                 headers={"X-Profile": "memory", "Authorization": "Bearer secret"})
+
+        self.assertEqual(response.status_code, 200)
+        profile_id = response.headers["X-Profile-Id"]
+        key, ttl, data = self.redis_client.pipeline.return_value.setex.call_args[0]
+        self.assertEqual(key, f"profile:{profile_id}")
+        profile = json.loads(data)
+        self.assertEqual(profile["name"], "POST /v1/image/stitch")
+        self.assertEqual(profile["status_code"], 200)
+        self.assertEqual([stage["stage"] for stage in profile["memory"]], ["stitch"])
+
+        self.redis_client.get.return_value = data
+        response = self.app.get(f"/admin/profiles/{profile_id}", headers={"X-Admin-Token": "secret"})
+        self.assertEqual(response.get_json()["id"], profile_id)
+
+    def test_header_and_admin_need_token(self, _pool):
+        response = self.app.post("/v1/image/stitch", data=json.dumps({"images": [encoded((4, 4), "red")]}),
+                                 content_type="application/json", headers={"X-Profile": "1"})
+        self.assertNotIn("X-Profile-Id", response.headers)
+        self.redis_client.pipeline.return_value.setex.assert_not_called()
+
+        self.assertEqual(self.app.get("/admin/profiles").status_code, 401)
+        self.assertEqual(self.app.get("/admin/profiles", headers={"X-Admin-Token": "wrong"}).status_code, 401)
+
+    def test_arm_and_list(self, _pool):
+        headers = {"X-Admin-Token": "secret"}
+        response = self.app.post("/admin/profiling", json={"requests": 5, "ttl": 60, "memory": True}, headers=headers)
+        self.assertEqual(response.status_code, 202)
+        self.redis_client.pipeline.return_value.setex.assert_any_call("profile_arm", 60, 5)
+        self.assertEqual(self.app.post("/admin/profiling", json={"requests": 0}, headers=headers).status_code, 400)
+
+        fast = {"id": "a", "duration_ms": 5, "stacks": {"x": 1}, "memory": []}
+        slow = {"id": "b", "duration_ms": 2500, "stacks": {"x": 9}, "memory": [{"stage": "stitch", "top": []}]}
+        self.redis_client.lrange.return_value = [b"b", b"a"]
+        self.redis_client.mget.return_value = [json.dumps(slow), json.dumps(fast)]
+        profiles = self.app.get("/admin/profiles?min_duration_ms=1000", headers=headers).get_json()["profiles"]
+        self.assertEqual(profiles, [{"id": "b", "duration_ms": 2500, "memory": [{"stage": "stitch"}]}])
+
+
+if __name__ == "__main__":
+    unittest.main()
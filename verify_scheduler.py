@@ -0,0 +1,80 @@
+import threading
+import time
+import unittest
+
+from lib.scheduler import FairScheduler, parse_weights
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.005)
+
+
+class FairSchedulerTest(unittest.TestCase):
+    def test_weighted_classes_and_tenant_round_robin(self):
+        scheduler = FairScheduler(workers=1, weights={"interactive": 2, "batch": 1})
+        gate = threading.Event()
+        order = []
+
+        scheduler.submit(gate.wait, tenant="x")
+        for name, tenant, priority in [("b1", "A", "batch"), ("b2", "A", "batch"), ("i1", "B", "interactive"),
+                                       ("i2", "B", "interactive"), ("i3", "B", "interactive"),
+                                       ("i4", "C", "interactive")]:
+            scheduler.submit(order.append, name, tenant=tenant, priority=priority)
+        gate.set()
+
+        wait_until(lambda: len(order) == 6)
+        self.assertEqual(order, ["i1", "b1", "i4", "i2", "b2", "i3"])
+
+    def test_tenant_concurrency_cap(self):
+        scheduler = FairScheduler(workers=4, tenant_limit=2)
+        lock = threading.Lock()
+        state = {"running": 0, "peak": 0, "done": 0}
+
+        def job():
+            with lock:
+                state["running"] += 1
+                state["peak"] = max(state["peak"], state["running"])
+            time.sleep(0.02)
+            with lock:
+                state["running"] -= 1
+                state["done"] += 1
+
+        for _ in range(6):
+            scheduler.submit(job, tenant="flood", priority="batch")
+        scheduler.submit(job, tenant="other")
+
+        wait_until(lambda: state["done"] == 7)
+        self.assertEqual(state["peak"], 3)
+        self.assertLessEqual(scheduler.stats()["workers"], 4)
+
+    def test_tenant_limit_override(self):
+        scheduler = FairScheduler(workers=4, tenant_limit=1, tenant_limits={"default": 4})
+        barrier = threading.Barrier(4, timeout=2)  # only passes with four jobs of one tenant running at once
+        passed = []
+
+        for _ in range(4):
+            scheduler.submit(lambda: passed.append(barrier.wait()))
+
+        wait_until(lambda: len(passed) == 4)
+
+    def test_failing_job_keeps_worker_alive(self):
+        scheduler = FairScheduler(workers=1)
+        done = threading.Event()
+        scheduler.submit(lambda: 1 / 0)
+        scheduler.submit(done.set)
+        self.assertTrue(done.wait(5))
+
+    def test_parse_weights(self):
+        self.assertEqual(parse_weights("batch=3"), {"interactive": 4, "batch": 3})
+        with self.assertRaises(ValueError):
+            parse_weights("urgent=1")
+        with self.assertRaises(ValueError):
+            FairScheduler().submit(print, priority="urgent")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import MagicMock, patch
+
+from lib.storage.factory import create_storage
+from lib.storage.filesystem import FilesystemStorage
+from lib.storage.redis_backend import RedisStorage
+from lib.storage.s3 import S3Storage
+
+
+class FilesystemStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage = FilesystemStorage(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_put_get_roundtrip_in_sharded_directory(self):
+        self.storage.put("podcast/abc", b"audio")
+        self.assertEqual(self.storage.get("podcast/abc"), b"audio")
+
+        path = self.storage.path_for("podcast/abc")
+        self.assertTrue(path.startswith(self.tmp.name))
+        # root/xx/yy/name
+        self.assertEqual(len(os.path.relpath(path, self.tmp.name).split(os.sep)), 3)
+
+    def test_put_from_file_object_and_stream(self):
+        self.storage.put("big", io.BytesIO(b"x" * 1000))
+        chunks = list(self.storage.iter_chunks("big", chunk_size=300))
+        self.assertEqual([len(c) for c in chunks], [300, 300, 300, 100])
+        self.assertEqual(b"".join(chunks), b"x" * 1000)
+
+    def test_missing_and_expired(self):
+        self.assertIsNone(self.storage.get("missing"))
+        self.assertIsNone(self.storage.iter_chunks("missing"))
+
+        self.storage.put("short", b"data", ttl=1)
+        past = time.time() - 10
+        os.utime(self.storage.path_for("short"), (past, past))
+        self.assertIsNone(self.storage.get("short"))
+        self.assertEqual(self.storage.prune(), 1)
+
+    def test_delete(self):
+        self.storage.put("k", b"v")
+        self.storage.delete("k")
+        self.storage.delete("k")
+        self.assertIsNone(self.storage.get("k"))
+
+
+class RedisStorageTest(unittest.TestCase):
+    def test_put_uses_prefix_and_ttl(self):
+        client = MagicMock()
+        storage = RedisStorage(client, default_ttl=60)
+        storage.put("podcast/abc", io.BytesIO(b"audio"))
+        client.setex.assert_called_once_with("result:podcast/abc", 60, b"audio")
+
+    def test_iter_chunks_uses_getrange(self):
+        client = MagicMock()
+        client.strlen.return_value = 5
+        client.getrange.side_effect = lambda key, start, end: b"abcde"[start:end + 1]
+        storage = RedisStorage(client)
+        self.assertEqual(list(storage.iter_chunks("k", chunk_size=2)), [b"ab", b"cd", b"e"])
+
+
+class CreateStorageTest(unittest.TestCase):
+    def test_defaults_to_redis(self):
+        with patch.dict(os.environ, clear=True):
+            self.assertIsInstance(create_storage(redis_client=MagicMock()), RedisStorage)
+
+    def test_filesystem_requires_a_directory(self):
+        with patch.dict(os.environ, {"RESULT_STORAGE": "filesystem"}, clear=True):
+            with self.assertRaises(RuntimeError):
+                create_storage()
+        with tempfile.TemporaryDirectory() as root:
+            with patch.dict(os.environ, {"RESULT_STORAGE": "filesystem", "RESULT_STORAGE_DIR": root}, clear=True):
+                self.assertIsInstance(create_storage(), FilesystemStorage)
+
+
+class _FakeS3Handler(BaseHTTPRequestHandler):
+    """Minimal MinIO-style stand-in: path-style buckets, in-memory objects."""
+
+    objects = {}
+    auth_headers = []
+
+    def _record_auth(self):
+        self.auth_headers.append(self.headers.get("Authorization", ""))
+
+    def do_PUT(self):
+        self._record_auth()
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        expected = self.headers.get("x-amz-content-sha256")
+        if expected != "UNSIGNED-PAYLOAD" and expected != hashlib.sha256(body).hexdigest():
+            self.send_response(400)
+            self.end_headers()
+            return
+        self.objects[self.path] = body
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        self._record_auth()
+        body = self.objects.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_DELETE(self):
+        self._record_auth()
+        self.objects.pop(self.path, None)
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class S3StorageTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeS3Handler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        _FakeS3Handler.objects.clear()
+        _FakeS3Handler.auth_headers.clear()
+        host, port = self.server.server_address
+        self.storage = S3Storage(f"http://{host}:{port}", "results", "AKID", "SECRET", prefix="tasks/")
+
+    def test_roundtrip(self):
+        self.storage.put("podcast/abc", b"audio")
+        self.assertIn("/results/tasks/podcast/abc", _FakeS3Handler.objects)
+        self.assertEqual(self.storage.get("podcast/abc"), b"audio")
+        self.assertEqual(b"".join(self.storage.iter_chunks("podcast/abc", chunk_size=2)), b"audio")
+
+        self.storage.delete("podcast/abc")
+        self.assertIsNone(self.storage.get("podcast/abc"))
+        self.assertIsNone(self.storage.iter_chunks("podcast/abc"))
+
+    def test_requests_are_signed(self):
+        self.storage.put("k", io.BytesIO(b"streamed"))
+        auth = _FakeS3Handler.auth_headers[-1]
+        self.assertTrue(auth.startswith("AWS4-HMAC-SHA256 Credential=AKID/"))
+        self.assertIn("/us-east-1/s3/aws4_request", auth)
+        self.assertIn("SignedHeaders=host;x-amz-content-sha256;x-amz-date", auth)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+import json
+import os
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Mock environment variables before importing server
+with patch.dict(os.environ, {"VOLC_APPID": "test_app_id", "VOLC_ACCESS_TOKEN": "test_token", "REDIS_URL": "redis://mock", "DASHSCOPE_API_KEY": "mock_key"}):
+    # Mock redis before importing server
+    with patch("redis.from_url") as mock_redis_init:
+        mock_redis = MagicMock()
+        mock_redis_init.return_value = mock_redis
+        import server
+        from server import redis_client
+
+from bench.fake_upstreams import FakeRedis
+from lib import lifecycle
+from lib.deadline import Deadline
+
+
+class TaskRunTest(unittest.TestCase):
+    def test_transitions_and_durations(self):
+        run = lifecycle.TaskRun("cosyvoice", "t1")
+        run.transition(lifecycle.RUNNING)
+        lifecycle.activate(run)
+        with lifecycle.stage("synthesize"):
+            time.sleep(0.01)
+        lifecycle.deactivate(run)
+        with lifecycle.stage("ignored"):  # no current task
+            pass
+
+        record = run.finish({"status": "success", "voice_b64": "YQ=="})
+        self.assertEqual((record["status"], record["state"], record["voice_b64"]), ("success", "succeeded", "YQ=="))
+        self.assertEqual(set(record["timestamps"]), {"queued_at", "running_at", "succeeded_at"})
+        self.assertEqual(set(record["durations"]), {"queue_ms", "run_ms", "total_ms", "stages"})
+        self.assertGreaterEqual(record["durations"]["stages"]["synthesize"], 10)
+        self.assertIsNone(lifecycle.current())
+
+    def test_explicit_state_overrides_status(self):
+        record = lifecycle.TaskRun("stitch", "t1").finish({"status": "failed", "state": "expired"})
+        self.assertEqual((record["status"], record["state"]), ("failed", "expired"))
+        self.assertNotIn("run_ms", record["durations"])  # never ran
+
+
+class ReaperTest(unittest.TestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        self.requeued = []
+        self.metrics = lifecycle.TaskMetrics()
+        self.reaper = lifecycle.Reaper(lambda: self.redis, self.requeue, 60, max_attempts=2, metrics=self.metrics)
+
+    def requeue(self, run, params):
+        self.requeued.append((run, params))
+        return True
+
+    def lost_task(self, task_id, attempt=1, params=None, state=lifecycle.RUNNING):
+        run = lifecycle.TaskRun("cosyvoice", task_id, attempt=attempt, created_at=time.time() - 120)
+        run.transition(state)
+        self.redis.setex(f"cosyvoice_task:{task_id}", 60, json.dumps(run.record()))
+        self.redis.zadd(lifecycle.ACTIVE_KEY, {f"cosyvoice:{task_id}": run.created_at})
+        if params is not None:
+            self.redis.setex(lifecycle.params_key("cosyvoice", task_id), 60, json.dumps(params))
+
+    def record(self, task_id):
+        return json.loads(self.redis.get(f"cosyvoice_task:{task_id}"))
+
+    def test_requeues_then_fails(self):
+        self.lost_task("t1", params={"text": "hi"})
+
+        self.assertEqual(self.reaper.run_once()["requeued"], 1)
+        (run, params), = self.requeued
+        self.assertEqual((run.attempt, params), (2, {"text": "hi"}))
+        record = self.record("t1")
+        self.assertEqual((record["state"], record["status"], record["attempt"]), ("queued", "processing", 2))
+        self.assertIn("running_at", record["timestamps"])
+        self.assertEqual(self.redis.zrangebyscore(lifecycle.ACTIVE_KEY, "-inf", "+inf"), [b"cosyvoice:t1"])
+
+        self.lost_task("t1", attempt=2, params={"text": "hi"})
+        self.redis.delete(lifecycle.REAPER_LOCK_KEY, lifecycle.heartbeat_key("cosyvoice", "t1"))
+        self.assertEqual(self.reaper.run_once()["failed"], 1)
+        record = self.record("t1")
+        self.assertEqual((record["state"], record["error"]), ("failed", "worker lost while the task was running"))
+        self.assertEqual(self.redis.zrangebyscore(lifecycle.ACTIVE_KEY, "-inf", "+inf"), [])
+        self.assertIsNone(self.redis.get(lifecycle.params_key("cosyvoice", "t1")))
+        self.assertEqual(self.metrics.stats()["reaped"], {"requeued": 1, "failed": 1, "expired": 0})
+
+    def test_fails_without_params_and_expires_past_deadline(self):
+        self.lost_task("queued", state=lifecycle.QUEUED)
+        self.lost_task("late", params={"deadline": time.time() - 1})
+
+        self.assertEqual(self.reaper.run_once(), {"requeued": 0, "failed": 1, "expired": 1})
+        self.assertEqual(self.record("queued")["error"], "worker lost while the task was queued")
+        self.assertEqual((self.record("late")["state"], self.record("late")["status"]), ("expired", "failed"))
+        self.assertEqual(self.requeued, [])
+
+    def test_skips_live_recent_and_finished_tasks(self):
+        self.lost_task("alive", params={})
+        self.redis.set(lifecycle.heartbeat_key("cosyvoice", "alive"), 1, ex=30)
+        self.redis.zadd(lifecycle.ACTIVE_KEY, {"cosyvoice:recent": time.time()})
+        self.lost_task("done", state=lifecycle.SUCCEEDED)
+
+        self.assertEqual(self.reaper.run_once(), {"requeued": 0, "failed": 0, "expired": 0})
+        self.assertEqual(self.record("alive")["state"], "running")
+        self.assertEqual(self.record("done")["state"], "succeeded")
+        self.assertEqual(self.redis.zrangebyscore(lifecycle.ACTIVE_KEY, "-inf", "+inf"),
+                         [b"cosyvoice:alive", b"cosyvoice:recent"])
+
+    def test_one_pass_per_interval(self):
+        self.lost_task("t1", params={})
+        self.redis.set(lifecycle.REAPER_LOCK_KEY, 1, ex=30)
+        self.assertEqual(self.reaper.run_once()["requeued"], 0)
+
+
+class TaskLifecycleServerTest(unittest.TestCase):
+    def setUp(self):
+        self.redis_client = redis_client
+        self.redis_client.reset_mock(return_value=True, side_effect=True)
+        server._clients.pop("task_metrics", None)
+        self.addCleanup(server._clients.pop, "task_metrics", None)
+
+    def final_record(self):
+        return json.loads(self.redis_client.pipeline.return_value.setex.call_args[0][2])
+
+    @patch("server.synthesize", return_value=(b"audio", "req-1", 50))
+    def test_task_record_tracks_lifecycle(self, _synthesize):
+        run = lifecycle.TaskRun("cosyvoice", "t1")
+        with lifecycle.submitting(run):
+            server.process_cosyvoice_task("t1", "text", "voice", "model", {})
+
+        running = json.loads(self.redis_client.pipeline.return_value.setex.call_args_list[0][0][2])
+        self.assertEqual((running["state"], running["status"]), ("running", "processing"))
+        record = self.final_record()
+        self.assertEqual((record["state"], record["status"], record["created_at"]),
+                         ("succeeded", "success", run.created_at))
+        self.assertEqual(set(record["durations"]["stages"]), {"synthesize", "store"})
+        pipe = self.redis_client.pipeline.return_value
+        pipe.zrem.assert_called_once_with(lifecycle.ACTIVE_KEY, "cosyvoice:t1")
+        pipe.delete.assert_called_once_with("cosyvoice_params:t1", "cosyvoice_heartbeat:t1")
+        stats = server.get_task_metrics().stats()["kinds"]["cosyvoice"]
+        self.assertEqual((stats["states"], stats["run_ms"]["count"]), ({"succeeded": 1}, 1))
+
+    def test_deadline_expires_task(self):
+        server.process_stitch_task("t2", [], "horizontal", deadline=Deadline(time.time() - 1))
+
+        record = self.final_record()
+        self.assertEqual((record["state"], record["status"], record["error"]), ("expired", "failed", "deadline exceeded"))
+
+    @patch("server.get_scheduler")
+    def test_requeue_rebuilds_job_from_stored_params(self, MockScheduler):
+        app = server.app.test_client()
+        response = app.post("/v1/voice/cosyvoice/async", data=json.dumps({"text": "a", "voice": "v", "format": "mp3"}),
+                            content_type="application/json")
+        task_id = response.get_json()["task_id"]
+        key, _, params = self.redis_client.pipeline.return_value.setex.call_args_list[1][0]
+        self.assertEqual(key, f"cosyvoice_params:{task_id}")
+        submitted = MockScheduler.return_value.submit.call_args
+
+        run = lifecycle.TaskRun("cosyvoice", task_id, attempt=2)
+        self.assertTrue(server._requeue_task(run, json.loads(params)))
+        resubmitted = MockScheduler.return_value.submit.call_args
+        self.assertEqual(resubmitted[0][:7], submitted[0][:7])
+        self.assertEqual(resubmitted[0][7].to_dict(), submitted[0][7].to_dict())
+        self.assertEqual(resubmitted[0][8].expires_at, submitted[0][8].expires_at)
+        self.assertEqual(resubmitted[1], submitted[1])
+        self.assertFalse(server._requeue_task(lifecycle.TaskRun("stitch", "t3"), {}))
+
+    def test_admin_tasks(self):
+        with patch("server.ADMIN_TOKEN", "secret"):
+            response = server.create_app().test_client().get("/admin/tasks", headers={"X-Admin-Token": "secret"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.get_json()), {"scheduler", "pid", "kinds", "reaped"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import os
+import json
+
+# Mock environment variables before importing server
+with patch.dict(os.environ, {"VOLC_APPID": "test_app_id", "VOLC_ACCESS_TOKEN": "test_token", "REDIS_URL": "redis://mock", "DASHSCOPE_API_KEY": "mock_key"}):
+    # Mock redis before importing server
+    with patch("redis.from_url") as mock_redis_init:
+        mock_redis = MagicMock()
+        mock_redis_init.return_value = mock_redis
+        from server import app, redis_client
+
+
+class BulkTaskStatusTest(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        from server import redis_client
+        self.redis_client = redis_client
+        self.redis_client.reset_mock(return_value=True, side_effect=True)
+
+    def test_bulk_status_reads_status_copies(self):
+        records = {
+            "cosyvoice_status:a": {"status": "success", "task_id": "a", "created_at": 1},
+            "cosyvoice_task:a": {"status": "success", "voice_b64": "x" * 4096, "task_id": "a", "created_at": 1},
+            # Written before status copies existed.
+            "podcast_task:b": {"status": "processing", "voice_b64": "xxx", "task_id": "b", "created_at": 2},
+        }
+        self.redis_client.mget.side_effect = lambda keys: [
+            json.dumps(records[k]).encode("utf-8") if k in records else None for k in keys
+        ]
+
+        response = self.app.post("/v1/tasks/status",
+                                 data=json.dumps({"task_ids": ["a", "b", "c"]}),
+                                 content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        status_keys, legacy_keys = [call[0][0] for call in self.redis_client.mget.call_args_list]
+        self.assertTrue(all("_status:" in key for key in status_keys))
+        self.assertEqual(legacy_keys, [f"{kind}_task:{task_id}" for task_id in "bc"
+                                       for kind in ("cosyvoice", "podcast", "stitch")])
+        self.redis_client.get.assert_not_called()
+        self.assertEqual(data["missing"], ["c"])
+        self.assertEqual(data["tasks"]["a"], {"status": "success", "task_id": "a", "created_at": 1, "type": "cosyvoice"})
+        self.assertEqual(data["tasks"]["b"], {"status": "processing", "task_id": "b", "created_at": 2, "type": "podcast"})
+
+    def test_status_copy_leaves_out_results(self):
+        import server
+
+        pipe = MagicMock()
+        server._write_record(pipe, "podcast", "a", 60, {"status": "success", "voice_b64": "xxx", "timeline": [],
+                                                        "task_id": "a"})
+        pipe.setex.assert_called_once()
+        key, value = pipe.set.call_args[0]
+        self.assertEqual((key, json.loads(value), pipe.set.call_args[1]),
+                         ("podcast_status:a", {"status": "success", "task_id": "a"}, {"ex": 60}))
+
+    def test_bulk_status_field_projection(self):
+        self.redis_client.mget.return_value = [
+            json.dumps({"status": "failed", "error": "boom", "created_at": 1}).encode("utf-8"), None,
+        ]
+
+        response = self.app.post("/v1/tasks/status",
+                                 data=json.dumps({"task_ids": ["a"], "fields": ["status", "voice_b64"]}),
+                                 content_type="application/json")
+
+        data = json.loads(response.data)
+        self.assertEqual(data["tasks"]["a"], {"status": "failed", "task_id": "a", "type": "cosyvoice"})
+
+    def test_bulk_status_validation(self):
+        response = self.app.post("/v1/tasks/status", data=json.dumps({"task_ids": "a"}),
+                                 content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+        with patch("server.MAX_BULK_TASK_IDS", 1):
+            response = self.app.post("/v1/tasks/status", data=json.dumps({"task_ids": ["a", "b"]}),
+                                     content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
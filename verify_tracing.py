@@ -0,0 +1,97 @@
+import json
+import os
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Mock environment variables before importing server
+with patch.dict(os.environ, {"VOLC_APPID": "test_app_id", "VOLC_ACCESS_TOKEN": "test_token", "REDIS_URL": "redis://mock", "DASHSCOPE_API_KEY": "mock_key"}):
+    # Mock redis before importing server
+    with patch("redis.from_url") as mock_redis_init:
+        mock_redis = MagicMock()
+        mock_redis_init.return_value = mock_redis
+        from server import app, redis_client
+
+from lib import tracing
+from lib.scheduler import FairScheduler
+
+
+class Collector:
+    def __init__(self):
+        self.spans = []
+
+    def add(self, span):
+        self.spans.append(span)
+
+    def named(self, name):
+        return next(s for s in self.spans if s.name == name)
+
+
+class TracingTest(unittest.TestCase):
+    def setUp(self):
+        self.collector = Collector()
+        patches = [patch.object(tracing, "enabled", True), patch.object(tracing, "SAMPLE_RATIO", 1),
+                   patch("lib.tracing._exporter", return_value=self.collector)]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_nesting_and_errors(self):
+        with tracing.span("outer", tenant="a") as outer:
+            with tracing.span("inner") as inner:
+                inner.event("first_audio")
+            with self.assertRaises(ValueError):
+                with tracing.span("failing"):
+                    raise ValueError("bad")
+
+        self.assertIsNone(tracing.current_span())
+        self.assertEqual([s.name for s in self.collector.spans], ["inner", "failing", "outer"])
+        self.assertEqual(inner.parent_id, outer.span_id)
+        self.assertEqual({s.trace_id for s in self.collector.spans}, {outer.trace_id})
+
+        document = tracing.to_otlp(self.collector.spans)
+        records = document["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        self.assertEqual(records[0]["events"][0]["name"], "first_audio")
+        self.assertEqual(records[1]["status"], {"code": 2, "message": "ValueError: bad"})
+        self.assertNotIn("parentSpanId", records[2])
+        self.assertEqual(records[2]["attributes"], [{"key": "tenant", "value": {"stringValue": "a"}}])
+        json.dumps(document)
+
+    def test_disabled_is_noop(self):
+        with patch.object(tracing, "enabled", False):
+            with tracing.span("ignored") as span:
+                span.set("key", 1)
+        self.assertIs(span, tracing.NOOP_SPAN)
+        self.assertEqual(self.collector.spans, [])
+
+    def test_scheduled_job_continues_trace(self):
+        scheduler = FairScheduler(workers=1)
+        done = threading.Event()
+
+        def job():
+            with tracing.span("job"):
+                pass
+            done.set()
+
+        with tracing.span("request") as request_span:
+            scheduler.submit(job)
+        self.assertTrue(done.wait(5))
+
+        self.assertEqual(self.collector.named("job").parent_id, request_span.span_id)
+
+    def test_request_span_continues_traceparent(self):
+        redis_client.reset_mock(return_value=True, side_effect=True)
+        redis_client.get.return_value = json.dumps({"status": "processing"}).encode("utf-8")
+        parent = "00-" + "ab" * 16 + "-" + "cd" * 8 + "-01"
+
+        response = app.test_client().get("/v1/voice/podcast/t1", headers={"traceparent": parent})
+
+        root = self.collector.named("GET /v1/voice/podcast/<task_id>")
+        self.assertEqual((root.trace_id, root.parent_id), ("ab" * 16, "cd" * 8))
+        self.assertEqual(root.attributes["http.status_code"], 200)
+        self.assertEqual(self.collector.named("redis.get_task").parent_id, root.span_id)
+        self.assertEqual(response.headers["traceparent"], root.traceparent)
+
+
+if __name__ == "__main__":
+    unittest.main()
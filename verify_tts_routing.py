@@ -0,0 +1,160 @@
+import asyncio
+import base64
+import json
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Mock environment variables before importing server
+with patch.dict(os.environ, {"VOLC_APPID": "test_app_id", "VOLC_ACCESS_TOKEN": "test_token", "REDIS_URL": "redis://mock", "DASHSCOPE_API_KEY": "mock_key"}):
+    # Mock redis before importing server
+    with patch("redis.from_url") as mock_redis_init:
+        mock_redis = MagicMock()
+        mock_redis_init.return_value = mock_redis
+        import server
+
+from bench.fake_upstreams import FakeTTSServer
+from lib.cancellation import TaskCancelled
+from lib.deadline import DeadlineExceeded
+from lib.tts.routing import NoProviderError, Provider, Router, parse_voice_map
+from lib.tts.volcano import VolcanoTTSClient, speech_params
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def backend(delay_ms, error=None):
+    def synthesize(text, voice, model, **kwargs):
+        synthesize.calls.append(voice)
+        if error is not None:
+            raise error
+        return f"{voice}:{text}".encode(), "req", delay_ms
+    synthesize.calls = []
+    return synthesize
+
+
+class RouterTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+
+    def router(self, *providers, **kwargs):
+        return Router(list(providers), failure_threshold=2, cooldown=30, probe_interval=60, clock=self.clock, **kwargs)
+
+    def test_routes_to_the_fastest_provider(self):
+        slow, fast = backend(400), backend(100)
+        router = self.router(Provider("slow", slow), Provider("fast", fast, voices={"libai_v2": "zh_male"}))
+
+        self.assertEqual(router.synthesize("hi", "libai_v2", "m").provider, "slow")  # nothing measured yet
+        self.assertEqual(router.synthesize("hi", "libai_v2", "m").provider, "fast")
+        result = router.synthesize("hi", "libai_v2", "m")
+        self.assertEqual((result.provider, result.voice, result.audio), ("fast", "zh_male", b"zh_male:hi"))
+
+        self.clock.now += 61  # the slow provider gets measured again
+        self.assertEqual(router.synthesize("hi", "libai_v2", "m").provider, "slow")
+
+    def test_voice_map_and_options_limit_providers(self):
+        router = self.router(Provider("a", backend(1)), Provider("b", backend(1), voices={"x": "bx"}, options=()))
+        self.assertEqual([p.name for p in router.candidates("x", {"volume": 50})], ["a"])
+        self.assertEqual([p.name for p in router.candidates("y")], ["a"])
+
+        router = self.router(Provider("b", backend(1), voices={"x": "bx"}))
+        with self.assertRaises(NoProviderError):
+            router.synthesize("hi", "y", "m")
+
+    def test_fails_over_and_cools_down(self):
+        broken, spare = backend(50, RuntimeError("Throttling")), backend(300)
+        router = self.router(Provider("broken", broken), Provider("spare", spare))
+
+        for _ in range(3):
+            self.assertEqual(router.synthesize("hi", "v", "m").provider, "spare")
+        self.assertEqual(len(broken.calls), 1)  # ranked last while failing
+
+        self.clock.now += 61  # probed again, and in cooldown after failure_threshold failures
+        self.assertEqual(router.synthesize("hi", "v", "m").provider, "spare")
+        self.assertEqual(len(broken.calls), 2)
+        stats = router.stats()
+        self.assertEqual((stats["broken"]["failures"], stats["broken"]["available"]), (2, False))
+        self.assertEqual(stats["broken"]["last_error"], "Throttling")
+
+        router.providers[1].synthesize = backend(0, RuntimeError("down too"))
+        with self.assertRaises(RuntimeError) as raised:
+            router.synthesize("hi", "v", "m")  # the provider in cooldown is the last resort
+        self.assertEqual(str(raised.exception), "Throttling")
+
+    def test_deadline_and_cancellation_do_not_fail_over(self):
+        spare = backend(1)
+        for error in (DeadlineExceeded(), TaskCancelled("key")):
+            router = self.router(Provider("a", backend(1, error)), Provider("b", spare))
+            with self.assertRaises(type(error)):
+                router.synthesize("hi", "v", "m")
+        self.assertEqual(spare.calls, [])
+
+    def test_parse_voice_map(self):
+        self.assertEqual(parse_voice_map("libai_v2=zh_male_a, longxiaochun = zh_female_b,"),
+                         {"libai_v2": "zh_male_a", "longxiaochun": "zh_female_b"})
+        with self.assertRaises(ValueError):
+            parse_voice_map("libai_v2")
+
+
+class VolcanoClientTest(unittest.TestCase):
+    def test_synthesize(self):
+        upstream = FakeTTSServer(round_delay=0.0, chunks=3, chunk_size=7).start()
+        try:
+            client = VolcanoTTSClient(appid="a", access_token="t", endpoint=upstream.url)
+            audio, request_id, first_package_delay = asyncio.run(client.synthesize("你好", "zh_male_a"))
+            self.assertEqual(len(audio), 21)
+            self.assertTrue(request_id)
+            self.assertEqual(upstream.sessions, 1)
+        finally:
+            upstream.stop()
+
+    def test_speech_params(self):
+        self.assertEqual(speech_params(volume=50, speech_rate=1.5), {"speech_rate": 50, "loudness_rate": 0})
+        self.assertEqual(speech_params(volume=0, speech_rate=0.5), {"speech_rate": -50, "loudness_rate": -50})
+
+
+class ServerFailoverTest(unittest.TestCase):
+    def setUp(self):
+        self.upstream = FakeTTSServer(round_delay=0.0, chunks=2, chunk_size=5).start()
+        patches = [
+            patch("lib.tts.volcano.ENDPOINT", self.upstream.url),
+            patch("server.TTS_VOICE_MAP", {"libai_v2": "zh_male_a"}),
+            patch.dict("server._clients"),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        server._clients.pop("tts_router", None)
+        self.app = server.app.test_client()
+
+    def tearDown(self):
+        self.upstream.stop()
+
+    @patch("server.synthesize", side_effect=RuntimeError("Throttling.RateQuota"))
+    def test_falls_back_to_volcano(self, mock_synthesize):
+        response = self.app.post("/v1/voice/cosyvoice", data=json.dumps({"text": "hi", "voice": "libai_v2"}),
+                                 content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data["provider"], "volcano")
+        self.assertEqual(len(base64.b64decode(data["voice_b64"])), 10)
+        mock_synthesize.assert_called_once()
+
+        # Volcano has no mapping for other voices and no instruction support.
+        response = self.app.post("/v1/voice/cosyvoice", data=json.dumps({"text": "hi", "voice": "libai_v2",
+                                                                          "instruction": "slowly"}),
+                                 content_type="application/json")
+        self.assertEqual((response.status_code, response.get_json()["error"]), (500, "Throttling.RateQuota"))
+
+        with patch("server.ADMIN_TOKEN", "secret"):
+            stats = server.create_app().test_client().get("/admin/tts", headers={"X-Admin-Token": "secret"})
+        self.assertEqual(stats.get_json()["providers"]["dashscope"]["failures"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Mock environment variables before importing server
+with patch.dict(os.environ, {"VOLC_APPID": "test_app_id", "VOLC_ACCESS_TOKEN": "test_token", "REDIS_URL": "redis://mock", "DASHSCOPE_API_KEY": "mock_key"}):
+    # Mock redis before importing server
+    with patch("redis.from_url") as mock_redis_init:
+        mock_redis = MagicMock()
+        mock_redis_init.return_value = mock_redis
+        import server
+
+from bench.fake_upstreams import FakePodcastServer
+from lib.podcast.client import PodcastTTSClient
+from lib.warmup import Warmer, parse_voices
+
+
+class WarmerTest(unittest.TestCase):
+    def test_run_once_records_latency_and_failures(self):
+        def broken():
+            raise ConnectionError("refused")
+
+        warmer = Warmer({"voice": lambda: 120.0, "timed": lambda: None, "broken": broken})
+        warmer.start(wait=5)
+
+        stats = warmer.stats()
+        self.assertTrue(stats["ready"])
+        self.assertEqual(stats["targets"]["voice"]["first_ms"], 120.0)
+        self.assertIsNotNone(stats["targets"]["timed"]["last_ms"])
+        self.assertEqual((stats["targets"]["broken"]["failures"], stats["targets"]["broken"]["last_error"]),
+                         (1, "refused"))
+
+    def test_observe_counts_cold_requests(self):
+        warmer = Warmer({"warm": lambda: 10.0})
+        warmer.run_once()
+        for key, latency in [("warm", 50), ("cold", 900), ("cold", 100), ("warm", None)]:
+            warmer.observe(key, latency)
+
+        traffic = warmer.stats()["traffic"]
+        self.assertEqual(traffic["warm"], {"requests": 1, "cold_requests": 0, "cold_ms": None, "avg_ms": 50})
+        self.assertEqual(traffic["cold"], {"requests": 2, "cold_requests": 1, "cold_ms": 900, "avg_ms": 500})
+
+    def test_parse_voices(self):
+        self.assertEqual(parse_voices("libai_v2, cosyvoice-v1:longxiaochun,", "cosyvoice-v2"),
+                         [("cosyvoice-v2", "libai_v2"), ("cosyvoice-v1", "longxiaochun")])
+
+    def test_podcast_handshake(self):
+        upstream = FakePodcastServer().start()
+        try:
+            client = PodcastTTSClient(appid="a", access_token="t", endpoint=upstream.url)
+            self.assertGreater(asyncio.run(client.warm_up(5)), 0)
+            self.assertEqual(upstream.sessions, 0)
+        finally:
+            upstream.stop()
+
+
+class WarmupServerTest(unittest.TestCase):
+    def setUp(self):
+        server._clients.pop("warmer", None)
+        self.addCleanup(server._clients.pop, "warmer", None)
+
+    @patch("server.WARMUP_VOICES", [("cosyvoice-v2", "libai_v2")])
+    @patch("server.ENABLE_WARMUP", True)
+    @patch("server._warm_podcast_handshake", return_value=35.0)
+    @patch("server.synthesize", return_value=(b"audio", "req", 80))
+    def test_warmup_targets_and_metrics(self, mock_synthesize, _handshake):
+        server.start_warmup()
+        stats = server.get_warmer().stats()
+        self.assertEqual(set(stats["targets"]), {"redis", "cosyvoice:cosyvoice-v2/libai_v2", "podcast:handshake"})
+        self.assertEqual(stats["targets"]["cosyvoice:cosyvoice-v2/libai_v2"]["last_ms"], 80)
+        self.assertEqual(mock_synthesize.call_args[0][:3], (server.WARMUP_TEXT, "libai_v2", "cosyvoice-v2"))
+
+        app = server.app.test_client()
+        response = app.post("/v1/voice/cosyvoice", data=json.dumps({"text": "hi", "voice": "libai_v2"}),
+                            content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+
+        with patch("server.ADMIN_TOKEN", "secret"):
+            metrics = server.create_app().test_client().get("/admin/warmup", headers={"X-Admin-Token": "secret"})
+        traffic = metrics.get_json()["traffic"]["cosyvoice:cosyvoice-v2/libai_v2"]
+        self.assertEqual((traffic["requests"], traffic["cold_requests"]), (1, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()